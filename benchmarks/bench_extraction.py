@@ -0,0 +1,80 @@
+"""Compare sequential, concurrent and batched extraction+validation against the mock server
+
+Usage:
+    python benchmarks/bench_extraction.py --users 200 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_openai_server import start_server
+from synthetic_corpus import CorpusGenerator
+from tmk.base_extractor import BaseFeatureExtractor
+from tmk.validation import FeatureValidator
+from tmk.llm_engine import LLMEngine
+from tmk.processor import _process_users, _run_async
+
+
+def make_user_chunks(n_users: int, seed: int = 0):
+    """One prompt chunk per user, from a comment of the synthetic corpus"""
+    generator = CorpusGenerator(seed=seed, relevant_rate=1.0)
+    return {f"user_{i}": [f"[r/ChronicPain] Comment: {generator.text()}"] for i in range(n_users)}
+
+
+def run(base_url: str, user_chunks, max_concurrency: int, batching=None) -> dict:
+    config = {'openai': {
+        'api_key': 'mock',
+        'base_url': base_url,
+        'max_concurrency': max_concurrency,
+        'requests_per_minute': None,
+        'tokens_per_minute': None,
+    }}
+    engine = LLMEngine(config['openai'])
+    extractor = BaseFeatureExtractor(config, engine=engine)
+    validator = FeatureValidator(config, engine=engine)
+
+    start = time.perf_counter()
+    _run_async(_process_users(extractor, validator, user_chunks, batching))
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'users_per_minute': len(user_chunks) / elapsed * 60,
+        'requests': engine.api_requests,
+        'prompt_tokens_per_user': engine.prompt_tokens_sent / len(user_chunks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--batch-tokens', type=int, default=3000)
+    parser.add_argument('--batch-users', type=int, default=20)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    user_chunks = make_user_chunks(args.users)
+    batching = {'enabled': True, 'token_budget': args.batch_tokens, 'max_users': args.batch_users}
+
+    results = {
+        'sequential (max_concurrency=1)': run(base_url, user_chunks, max_concurrency=1),
+        f'concurrent (max_concurrency={args.concurrency})': run(base_url, user_chunks, args.concurrency),
+        f'batched (max_concurrency={args.concurrency})': run(base_url, user_chunks, args.concurrency, batching),
+    }
+    server.shutdown()
+
+    print(f"users={args.users} latency={args.latency}s")
+    baseline = results['sequential (max_concurrency=1)']['seconds']
+    for name, r in results.items():
+        print(f"{name}: {r['seconds']:.2f}s, {r['users_per_minute']:.0f} users/min, "
+              f"{r['requests']} requests, {r['prompt_tokens_per_user']:.0f} prompt tokens/user, "
+              f"speedup {baseline / r['seconds']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Throughput of the non-LLM ingestion stages (parse + per-author aggregation) by worker count
+
+Writes a synthetic set of raw shards, then times iter_file_aggregates with
+1..N worker processes and checks every run yields identical aggregates.
+
+Usage:
+    python benchmarks/bench_ingest.py --files 16 --posts 500 --workers 1,2,4,8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_corpus import CorpusGenerator
+from tmk.processor import iter_file_aggregates
+from tmk.raw_format import write_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--posts', type=int, default=500, help='Posts per file')
+    parser.add_argument('--workers', default='1,2,4')
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(seed=0, authors=5000)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for f in range(args.files):
+            paths += write_shards(generator.posts(args.posts), tmp, f"sub{f}", shard_size=args.posts)
+        items = None
+        baseline = None
+        print(f"files={args.files} posts/file={args.posts} cpus={os.cpu_count()}")
+        for workers in (int(w) for w in args.workers.split(',')):
+            start = time.perf_counter()
+            result = [(path, contents) for path, contents, _ in iter_file_aggregates(paths, workers)]
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline, base_seconds = result, elapsed
+                items = sum(len(c) for _, contents in result for c in contents.values())
+            assert result == baseline, f"{workers} workers produced a different aggregate"
+            print(f"  workers={workers:2d}  {elapsed:7.2f}s  {items / elapsed:10.0f} items/s  "
+                  f"({base_seconds / elapsed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Incremental leaderboards vs full re-ranking after a small batch of upserts
+
+Usage:
+    python benchmarks/bench_leaderboard.py --users 200000 --updates 50 --k 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from synthetic_corpus import iter_user_records
+from bench_ranking import WEIGHTS
+from tmk.leaderboard import Leaderboards, ranking_weights
+from tmk.user_ranker import top_k_positions
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = {r['user_id']: r for r in iter_user_records(args.users)}
+    # Fresh profiles drawn from the same distribution, for re-upserted users
+    fresh = iter_user_records(args.rounds * args.updates, seed=1)
+    weights = ranking_weights(WEIGHTS)
+    leaderboards = Leaderboards(weights, args.k)
+
+    start = time.perf_counter()
+    leaderboards.rebuild(pd.DataFrame(list(records.values())))
+    print(f"users={args.users} k={args.k}: full rebuild {time.perf_counter() - start:.3f}s")
+
+    update_seconds = report_seconds = 0.0
+    for _ in range(args.rounds):
+        for _ in range(args.updates):
+            # Re-upsert a random user with a fresh profile
+            record = next(fresh)
+            record['user_id'] = record['username'] = f"user_{rng.randrange(args.users)}"
+            records[record['user_id']] = record
+            start = time.perf_counter()
+            leaderboards.update(record)
+            update_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        stale = leaderboards.is_stale(k=args.k)
+        tops = {user_type: leaderboards.top(user_type, args.k) for user_type in weights}
+        report_seconds += time.perf_counter() - start
+        assert not stale, "leaderboards went stale"
+
+    # Check against a full rescoring of every user with the same frozen bounds
+    ids = list(records)
+    for user_type in weights:
+        scores = np.array([leaderboards.score(records[i])[0][user_type] for i in ids])
+        expected = sorted(scores[top_k_positions(scores, args.k)], reverse=True)
+        assert np.allclose(expected, tops[user_type]['ranking_score'].to_numpy()), user_type
+
+    n = args.rounds * args.updates
+    print(f"  {n} upserts: {update_seconds / n * 1e6:.1f} us/update, "
+          f"report {report_seconds / args.rounds * 1e3:.2f} ms/round (drift updates: {leaderboards.drift_updates})")
+
+
+if __name__ == "__main__":
+    main()
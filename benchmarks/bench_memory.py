@@ -0,0 +1,91 @@
+"""Peak RSS of holding one raw file's content in memory during processing
+
+Writes one synthetic shard, then in a fresh interpreter per step measures
+the memory above the import baseline of:
+
+    aggregate  _aggregate_file: the per-author content store (plus comment index)
+    prompts    the same, then the prompt texts of every user at once (processing
+               only assembles one checkpoint slice's prompts at a time)
+
+reported per million items (posts + comments) next to the raw JSON size.
+
+Usage:
+    python benchmarks/bench_memory.py --posts 20000
+    PYTHONPATH=/path/to/other/checkout python benchmarks/bench_memory.py  # compare another tree
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_corpus import CorpusGenerator
+from tmk.raw_format import write_shards
+
+# Runs in a fresh interpreter; prints RSS figures as JSON
+PROBE = """
+import gc, json, sys
+from tmk.processor import _aggregate_file
+from tmk.chunker import build_user_chunks
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * {page_size}
+
+def peak_rss():
+    # VmHWM is per address space; ru_maxrss would carry over the parent's peak across fork + exec
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+
+gc.collect()
+baseline = rss()
+user_contents, index = _aggregate_file({path!r})
+items = sum(len(contents) for contents in user_contents.values())
+result = {{'items': items, 'users': len(user_contents), 'baseline': baseline, 'held': rss() - baseline}}
+if {prompts!r}:
+    prompts = {{username: build_user_chunks(contents, "", 6000) for username, contents in user_contents.items()}}
+    result['held'] = rss() - baseline
+result['peak'] = peak_rss() - baseline
+print(json.dumps(result))
+"""
+
+
+def measure(path: str, prompts: bool) -> dict:
+    env = dict(os.environ)
+    env.setdefault('PYTHONPATH', ROOT)
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE.format(path=path, prompts=prompts, page_size=os.sysconf('SC_PAGE_SIZE'))],
+        capture_output=True, text=True, env=env
+    )
+    if completed.returncode:
+        raise RuntimeError(completed.stderr)
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--authors', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(seed=args.seed, authors=args.authors)
+    posts = generator.posts(args.posts)
+    raw_bytes = sum(len(json.dumps(post)) for post in posts)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_shards(posts, tmp, 'memory', shard_size=len(posts))[0]
+        del posts
+        for step, prompts in (('aggregate', False), ('prompts', True)):
+            r = measure(path, prompts)
+            per_million = 1e6 / r['items'] / 2 ** 20
+            print(f"{step:10} items={r['items']:,} users={r['users']:,}  "
+                  f"held {r['held'] / 2 ** 20:7.1f} MiB  peak {r['peak'] / 2 ** 20:7.1f} MiB  "
+                  f"({r['peak'] * per_million:7.0f} MiB peak per 1M items; raw JSON {raw_bytes * per_million:5.0f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
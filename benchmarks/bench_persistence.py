@@ -0,0 +1,109 @@
+"""Load time and peak RSS of pickle vs Parquet vs Arrow user DBs
+
+Each load runs in a fresh subprocess so peak RSS is measured in isolation.
+
+Usage:
+    python benchmarks/bench_persistence.py --users 1000000
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RANKING_COLUMNS = ['user_id', 'clinical_trial_interest', 'money_making_interest',
+                   'treatment_sentiment', 'num_comments', 'illness_types']
+
+
+def _proc_status_kb(key: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])
+    raise KeyError(key)
+
+
+def reset_peak_rss() -> int:
+    """Reset the peak-RSS high-water mark (Linux) and return the current RSS in KB"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_kb('VmRSS')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss() -> int:
+    try:
+        return _proc_status_kb('VmHWM')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(path: str, columns: str, memory_map: bool) -> None:
+    from tmk.database import load_db
+    # Import the readers up front, so their import time and memory are not measured
+    for module in ('pandas', 'pyarrow.parquet', 'pyarrow.feather'):
+        importlib.import_module(module)
+
+    baseline = reset_peak_rss()
+    start = time.perf_counter()
+    df = load_db(path, columns=columns.split(',') if columns else None, memory_map=memory_map)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'rss_mb': (peak_rss() - baseline) / 1024, 'rows': len(df)}))
+
+
+def measure(path: str, columns=None, memory_map=False) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', path, '--columns', ','.join(columns or [])]
+    if memory_map:
+        cmd.append('--memory-map')
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--child')
+    parser.add_argument('--columns', default='')
+    parser.add_argument('--memory-map', action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.columns, args.memory_map)
+        return
+
+    import pandas as pd
+    from synthetic_corpus import iter_user_records
+    from tmk.database import save_db
+
+    df = pd.DataFrame(iter_user_records(args.users))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {fmt: os.path.join(tmp, f"users.{fmt}") for fmt in ('pkl', 'parquet', 'arrow')}
+        for path in paths.values():
+            save_db(df, path)
+        del df
+
+        runs = [
+            ('pickle, all columns', paths['pkl'], None, False),
+            ('parquet, all columns', paths['parquet'], None, False),
+            ('parquet, ranking columns', paths['parquet'], RANKING_COLUMNS, False),
+            ('arrow, ranking columns', paths['arrow'], RANKING_COLUMNS, False),
+            ('arrow, ranking columns, mmap', paths['arrow'], RANKING_COLUMNS, True),
+        ]
+        print(f"users={args.users}")
+        for fmt, path in paths.items():
+            print(f"  {fmt:8s} file size: {os.path.getsize(path) / 1e6:8.1f} MB")
+        for name, path, columns, memory_map in runs:
+            r = measure(path, columns, memory_map)
+            print(f"  {name:32s} {r['seconds']:7.3f}s  peak RSS +{r['rss_mb']:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Pre-filter recall, pass rate and throughput on a synthetic labeled sample
+
+Trains the hashed TF-IDF model on half the sample and audits every mode on
+the other half.
+
+Usage:
+    python benchmarks/bench_prefilter.py --users 4000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tmk.prefilter import HashedTfidfModel, RelevanceFilter, audit
+
+RELEVANT = [
+    "I was diagnosed with {illness} two years ago and {treatment} stopped helping.",
+    "Has anyone joined a {trial} for {illness}? I could use the {money} honestly.",
+    "My {illness} flares every winter, my doctor wants to try {treatment} next.",
+    "Looking for a paid {trial}, my {illness} keeps me from working full time.",
+    "Since the new {treatment} my {illness} symptoms are a bit better.",
+]
+IRRELEVANT = [
+    "thanks!", "This is so true lol", "Great post, following.", "Same here haha",
+    "What game is everyone playing this weekend?", "Congrats on the new job!",
+    "That view is stunning, where was this taken?", "Upvoted for visibility",
+    "Can someone recommend a good pizza place downtown?", "happy cake day",
+]
+FILL = {
+    'illness': ['fibromyalgia', 'lupus', 'chronic pain', 'migraine', 'arthritis', 'endometriosis'],
+    'treatment': ['gabapentin', 'physical therapy', 'my medication', 'infusions', 'LDN'],
+    'trial': ['clinical trial', 'research study', 'study'],
+    'money': ['compensation', 'money', 'stipend'],
+}
+
+
+def make_sample(n: int, rng: random.Random):
+    samples = []
+    for _ in range(n):
+        if rng.random() < 0.3:
+            text = rng.choice(RELEVANT).format(**{k: rng.choice(v) for k, v in FILL.items()})
+            samples.append((text + " " + rng.choice(IRRELEVANT), 1))
+        else:
+            samples.append((" ".join(rng.sample(IRRELEVANT, rng.randrange(1, 3))), 0))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=4000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    samples = make_sample(args.users, rng)
+    train, test = samples[:len(samples) // 2], samples[len(samples) // 2:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.npz')
+        texts, labels = zip(*train)
+        HashedTfidfModel().fit(list(texts), list(labels)).save(model_path)
+
+        print(f"users={len(test)} (audit half), relevant={sum(l for _, l in test)}")
+        for mode in ('keyword', 'model', 'both'):
+            relevance_filter = RelevanceFilter({'mode': mode, 'model_path': model_path})
+            start = time.perf_counter()
+            report = audit(relevance_filter, test)
+            elapsed = time.perf_counter() - start
+            print(f"  {mode:8s} recall {report['recall']:6.1%}  precision {report['precision']:6.1%}  "
+                  f"pass rate {report['pass_rate']:6.1%}  -> {(1 - report['pass_rate']) * 2 * len(test):6.0f} "
+                  f"LLM calls saved  {len(test) / elapsed:8.0f} users/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare sequential and concurrent scraping against the fake Reddit API
+
+Also compares a full re-scrape with an incremental one (scrape state) on a
+second run whose listing shifted by --new-posts posts and where every fourth
+post gained a comment.
+
+Usage:
+    python benchmarks/bench_scraper.py --subreddits 5 --posts 20 --latency 0.1 --workers 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_reddit import FakeReddit
+from tmk.processor import aggregate_user_contents
+from tmk.raw_format import write_shards
+from tmk.scrape_state import ScrapeState
+from tmk.scraper import RedditScraper
+
+
+def scrape_run(names, posts: int, workers: int, offset: int, generation: int, state, output_dir: str) -> dict:
+    reddit = FakeReddit(latency=0.0, offset=offset, generation=generation)
+    scraper = RedditScraper(reddit=reddit, state=state)
+    written = 0
+
+    def save(name, raw_data):
+        nonlocal written
+        if raw_data:
+            for path in write_shards(raw_data, output_dir, f"{name}_{offset}_{generation}"):
+                written += os.path.getsize(path)
+
+    results, _ = scraper.scrape_subreddits(names, posts, max_workers=workers, on_subreddit_done=save)
+    user_contents = aggregate_user_contents(post for data in results.values() for post in data)
+    return {
+        'requests': reddit.requests,
+        'bytes': written,
+        'items': sum(len(c) for c in user_contents.values()),
+        'users': len(user_contents),
+    }
+
+
+def bench_incremental(names, args) -> None:
+    print(f"second run: {args.new_posts} new posts per subreddit, every 4th post gained a comment")
+    with tempfile.TemporaryDirectory() as tmp:
+        full = scrape_run(names, args.posts, args.workers, args.new_posts, 1, None, tmp)
+        state = ScrapeState(os.path.join(tmp, 'state.sqlite'))
+        scrape_run(names, args.posts, args.workers, 0, 0, state, tmp)
+        incremental = scrape_run(names, args.posts, args.workers, args.new_posts, 1, state, tmp)
+        state.close()
+    for label, r in (('full re-scrape', full), ('incremental', incremental)):
+        print(f"  {label:20s} {r['requests']:5d} API requests  {r['bytes'] / 1e3:8.1f} KB written  "
+              f"{r['items']:6d} items for extraction ({r['users']} users)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subreddits', type=int, default=5)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rpm', type=int, default=None, help='Shared request budget (default: unlimited)')
+    parser.add_argument('--failing', type=int, default=1, help='Subreddits whose listing fails')
+    parser.add_argument('--new-posts', type=int, default=5, help='Listing shift between incremental runs')
+    args = parser.parse_args()
+
+    names = [f"sub{i}" for i in range(args.subreddits)]
+    failing = names[:args.failing]
+
+    reddit = FakeReddit(latency=args.latency, failing=failing)
+    scraper = RedditScraper(reddit=reddit, requests_per_minute=args.rpm)
+    start = time.perf_counter()
+    sequential = {}
+    for name in names:
+        try:
+            sequential[name] = scraper.scrape_subreddit(name, args.posts)
+        except Exception as e:
+            print(f"r/{name} failed: {e}")
+    sequential_seconds = time.perf_counter() - start
+
+    reddit = FakeReddit(latency=args.latency, failing=failing)
+    scraper = RedditScraper(reddit=reddit, requests_per_minute=args.rpm)
+    start = time.perf_counter()
+    concurrent, failures = scraper.scrape_subreddits(names, args.posts, max_workers=args.workers)
+    concurrent_seconds = time.perf_counter() - start
+
+    assert concurrent == sequential, "concurrent scrape differs from sequential"
+    print(f"subreddits={args.subreddits} posts={args.posts} latency={args.latency}s "
+          f"requests={reddit.requests} failed={sorted(failures)}")
+    print(f"  sequential           {sequential_seconds:7.2f}s")
+    print(f"  concurrent ({args.workers:2d} wk)   {concurrent_seconds:7.2f}s  "
+          f"({sequential_seconds / concurrent_seconds:.1f}x)")
+
+    bench_incremental(names[args.failing:], args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Cold-start time of the CLI stages, each in a fresh interpreter
+
+Also reports which heavy dependencies each command loaded, so an eager
+import of openai or praw on the rank/query path shows up immediately.
+
+Usage:
+    python benchmarks/bench_startup.py --users 10000 --repeat 5
+"""
+from typing import Dict, List, Any
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+import yaml
+from synthetic_corpus import make_user_records
+
+HEAVY_MODULES = ['pandas', 'numpy', 'openai', 'praw', 'pyarrow', 'scipy']
+
+# Runs a statement, then prints the heavy modules it loaded
+PROBE = """
+import runpy, sys
+try:
+    {body}
+except SystemExit:
+    pass
+finally:
+    print('LOADED ' + ','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)
+"""
+
+
+def make_workspace(tmp: str, records: List[Dict[str, Any]]) -> str:
+    """A data directory with the user records as DB and a config pointing at it; returns the config path"""
+    data_dir = os.path.join(tmp, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    pd.DataFrame(records).to_pickle(os.path.join(data_dir, 'users.pkl'))
+    with open(os.path.join(ROOT, 'config', 'default_config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['directories'] = {name: os.path.join(tmp, name) for name in ('data', 'raw_data', 'processed_data')}
+    config['metrics']['enabled'] = False
+    config_path = os.path.join(tmp, 'config.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def cli(*argv: str) -> str:
+    return f"sys.argv = {['tmk', *argv]!r}; runpy.run_module('tmk.cli', run_name='__main__')"
+
+
+def commands(config_path: str) -> Dict[str, str]:
+    query = '{"clinical_trial_interest": ["in", ["high", "medium"]], "num_comments": [">", 5]}'
+    return {
+        'import tmk': 'import tmk',
+        'tmk --help': cli('--help'),
+        'tmk rank': cli('rank', '--config', config_path),
+        'tmk query': cli('query', '--config', config_path, '--where', query, '--limit', '10'),
+    }
+
+
+def run_once(body: str, env: Dict[str, str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE.format(body=body, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=ROOT
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode:
+        raise RuntimeError(completed.stderr)
+    loaded = [line[len('LOADED '):] for line in completed.stderr.splitlines() if line.startswith('LOADED ')]
+    return {'seconds': elapsed, 'loaded': loaded[-1].split(',') if loaded and loaded[-1] else []}
+
+
+def measure_startup(tmp: str, records: List[Dict[str, Any]], repeat: int) -> List[Dict[str, Any]]:
+    config_path = make_workspace(tmp, records)
+    # No credentials: rank and query must not need them
+    env = {k: v for k, v in os.environ.items()
+           if k not in ('OPENAI_API_KEY', 'REDDIT_CLIENT_ID', 'REDDIT_CLIENT_SECRET')}
+    env['PYTHONPATH'] = ROOT
+    results = []
+    for name, body in commands(config_path).items():
+        run_once(body, env)  # Warm the page cache and build the leaderboards
+        runs = [run_once(body, env) for _ in range(repeat)]
+        results.append({
+            'case': name, 'seconds': statistics.median(r['seconds'] for r in runs), 'loaded': runs[-1]['loaded'],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000, help='Users in the synthetic DB')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for r in measure_startup(tmp, make_user_records(args.users), args.repeat):
+            print(f"{r['case']:12} {r['seconds'] * 1000:7.0f} ms  loaded: {', '.join(r['loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
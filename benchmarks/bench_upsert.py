@@ -0,0 +1,56 @@
+"""Upsert throughput of the DataFrame reference backend vs the SQLite backend
+
+Usage:
+    python benchmarks/bench_upsert.py --sizes 10000,100000,1000000 --dataframe-max 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_corpus import iter_user_records
+from tmk.database import init_db, upsert_user, upsert_users
+
+def bench_dataframe(n: int) -> float:
+    df = init_db(backend='dataframe')
+    start = time.perf_counter()
+    for record in iter_user_records(n):
+        df = upsert_user(df, record)
+    return time.perf_counter() - start
+
+
+def bench_sqlite(n: int, batch: int = 10000) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = init_db(backend='sqlite', path=os.path.join(tmp, 'users.sqlite'))
+        start = time.perf_counter()
+        records = iter_user_records(n)
+        for offset in range(0, n, batch):
+            upsert_users(store, islice(records, batch))
+        store.save()
+        elapsed = time.perf_counter() - start
+        store.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--dataframe-max', type=int, default=10000,
+                        help='Largest size to run on the quadratic DataFrame backend')
+    args = parser.parse_args()
+
+    for n in (int(x) for x in args.sizes.split(',')):
+        sqlite_s = bench_sqlite(n)
+        line = f"n={n:>9,}: sqlite {sqlite_s:7.2f}s ({n / sqlite_s:>9,.0f} upserts/s)"
+        if n <= args.dataframe_max:
+            df_s = bench_dataframe(n)
+            line += f" | dataframe {df_s:7.2f}s ({n / df_s:>9,.0f} upserts/s)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""API spend and disagreement under each validation policy, against the mock server
+
+Half the synthetic users write relevant text (non-null extractions), half
+small talk (all-null extractions); the mock validator rejects --invalid-rate
+of the fields it sees.
+
+Usage:
+    python benchmarks/bench_validation.py --users 200 --invalid-rate 0.1
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_openai_server import start_server
+from tmk.base_extractor import BaseFeatureExtractor
+from tmk.validation import FeatureValidator
+from tmk.llm_engine import LLMEngine
+from tmk.processor import _process_users, _run_async
+
+POLICIES = [
+    ('all fields, every user', {}),
+    ('skip all-null users', {'skip_null': True}),
+    ('skip null + non-null fields', {'skip_null': True, 'fields': 'non_null'}),
+    ('... + 25% audit sample', {'skip_null': True, 'fields': 'non_null', 'sample_rate': 0.25}),
+]
+
+
+def make_user_chunks(n_users: int):
+    return {
+        f"user_{i}": [f"[r/ChronicPain] My fibromyalgia is worse, would a paid trial help? ({i})"
+                      if i % 2 == 0 else f"[r/ChronicPain] thanks, same here ({i})"]
+        for i in range(n_users)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--invalid-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, invalid_rate=args.invalid_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    user_chunks = make_user_chunks(args.users)
+
+    print(f"users={args.users} invalid_rate={args.invalid_rate}")
+    for name, policy in POLICIES:
+        config = {
+            'openai': {'api_key': 'mock', 'base_url': base_url, 'max_concurrency': 32,
+                       'requests_per_minute': None, 'tokens_per_minute': None},
+            'validation': policy,
+        }
+        engine = LLMEngine(config['openai'])
+        extractor = BaseFeatureExtractor(config, engine=engine)
+        validator = FeatureValidator(config, engine=engine)
+        start = time.perf_counter()
+        _run_async(_process_users(extractor, validator, user_chunks))
+        elapsed = time.perf_counter() - start
+        print(f"  {name:30s} {engine.api_requests:4d} requests  {engine.prompt_tokens_sent:7d} prompt tokens  "
+              f"{elapsed:5.2f}s  {validator.policy.report()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
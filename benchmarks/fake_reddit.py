@@ -0,0 +1,111 @@
+"""In-process fake of the praw surface the scraper uses, with injected latency
+
+Every call that is an HTTP request in praw (a listing page, loading a
+submission's comment forest) sleeps for `latency` seconds, so scraper
+wall-clock behaviour can be measured without network access.
+
+Content is deterministic per post ID. `offset` shifts the hot listing (new
+posts push old ones down) and `generation` adds that many new comments to
+every fourth post, to simulate how a subreddit evolves between runs.
+"""
+import random
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+
+class FakeCommentForest(list):
+    def replace_more(self, limit=0):
+        return []
+
+
+class FakeComment:
+    def __init__(self, rng: random.Random, comment_id: str, parent_id: str, depth: int, max_depth: int):
+        self.id = comment_id
+        self.author = SimpleNamespace(name=f"user_{rng.randrange(500)}")
+        self.body = f"Comment {comment_id} about my treatment"
+        self.score = rng.randrange(-5, 100)
+        self.created_utc = 1700000000 + rng.randrange(10 ** 6)
+        self.edited = False
+        self.parent_id = parent_id
+        self.replies = FakeCommentForest(
+            FakeComment(rng, f"{comment_id}_{i}", f"t1_{comment_id}", depth + 1, max_depth)
+            for i in range(rng.randrange(3) if depth < max_depth else 0)
+        )
+
+
+class FakeSubmission:
+    def __init__(self, reddit: "FakeReddit", subreddit: str, index: int):
+        self._reddit = reddit
+        self._comments = None
+        self.id = f"{subreddit}_{index}"
+        self.author = SimpleNamespace(name=f"user_{index % 500}")
+        self.title = f"Post {index} in r/{subreddit}"
+        self.selftext = "Has anyone tried a clinical trial for this?"
+        self.score = index
+        self.created_utc = 1700000000 + index
+        self.edited = False
+
+        rng = random.Random(self.id)
+        extra = reddit.generation if index % 4 == 0 else 0
+        self._forest = FakeCommentForest(
+            FakeComment(rng, f"{self.id}_c{i}", f"t3_{self.id}", 0, reddit.comment_depth)
+            for i in range(reddit.comments_per_post + extra)
+        )
+        self.num_comments = sum(1 for _ in _walk(self._forest))
+
+    @property
+    def comments(self) -> FakeCommentForest:
+        if self._comments is None:
+            self._reddit._request()
+            self._comments = self._forest
+        return self._comments
+
+
+def _walk(forest):
+    stack = list(forest)
+    while stack:
+        comment = stack.pop()
+        yield comment
+        stack.extend(comment.replies)
+
+
+class FakeSubreddit:
+    def __init__(self, reddit: "FakeReddit", name: str):
+        self._reddit = reddit
+        self.name = name
+
+    def hot(self, limit: int = 10):
+        if self.name in self._reddit.failing:
+            self._reddit._request()
+            raise RuntimeError(f"received 403 HTTP response for r/{self.name}")
+        for i in range(limit):
+            if i % 100 == 0:
+                self._reddit._request()
+            yield FakeSubmission(self._reddit, self.name, i + self._reddit.offset)
+
+
+class FakeReddit:
+    """Drop-in for praw.Reddit: `reddit.subreddit(name).hot(limit=n)`, `reddit.submission(id=...)`"""
+
+    def __init__(self, latency: float = 0.05, comments_per_post: int = 5, comment_depth: int = 3,
+                 failing: Optional[List[str]] = None, offset: int = 0, generation: int = 0):
+        self.latency = latency
+        self.comments_per_post = comments_per_post
+        self.comment_depth = comment_depth
+        self.failing = set(failing or [])
+        self.offset = offset
+        self.generation = generation
+        self.requests = 0
+
+    def _request(self) -> None:
+        self.requests += 1
+        time.sleep(self.latency)
+
+    def subreddit(self, name: str) -> FakeSubreddit:
+        return FakeSubreddit(self, name)
+
+    def submission(self, id: str) -> FakeSubmission:
+        """Lazy like praw: no request until the comments are loaded"""
+        name, index = id.rsplit('_', 1)
+        return FakeSubmission(self, name, int(index))
@@ -0,0 +1,169 @@
+"""Local mock of the OpenAI chat-completions endpoint for benchmarks
+
+Usage:
+    python benchmarks/mock_openai_server.py --port 8765 --latency 0.5
+
+Then set `openai.base_url: "http://127.0.0.1:8765/v1"` in the config.
+
+Extraction fills a few fields from keywords in the text (so relevant users
+get non-null profiles); validation rejects each field with probability
+`invalid_rate`, deterministically per prompt and field. A fraction
+`error_rate` of requests fails with 429 (with Retry-After) or 500, drawn
+from a seeded RNG.
+"""
+from typing import Dict, Any
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXTRACTION_RESPONSE = {
+    "age_range": None,
+    "gender": None,
+    "location": None,
+    "income_level": None,
+    "education_level": None,
+    "illness_types": [],
+    "treatment_history": [],
+    "clinical_trial_interest": None,
+    "money_making_interest": None,
+    "clinical_trials_sentiment": None,
+    "treatment_sentiment": None
+}
+
+
+KEYWORD_FIELDS = [
+    ('fibromyalgia', 'illness_types', ['fibromyalgia']),
+    ('lupus', 'illness_types', ['lupus']),
+    ('gabapentin', 'treatment_history', ['gabapentin']),
+    ('trial', 'clinical_trial_interest', 'high'),
+    ('paid', 'money_making_interest', 'high'),
+]
+
+
+def mock_content(request: Dict[str, Any], invalid_rate: float = 0.0) -> str:
+    """Deterministic JSON content for an extraction or validation prompt"""
+    prompt = request['messages'][-1]['content']
+    if 'validation_results' in prompt:
+        result = {"validation_results": {
+            name: {
+                "is_valid": zlib.crc32((prompt + name).encode()) / 2 ** 32 >= invalid_rate,
+                "corrected_value": None,
+                "reason": "mock"
+            }
+            for name in EXTRACTION_RESPONSE
+        }}
+    else:
+        result = dict(EXTRACTION_RESPONSE)
+        text = prompt.split('Text:')[-1].split('Extract:')[0].lower()
+        for keyword, field, value in KEYWORD_FIELDS:
+            if keyword in text:
+                result[field] = value
+
+    # Batched prompts list their user IDs and expect one entry per user
+    batch = re.search(r'User IDs: (\[.*\])', prompt)
+    if batch:
+        result = {"users": {user_id: result for user_id in json.loads(batch.group(1))}}
+    return json.dumps(result)
+
+
+class MockCompletionHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    invalid_rate = 0.0
+    error_rate = 0.0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def _send_error(self) -> None:
+        with self.rng_lock:
+            status = self.rng.choice([429, 500])
+        body = json.dumps({"error": {"message": "mock failure", "type": "server_error", "code": status}}).encode()
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        if status == 429:
+            self.send_header('retry-after', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length', 0))
+        request = json.loads(self.rfile.read(length))
+        time.sleep(self.latency)
+
+        with self.rng_lock:
+            failing = self.rng.random() < self.error_rate
+        if failing:
+            self._send_error()
+            return
+
+        content = mock_content(request, self.invalid_rate)
+        prompt_tokens = sum(len(m['content']) // 4 for m in request['messages'])
+        body = json.dumps({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'mock'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4
+            }
+        }).encode()
+
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(
+    port: int = 0,
+    latency: float = 0.0,
+    invalid_rate: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int = 0
+) -> ThreadingHTTPServer:
+    """Start the mock server in a background thread; returns the server"""
+    handler = type('Handler', (MockCompletionHandler,), {
+        'latency': latency, 'invalid_rate': invalid_rate, 'error_rate': error_rate,
+        'rng': random.Random(seed), 'rng_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI chat-completions server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds per response')
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help='Fraction of fields validation rejects')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 429/500')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.invalid_rate, args.error_rate, args.seed)
+    print(f"Mock server listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
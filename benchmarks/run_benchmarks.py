@@ -0,0 +1,325 @@
+"""Repeatable benchmark suite over synthetic data, with JSON results for regression comparison
+
+No Reddit or OpenAI credentials are needed: raw files come from the seeded
+synthetic corpus generator and LLM calls go to the local mock server.
+
+Suites:
+    ingest        parse + per-author aggregation of raw shards (no LLM)
+    conversation  comment index build + per-author conversation metrics
+    graph         reply-graph build from comment indexes, PageRank + communities
+    extract       process_raw_data end to end against the mock server
+    upsert        upsert_users into the SQLite store (and the DataFrame reference at small sizes)
+    query         query_users on the DataFrame and SQLite backends
+    persist       save_db / load_db for pickle, Parquet and Arrow
+    rank          UserRanker.top_users over all user types
+    startup       cold start of `tmk rank` / `tmk query` (and `import tmk`) in fresh interpreters
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000,1000000
+    python benchmarks/run_benchmarks.py --suites upsert,rank --compare benchmarks/results/baseline.json
+"""
+from typing import Dict, List, Any, Callable
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+import yaml
+from mock_openai_server import start_server
+from synthetic_corpus import CorpusGenerator, write_corpus, make_user_records
+from bench_startup import measure_startup
+from tmk.database import init_db, upsert_user, upsert_users, query_users, save_db, load_db
+from tmk.processor import aggregate_user_contents, iter_file_aggregates, process_raw_data
+from tmk.conversation import CommentIndex
+from tmk.reply_graph import ReplyGraph
+from tmk.user_ranker import UserRanker
+from tmk.metrics import METRICS
+
+SUITES = ['ingest', 'conversation', 'graph', 'extract', 'upsert', 'query', 'persist', 'rank', 'startup']
+# Suites over raw posts rather than user records
+CORPUS_SUITES = ['ingest', 'conversation', 'graph', 'extract']
+
+QUERIES = {
+    'eq+in': {'gender': 'F', 'clinical_trial_interest': ('in', ['high', 'medium'])},
+    'range': {'num_comments': ('>', 5), 'treatment_sentiment': ('between', (-1, -0.3))},
+    'contains_any': {'illness_types': ('contains_any', ['fibromyalgia', 'lupus'])},
+}
+
+
+def load_config(path: str) -> types.SimpleNamespace:
+    """Config sections without the credential checks of tmk.set_config.Config"""
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    return types.SimpleNamespace(config=config, ranking_config=config['ranking'])
+
+
+def timed(fn: Callable, repeat: int = 1) -> float:
+    """Median wall time of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def result(suite: str, case: str, n: int, seconds: float, unit: str, count: int = None, **extra) -> Dict[str, Any]:
+    count = n if count is None else count
+    return {
+        'suite': suite, 'case': case, 'n': n, 'seconds': seconds,
+        'rate': count / seconds if seconds > 0 else None, 'unit': unit, **extra,
+    }
+
+
+def corpus_posts(users: int) -> int:
+    # About one distinct author per post at the default mix of pool size and overlap
+    return max(users, 10)
+
+
+def bench_ingest(n: int, args, tmp: str) -> List[Dict[str, Any]]:
+    raw_dir = os.path.join(tmp, f'ingest_{n}')
+    files = max(1, corpus_posts(n) // 5000)
+    paths = write_corpus(raw_dir, files, corpus_posts(n) // files, seed=args.seed, authors=n)
+    aggregates = []
+    seconds = timed(lambda: aggregates.append(sum(len(u) for _, u, _ in iter_file_aggregates(paths, args.workers))))
+    return [result('ingest', f'aggregate (workers={args.workers})', n, seconds, 'users/s',
+                   count=aggregates[-1], files=len(paths))]
+
+
+def bench_conversation(n: int, args, tmp: str) -> List[Dict[str, Any]]:
+    posts = CorpusGenerator(seed=args.seed, authors=n).posts(corpus_posts(n))
+    indexes = []
+
+    def build():
+        indexes.append(CommentIndex())
+        aggregate_user_contents(posts, indexes[-1])
+        indexes[-1].freeze()
+    build_seconds = timed(build)
+    index = indexes[-1]
+    metrics_seconds = timed(lambda: index.metrics(), 3)
+    return [
+        result('conversation', 'aggregate + index build', n, build_seconds, 'items/s', count=len(index)),
+        result('conversation', 'metrics (vectorized)', n, metrics_seconds, 'items/s', count=len(index)),
+    ]
+
+
+def bench_graph(n: int, args, tmp: str) -> List[Dict[str, Any]]:
+    generator = CorpusGenerator(seed=args.seed, authors=n)
+    indexes = []
+    for _ in range(4):
+        # Several files, as consecutive runs would add them
+        index = CommentIndex()
+        aggregate_user_contents(generator.posts(corpus_posts(n) // 4), index)
+        indexes.append(index.freeze())
+    graphs = []
+
+    def build():
+        graphs.append(ReplyGraph())
+        for index in indexes:
+            graphs[-1].add_replies(index)
+    build_seconds = timed(build)
+    graph = graphs[-1]
+    replies = int(graph.matrix.sum())
+    score_seconds = timed(graph.score)
+    return [
+        result('graph', 'add_replies', n, build_seconds, 'replies/s', count=replies, edges=graph.n_edges),
+        result('graph', 'score (pagerank + communities)', n, score_seconds, 'edges/s', count=graph.n_edges,
+               users=len(graph), communities=len(set(graph.labels.tolist()))),
+    ]
+
+
+def bench_extract(n: int, args, tmp: str) -> List[Dict[str, Any]]:
+    if n > args.llm_max:
+        return []
+    work = os.path.join(tmp, f'extract_{n}')
+    write_corpus(os.path.join(work, 'raw'), 1, max(1, n // 4), seed=args.seed, authors=n)
+    config = load_config(args.config)
+    server = start_server(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    config.config['openai'].update({
+        'api_key': 'mock', 'base_url': f"http://127.0.0.1:{server.server_address[1]}/v1",
+        'cache': {'enabled': False}, 'backoff_base': 0.01, 'requests_per_minute': None, 'tokens_per_minute': None,
+    })
+    METRICS.reset()
+    try:
+        seconds = timed(lambda: process_raw_data(
+            os.path.join(work, 'raw'), os.path.join(work, 'processed'), os.path.join(work, 'users.pkl'), config
+        ))
+    finally:
+        server.shutdown()
+    users = METRICS.total('users_total', outcome='upserted')
+    return [result(
+        'extract', f'process_raw_data (latency={args.latency}s, errors={args.error_rate:.0%})', n, seconds,
+        'users/s', count=users,
+        llm_requests=METRICS.total('llm_requests_total'), llm_retries=METRICS.total('llm_retries_total'),
+        prompt_tokens=METRICS.total('llm_prompt_tokens_total'),
+    )]
+
+
+def bench_upsert(n: int, args, tmp: str, records) -> List[Dict[str, Any]]:
+    path = os.path.join(tmp, f'upsert_{n}.sqlite')
+    store = init_db(backend='sqlite', path=path)
+
+    def run_sqlite():
+        for offset in range(0, n, 10000):
+            upsert_users(store, records[offset:offset + 10000])
+        store.save()
+
+    results = [result('upsert', 'sqlite (batches of 10k)', n, timed(run_sqlite), 'upserts/s')]
+    store.close()
+    if n <= args.dataframe_max:
+        def run_dataframe():
+            df = init_db(backend='dataframe')
+            for record in records:
+                df = upsert_user(df, record)
+        results.append(result('upsert', 'dataframe', n, timed(run_dataframe), 'upserts/s'))
+    return results
+
+
+def bench_query(n: int, args, tmp: str, records) -> List[Dict[str, Any]]:
+    df = pd.DataFrame(records)
+    store = init_db(backend='sqlite', path=os.path.join(tmp, f'query_{n}.sqlite'))
+    for offset in range(0, n, 10000):
+        upsert_users(store, records[offset:offset + 10000])
+    results = []
+    for name, criteria in QUERIES.items():
+        results.append(result('query', f'dataframe {name}', n, timed(lambda: query_users(df, criteria), 5), 'rows/s'))
+        results.append(result('query', f'sqlite {name}', n, timed(lambda: query_users(store, criteria), 5), 'rows/s'))
+    store.close()
+    return results
+
+
+def bench_persist(n: int, args, tmp: str, records) -> List[Dict[str, Any]]:
+    df = pd.DataFrame(records)
+    results = []
+    for extension in ('pkl', 'parquet', 'arrow'):
+        path = os.path.join(tmp, f'persist_{n}.{extension}')
+        try:
+            save_seconds = timed(lambda: save_db(df, path))
+        except ImportError:
+            continue  # Columnar formats need pyarrow
+        results.append(result('persist', f'save {extension}', n, save_seconds, 'rows/s',
+                              mb=os.path.getsize(path) / 2 ** 20))
+        results.append(result('persist', f'load {extension}', n, timed(lambda: load_db(path), 3), 'rows/s'))
+        os.remove(path)
+    return results
+
+
+def bench_rank(n: int, args, tmp: str, records) -> List[Dict[str, Any]]:
+    df = pd.DataFrame(records)
+    config = load_config(args.config)
+    k = config.ranking_config['top_n']
+
+    def run():
+        # A fresh ranker each time, so the cached feature matrix is rebuilt
+        UserRanker(config).top_users(df, k)
+
+    return [result('rank', f'top_users (k={k})', n, timed(run, 3), 'users/s')]
+
+
+def bench_startup(n: int, args, tmp: str, records) -> List[Dict[str, Any]]:
+    work = os.path.join(tmp, f'startup_{n}')
+    return [
+        result('startup', r['case'], n, r['seconds'], 'runs/s', count=1, loaded=r['loaded'])
+        for r in measure_startup(work, records, repeat=3)
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> int:
+    """Print time ratios against a baseline run; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(r['suite'], r['case'], r['n']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for r in results:
+        before = baseline.get((r['suite'], r['case'], r['n']))
+        if before is None:
+            continue
+        ratio = r['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag, regressions = '  REGRESSION', regressions + 1
+        print(f"  {r['suite']:12} {r['case']:45} n={r['n']:>9,}: {before['seconds']:8.3f}s -> "
+              f"{r['seconds']:8.3f}s ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', default=','.join(SUITES))
+    parser.add_argument('--sizes', default='1000,10000,100000', help='User counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', default=os.path.join(ROOT, 'config', 'default_config.yaml'))
+    parser.add_argument('--workers', type=int, default=1, help='Processes for the ingest suite')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock server seconds per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock requests failing (429/500)')
+    parser.add_argument('--llm-max', type=int, default=1000, help='Largest size for the extract suite')
+    parser.add_argument('--dataframe-max', type=int, default=10000,
+                        help='Largest size for the quadratic DataFrame upsert')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results'),
+                        help='Directory for the results JSON')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    suites = args.suites.split(',')
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+    sizes = [int(x) for x in args.sizes.split(',')]
+
+    results = []
+    tmp = tempfile.mkdtemp(prefix='tmk_bench_')
+    try:
+        for n in sizes:
+            records = make_user_records(n, args.seed) if set(suites) - set(CORPUS_SUITES) else None
+            for suite in suites:
+                if suite in CORPUS_SUITES:
+                    suite_results = globals()[f'bench_{suite}'](n, args, tmp)
+                else:
+                    suite_results = globals()[f'bench_{suite}'](n, args, tmp, records)
+                for r in suite_results:
+                    print(f"{r['suite']:12} {r['case']:45} n={n:>9,}: {r['seconds']:8.3f}s "
+                          f"({r['rate'] or 0:,.0f} {r['unit']})")
+                results.extend(suite_results)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'meta': {
+                'timestamp': datetime.now().isoformat(), 'commit': git_commit(),
+                'python': platform.python_version(), 'platform': platform.platform(),
+                'cpus': os.cpu_count(), 'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults written to {path}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
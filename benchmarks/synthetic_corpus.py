@@ -0,0 +1,209 @@
+"""Seeded synthetic Reddit corpus in the scraper's raw-file schema, and synthetic user records
+
+Posts and comment trees carry the same fields RedditScraper writes, so the
+files go through process_raw_data unchanged. The same seed always yields
+the same corpus.
+
+Usage:
+    python benchmarks/synthetic_corpus.py raw_data --files 4 --posts 1000 --authors 5000
+    python benchmarks/synthetic_corpus.py raw_data --format json --fanout 4 --max-depth 5
+"""
+from typing import Dict, List, Any, Iterator
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tmk.raw_format import write_shards
+from tmk.user import create_user_record
+
+SUBREDDITS = [
+    ('ChronicPain', 'health'), ('Fibromyalgia', 'health'), ('lupus', 'health'),
+    ('clinical_trials', 'clinical_trials'), ('passive_income', 'clinical_trials'),
+]
+
+FILLER = ("i the a and it was my to of for in that this have but just so not with they "
+          "day work today week feel think really know people time going get back still").split()
+RELEVANT = [
+    "my fibromyalgia flare", "started gabapentin last month", "lupus diagnosis", "paid clinical trial",
+    "the side effects are awful", "my rheumatologist said", "looking for a research study",
+    "chronic pain every day", "insurance will not cover the infusion", "extra income from studies",
+]
+LEVELS = ['low', 'medium', 'high', None]
+ILLNESSES = ['fibromyalgia', 'lupus', 'arthritis', 'migraine', 'crohn']
+
+
+class CorpusGenerator:
+    def __init__(
+        self,
+        seed: int = 0,
+        authors: int = 1000,
+        comments_per_post: int = 8,
+        fanout: int = 2,
+        max_depth: int = 3,
+        thread_overlap: float = 0.3,
+        relevant_rate: float = 0.3
+    ):
+        """
+        authors: size of the author pool (smaller -> more cross-thread overlap)
+        comments_per_post: mean top-level comments per post
+        fanout: maximum replies per comment
+        max_depth: deepest reply level (the scraper's default is 3)
+        thread_overlap: chance a reply comes from someone already in the thread
+        relevant_rate: chance an item mentions illness/treatment/trial vocabulary
+        """
+        self.rng = random.Random(seed)
+        self.authors = authors
+        self.comments_per_post = comments_per_post
+        self.fanout = fanout
+        self.max_depth = max_depth
+        self.thread_overlap = thread_overlap
+        self.relevant_rate = relevant_rate
+        self._next_id = 0
+
+    def _id(self, prefix: str) -> str:
+        self._next_id += 1
+        return f"{prefix}{self._next_id:x}"
+
+    def _author(self, thread: List[str]) -> str:
+        if thread and self.rng.random() < self.thread_overlap:
+            return self.rng.choice(thread)
+        # Skewed towards low indices, so a core of regulars spans many threads
+        author = f"user_{int(self.authors * self.rng.random() ** 2)}"
+        thread.append(author)
+        return author
+
+    def text(self) -> str:
+        """One post or comment body"""
+        words = self.rng.choices(FILLER, k=self.rng.randint(8, 80))
+        if self.rng.random() < self.relevant_rate:
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(RELEVANT))
+        return ' '.join(words)
+
+    def _comment(self, parent_id: str, depth: int, created: float, thread: List[str]) -> Dict[str, Any]:
+        comment_id = self._id('c')
+        n_replies = self.rng.randint(0, self.fanout) if depth < self.max_depth else 0
+        return {
+            'type': 'comment',
+            'id': comment_id,
+            'author': self._author(thread),
+            'text': self.text(),
+            'score': int(self.rng.expovariate(0.2)),
+            'depth': depth,
+            'created_utc': created + depth * 60,
+            'edited': 0.0,
+            'parent_id': parent_id,
+            'replies': [self._comment(f"t1_{comment_id}", depth + 1, created, thread) for _ in range(n_replies)],
+        }
+
+    def post(self) -> Dict[str, Any]:
+        post_id = self._id('p')
+        subreddit, subreddit_type = self.rng.choice(SUBREDDITS)
+        created = 1.7e9 + self._next_id
+        thread = []
+        author = self._author(thread)
+        comments = [
+            self._comment(f"t3_{post_id}", 0, created, thread)
+            for _ in range(self.rng.randint(0, 2 * self.comments_per_post))
+        ]
+        return {
+            'type': 'post',
+            'id': post_id,
+            'author': author,
+            'title': ' '.join(self.rng.choices(FILLER, k=6)),
+            'text': self.text(),
+            'score': int(self.rng.expovariate(0.05)),
+            'created_utc': created,
+            'edited': 0.0,
+            'num_comments': _count(comments),
+            'subreddit': subreddit,
+            'subreddit_type': subreddit_type,
+            'comments': comments,
+        }
+
+    def posts(self, n: int) -> List[Dict[str, Any]]:
+        return [self.post() for _ in range(n)]
+
+
+def _count(comments: List[Dict[str, Any]]) -> int:
+    return sum(1 + _count(c['replies']) for c in comments)
+
+
+def write_corpus(out_dir: str, files: int, posts_per_file: int, fmt: str = 'shard', **options) -> List[str]:
+    """Write `files` raw files of `posts_per_file` posts each; returns their paths
+
+    fmt: 'shard' (gzip JSONL shards) or 'json' (legacy JSON arrays)
+    """
+    generator = CorpusGenerator(**options)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(files):
+        posts = generator.posts(posts_per_file)
+        name = f"synthetic_{i:04d}"
+        if fmt == 'json':
+            path = os.path.join(out_dir, f"{name}.json")
+            with open(path, 'w') as f:
+                json.dump(posts, f)
+            paths.append(path)
+        else:
+            paths.extend(write_shards(posts, out_dir, name))
+    return paths
+
+
+def iter_user_records(n: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """`n` extracted user records with seeded, plausible feature values, generated lazily"""
+    rng = random.Random(seed)
+    return (
+        create_user_record(
+            user_id=f"user_{i}",
+            username=f"user_{i}",
+            features={
+                'gender': rng.choice(['F', 'M', None]),
+                'income_level': rng.choice(LEVELS),
+                'clinical_trial_interest': rng.choice(LEVELS),
+                'money_making_interest': rng.choice(LEVELS),
+                'illness_types': rng.sample(ILLNESSES, rng.randint(0, 2)),
+                'treatment_sentiment': round(rng.uniform(-1, 1), 2),
+                'num_comments': int(rng.expovariate(0.1)),
+                'avg_score': round(rng.expovariate(0.2), 2),
+                'max_comment_depth': rng.randint(0, 3),
+                'conversation_count': rng.randint(0, 20),
+                'parent_interactions': rng.randint(0, 30),
+            }
+        )
+        for i in range(n)
+    )
+
+
+def make_user_records(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    return list(iter_user_records(n, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('out_dir')
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--posts', type=int, default=1000, help='Posts per file')
+    parser.add_argument('--format', choices=['shard', 'json'], default='shard')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--comments-per-post', type=int, default=8)
+    parser.add_argument('--fanout', type=int, default=2)
+    parser.add_argument('--max-depth', type=int, default=3)
+    parser.add_argument('--thread-overlap', type=float, default=0.3)
+    parser.add_argument('--relevant-rate', type=float, default=0.3)
+    args = parser.parse_args()
+
+    paths = write_corpus(
+        args.out_dir, args.files, args.posts, args.format,
+        seed=args.seed, authors=args.authors, comments_per_post=args.comments_per_post, fanout=args.fanout,
+        max_depth=args.max_depth, thread_overlap=args.thread_overlap, relevant_rate=args.relevant_rate
+    )
+    print(f"Wrote {args.files * args.posts} posts to {len(paths)} files in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
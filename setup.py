@@ -6,9 +6,17 @@ setup(
     packages=find_packages(),
     install_requires=[
         'pandas',
+        'numpy',
+        'scipy',
         'praw',
         'openai',
         'textblob',
         'pyyaml',
     ],
+    extras_require={
+        'columnar': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': ['tmk=tmk.cli:main'],
+    },
 ) 
\ No newline at end of file
@@ -1,17 +1,32 @@
-from .user import create_user_record
-from .database import init_db, upsert_user, save_db, query_users, load_db
-from .base_extractor import BaseFeatureExtractor
-from .validation import FeatureValidator
-from .user_ranker import UserRanker
+import importlib
 
-__all__ = [
-    'create_user_record',
-    'init_db',
-    'upsert_user',
-    'save_db',
-    'query_users',
-    'load_db',
-    'BaseFeatureExtractor',
-    'FeatureValidator',
-    'UserRanker'
-] 
\ No newline at end of file
+# Public names resolve lazily (PEP 562), so `import tmk` stays cheap and a
+# stage only pays for the dependencies (pandas, openai, praw) it uses
+_EXPORTS = {
+    'create_user_record': 'tmk.user',
+    'init_db': 'tmk.database',
+    'upsert_user': 'tmk.database',
+    'upsert_users': 'tmk.database',
+    'get_user': 'tmk.database',
+    'save_db': 'tmk.database',
+    'query_users': 'tmk.database',
+    'search_users': 'tmk.database',
+    'load_db': 'tmk.database',
+    'BaseFeatureExtractor': 'tmk.base_extractor',
+    'FeatureValidator': 'tmk.validation',
+    'UserRanker': 'tmk.user_ranker',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'tmk' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
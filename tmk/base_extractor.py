@@ -1,41 +1,30 @@
-from typing import Dict, Any
-from openai import OpenAI
+from typing import Dict, Any, List, Optional
 import json
+from tmk.llm_engine import LLMEngine
 
-class BaseFeatureExtractor:
-    def __init__(self, config: Dict[str, Any]):
-        """Initialize with OpenAI configuration"""
-        self.openai_config = config['openai']
-        self.gpt_client = OpenAI(api_key=self.openai_config['api_key'])
-        self.model = self.openai_config.get('model', 'gpt-4o-mini')
-        self.temperature = self.openai_config.get('temperature', 0.1)
-        
-    def extract_features(self, text: str) -> Dict[str, Any]:
-        """Extract all features from text in a single GPT call"""
-        output_format = {
-            # Demographics
-            "age_range": "string or null",
-            "gender": "string or null",
-            "location": "string or null",
-            "income_level": "string or null",  # high/medium/low
-            "education_level": "string or null",  # high/medium/low
-            # Health
-            "illness_types": ["string"],  # list of illnesses
-            "treatment_history": ["string"],  # list of treatments
-            # Interest
-            "clinical_trial_interest": "string or null",  # high/medium/low
-            "money_making_interest": "string or null",  # high/medium/low
-            # Sentiment
-            "clinical_trials_sentiment": "float or null",  # -1 to 1
-            "treatment_sentiment": "float or null"  # -1 to 1
-        }
+SYSTEM_PROMPT = ("You are a precise feature extractor. "
+                 "Extract only the information that is explicitly mentioned or can be "
+                 "confidently inferred from the text. If uncertain, return null.")
 
-        prompt = f"""
-        Analyze the following text and extract user information. Only extract information that is explicitly mentioned or can be confidently inferred.
-        If uncertain about any field, return null.
-
-        Text: {text}
+OUTPUT_FORMAT = {
+    # Demographics
+    "age_range": "string or null",
+    "gender": "string or null",
+    "location": "string or null",
+    "income_level": "string or null",  # high/medium/low
+    "education_level": "string or null",  # high/medium/low
+    # Health
+    "illness_types": ["string"],  # list of illnesses
+    "treatment_history": ["string"],  # list of treatments
+    # Interest
+    "clinical_trial_interest": "string or null",  # high/medium/low
+    "money_making_interest": "string or null",  # high/medium/low
+    # Sentiment
+    "clinical_trials_sentiment": "float or null",  # -1 to 1
+    "treatment_sentiment": "float or null"  # -1 to 1
+}
 
+EXTRACTION_GUIDE = """
         Extract:
         1. Demographics:
            - Age range (e.g., "18-24", "25-34", etc.)
@@ -57,27 +46,94 @@ class BaseFeatureExtractor:
            - Score sentiment towards current/past treatments (-1 to 1)
 
         Reason step by step, but only include the final values in your JSON response.
+"""
+
+class BaseFeatureExtractor:
+    def __init__(self, config: Dict[str, Any], engine: LLMEngine = None):
+        """Initialize with OpenAI configuration"""
+        self.openai_config = config['openai']
+        self.engine = engine or LLMEngine(self.openai_config)
+        self.model = self.engine.model
+        self.temperature = self.engine.temperature
+
+    def _build_messages(self, text: str) -> List[Dict[str, str]]:
+        """Build the chat messages for a single extraction request"""
+        prompt = f"""
+        Analyze the following text and extract user information. Only extract information that is explicitly mentioned or can be confidently inferred.
+        If uncertain about any field, return null.
+
+        Text: {text}
+{EXTRACTION_GUIDE}
+        """
+
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _build_batch_messages(self, texts: Dict[str, str]) -> List[Dict[str, str]]:
+        """Build the chat messages for a multi-user extraction request keyed by user ID"""
+        user_sections = "\n".join(
+            f"        ### User: {user_id}\n        {text}\n" for user_id, text in texts.items()
+        )
+        prompt = f"""
+        Analyze the texts of several users below and extract information for each user separately.
+        Only use a user's own text for that user. Only extract information that is explicitly mentioned or can be confidently inferred.
+        If uncertain about any field, return null.
+
+        User IDs: {json.dumps(list(texts))}
+
+{user_sections}
+{EXTRACTION_GUIDE}
+        Return a JSON object of the form {{"users": {{"<user_id>": {{...}}}}}} with one entry for every user ID above,
+        each using exactly these fields:
+        {json.dumps(OUTPUT_FORMAT)}
         """
 
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def extract_features(self, text: str) -> Dict[str, Any]:
+        """Extract all features from text in a single GPT call"""
+        try:
+            content = self.engine.complete(self._build_messages(text), operation='extract')
+            return self._clean_extraction(json.loads(content))
+        except Exception as e:
+            print(f"Error in GPT API call: {e}")
+            return {}
+
+    async def aextract_features(self, text: str) -> Optional[Dict[str, Any]]:
+        """Async variant of extract_features, scheduled through the shared engine
+
+        Returns None (not empty features) when the call fails after retries, so
+        the caller can leave the user's content to be retried.
+        """
         try:
-            response = self.gpt_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a precise feature extractor. "
-                     "Extract only the information that is explicitly mentioned or can be "
-                     "confidently inferred from the text. If uncertain, return null."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return self._clean_extraction(result)
-            
+            content = await self.engine.acomplete(self._build_messages(text), operation='extract')
+            return self._clean_extraction(json.loads(content))
         except Exception as e:
             print(f"Error in GPT API call: {e}")
+            return None
+
+    async def aextract_features_batch(self, texts: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Extract features for several users in one request
+
+        Returns features keyed by user ID; users missing from the reply are omitted
+        so the caller can fall back to single-user calls.
+        """
+        try:
+            content = await self.engine.acomplete(self._build_batch_messages(texts), operation='extract_batch')
+            users = json.loads(content).get('users', {})
+        except Exception as e:
+            print(f"Error in batched GPT API call: {e}")
             return {}
+        return {
+            user_id: self._clean_extraction(users[user_id])
+            for user_id in texts
+            if isinstance(users.get(user_id), dict)
+        }
 
     def _clean_extraction(self, extraction: Dict[str, Any]) -> Dict[str, Any]:
         """Clean and standardize extracted features"""
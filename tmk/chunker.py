@@ -0,0 +1,64 @@
+from typing import List, Dict, Any
+from tmk.llm_engine import estimate_tokens
+
+SEPARATOR = "\n---\n"
+
+
+def format_content(content: Dict[str, Any]) -> str:
+    """Render one post/comment the way it appears in the prompt"""
+    return f"[r/{content['subreddit']}] {content['content']}"
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a single text larger than the budget on whitespace"""
+    max_chars = max_tokens * 4
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def chunk_contents(contents: List[Dict[str, Any]], max_tokens: int) -> List[str]:
+    """Pack a user's posts/comments into texts of at most ~max_tokens, splitting on item boundaries
+
+    Items are never split unless a single item exceeds the budget on its own.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for content in contents:
+        text = format_content(content)
+        tokens = estimate_tokens(text)
+        pieces = _split_oversized(text, max_tokens) if tokens > max_tokens else [text]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(SEPARATOR.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(SEPARATOR.join(current))
+    return chunks
+
+
+def build_user_chunks(
+    contents: List[Dict[str, Any]],
+    prior_summary: str = "",
+    max_tokens: int = None
+) -> List[str]:
+    """Prompt texts for one user: a single text normally, several for prolific users"""
+    if max_tokens:
+        # Leave room for the prior profile summary in every chunk
+        budget = max(1, max_tokens - (estimate_tokens(prior_summary) if prior_summary else 0))
+        texts = chunk_contents(contents, budget)
+    else:
+        texts = [SEPARATOR.join(format_content(c) for c in contents)]
+
+    if prior_summary:
+        texts = [f"Previously known profile: {prior_summary}\n\nNew content:\n{text}" for text in texts]
+    return texts
@@ -0,0 +1,134 @@
+"""Stage-specific command line: tmk scrape | process | rank | query
+
+Each subcommand validates only the credentials its stage needs and imports
+only its stage's dependencies, so `tmk rank` and `tmk query` start without
+loading praw or openai and can run from cron without Reddit or OpenAI keys.
+
+Usage:
+    tmk scrape
+    tmk process --workers 4
+    tmk rank --top-n 50
+    tmk query --where '{"illness_types": ["contains_any", ["fibromyalgia"]], "num_comments": [">", 5]}'
+    tmk query --where '{"clinical_trial_interest": ["in", ["high", "medium"]]}' --format csv --limit 100
+
+`python -m tmk.main` still runs all three pipeline stages in sequence.
+"""
+from typing import Dict, List, Any
+import argparse
+import json
+import sys
+from tmk.set_config import Config
+from tmk.metrics import METRICS
+
+QUERY_OPERATORS = {'>', '<', '>=', '<=', '==', '!=', 'in', 'between', 'contains_any', 'contains_all'}
+
+
+def parse_criteria(text: str) -> Dict[str, Any]:
+    """query_users criteria from JSON, where [operator, value] pairs become tuples"""
+    criteria = {}
+    for column, value in json.loads(text).items():
+        if isinstance(value, list) and len(value) == 2 and value[0] in QUERY_OPERATORS:
+            operator, operand = value
+            value = (operator, tuple(operand) if operator == 'between' else operand)
+        criteria[column] = value
+    return criteria
+
+
+def cmd_scrape(config: Config, args) -> None:
+    from tmk.utils import setup_directories, scrape_subreddits
+    setup_directories(config)
+    scrape_subreddits(config)
+
+
+def cmd_process(config: Config, args) -> None:
+    from tmk.utils import setup_directories
+    from tmk.processor import process_raw_data
+    setup_directories(config)
+    with METRICS.stage('process'):
+        process_raw_data(
+            raw_data_dir=config.directories['raw_data'],
+            processed_dir=config.directories['processed_data'],
+            db_path=config.db_path,
+            config=config,
+            workers=args.workers
+        )
+
+
+def cmd_rank(config: Config, args) -> None:
+    from tmk.utils import setup_directories, rank_and_report
+    if args.top_n is not None:
+        config.ranking_config['top_n'] = args.top_n
+    setup_directories(config)
+    rank_and_report(config)
+
+
+def cmd_query(config: Config, args) -> None:
+    from tmk.database import load_db, query_users
+    criteria = parse_criteria(args.where)
+    users = query_users(load_db(args.db or config.db_path), criteria)
+    columns = args.columns.split(',') if args.columns else ['user_id', 'username'] + [
+        column for column in criteria if column not in ('user_id', 'username')
+    ]
+    users = users[columns]
+    if args.limit:
+        users = users.head(args.limit)
+
+    if args.format == 'csv':
+        users.to_csv(sys.stdout, index=False)
+    elif args.format == 'json':
+        for record in users.to_dict('records'):
+            print(json.dumps(record, default=str))
+    else:
+        print(users.to_string(index=False))
+        print(f"({len(users)} users)", file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default='config/default_config.yaml', help='Path to configuration file')
+
+    parser = argparse.ArgumentParser(
+        prog='tmk', description='TMK: Clinical Trial Recruitment System',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scrape = subparsers.add_parser('scrape', parents=[common], help='Scrape the configured subreddits')
+    scrape.set_defaults(func=cmd_scrape)
+
+    process = subparsers.add_parser('process', parents=[common], help='Extract features from new raw data')
+    process.add_argument('--workers', type=int, default=None,
+                         help='Processes for parsing raw files (overrides processing.workers)')
+    process.set_defaults(func=cmd_process)
+
+    rank = subparsers.add_parser('rank', parents=[common], help='Write top-N reports per user type')
+    rank.add_argument('--top-n', type=int, default=None, help='Overrides ranking.top_n')
+    rank.set_defaults(func=cmd_rank)
+
+    query = subparsers.add_parser('query', parents=[common], help='Query the user DB')
+    query.add_argument('--where', default='{}',
+                       help='JSON criteria; [operator, value] pairs for >, <, in, between, contains_any, ...')
+    query.add_argument('--columns', help='Comma-separated columns to print (default: IDs and queried columns)')
+    query.add_argument('--limit', type=int, default=None)
+    query.add_argument('--format', choices=['table', 'csv', 'json'], default='table')
+    query.add_argument('--db', help='User DB path (default: from the config)')
+    query.set_defaults(func=cmd_query)
+    return parser
+
+
+def main(argv: List[str] = None) -> None:
+    args = build_parser().parse_args(argv)
+    config = Config(args.config, stages=[args.command])
+    metrics_config = config.config.get('metrics') or {}
+    METRICS.configure(metrics_config)
+    try:
+        args.func(config, args)
+    finally:
+        # Ad-hoc queries leave no metrics behind
+        if args.command != 'query' and metrics_config.get('enabled'):
+            json_path, prom_path = METRICS.write()
+            print(f"\n{METRICS.summary()}\nMetrics written to {json_path} and {prom_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Columnar (Parquet / Arrow IPC) persistence for the user DB
+
+Requires the optional `pyarrow` dependency (pip install tmk[columnar]).
+"""
+from typing import List, Optional, Any
+import argparse
+import pandas as pd
+from tmk.storage import USER_COLUMNS, JSON_COLUMNS, DATETIME_COLUMNS
+from tmk.user import parse_list_field
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+FLOAT_COLUMNS = ['clinical_trials_sentiment', 'treatment_sentiment', 'avg_score', 'pagerank', 'community_centrality']
+INT_COLUMNS = ['num_comments', 'conversation_depth', 'conversation_count', 'parent_interactions',
+               'replies_received', 'community_id']
+
+
+def is_columnar_path(path: Optional[str]) -> bool:
+    return bool(path) and path.endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Columnar storage requires pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def user_schema():
+    """Arrow schema for the users table"""
+    pa = _require_pyarrow()
+    fields = []
+    for column in USER_COLUMNS:
+        if column in JSON_COLUMNS:
+            fields.append(pa.field(column, pa.list_(pa.string())))
+        elif column in DATETIME_COLUMNS:
+            fields.append(pa.field(column, pa.timestamp('us')))
+        elif column in FLOAT_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        elif column in INT_COLUMNS:
+            fields.append(pa.field(column, pa.int64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def _string_or_none(value: Any) -> Optional[str]:
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return str(value)
+
+
+def to_arrow_table(df: pd.DataFrame):
+    """Coerce a users DataFrame to typed columns (lists as real lists, not str(list))"""
+    pa = _require_pyarrow()
+    schema = user_schema()
+    arrays = []
+    for field in schema:
+        values = df[field.name] if field.name in df.columns else pd.Series([None] * len(df), dtype=object)
+        if field.name in JSON_COLUMNS:
+            data = [[str(v) for v in parse_list_field(v)] for v in values]
+        elif field.name in DATETIME_COLUMNS:
+            data = pd.to_datetime(values, errors='coerce')
+        elif field.name in FLOAT_COLUMNS:
+            data = pd.to_numeric(values, errors='coerce')
+        elif field.name in INT_COLUMNS:
+            data = pd.to_numeric(values, errors='coerce').fillna(0).astype('int64')
+        else:
+            data = [_string_or_none(v) for v in values]
+        arrays.append(pa.array(data, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _to_frame(table) -> pd.DataFrame:
+    df = table.to_pandas()
+    for column in JSON_COLUMNS & set(df.columns):
+        df[column] = [list(v) if v is not None else [] for v in df[column]]
+    return df
+
+
+def save_columnar(df: pd.DataFrame, path: str, row_group_size: int = 100_000) -> None:
+    """Write the users DataFrame as Parquet or Arrow IPC depending on the extension"""
+    _require_pyarrow()
+    table = to_arrow_table(df.sort_values('user_id') if len(df) else df)
+    if path.endswith(PARQUET_EXTENSIONS):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, row_group_size=row_group_size, compression='zstd')
+    else:
+        import pyarrow.feather as feather
+        # Uncompressed so the file can be memory-mapped without a decode pass
+        feather.write_feather(table, path, compression='uncompressed', chunksize=row_group_size)
+
+
+def load_columnar(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List] = None,
+    memory_map: bool = False
+) -> pd.DataFrame:
+    """Read a Parquet or Arrow IPC users file
+
+    columns: project only these columns
+    filters: pyarrow predicate, e.g. [('gender', '=', 'F'), ('num_comments', '>', 5)];
+             Parquet skips row groups whose statistics exclude the predicate
+    memory_map: map the file instead of reading it into memory
+    """
+    pa = _require_pyarrow()
+    if path.endswith(PARQUET_EXTENSIONS):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, filters=filters, memory_map=memory_map)
+    else:
+        import pyarrow.parquet as pq
+        # A memory-mapped, uncompressed IPC file is read zero-copy
+        source = pa.memory_map(path, 'r') if memory_map else pa.OSFile(path, 'rb')
+        table = pa.ipc.open_file(source).read_all()
+        if filters:
+            table = table.filter(pq.filters_to_expression(filters))
+        if columns:
+            table = table.select(columns)
+    return _to_frame(table)
+
+
+def migrate_pickle(pickle_path: str, out_path: str) -> int:
+    """One-shot migration of a legacy users.pkl to Parquet/Arrow; returns the row count"""
+    df = pd.read_pickle(pickle_path)
+    save_columnar(df, out_path)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate a pickled user DB to Parquet/Arrow')
+    parser.add_argument('pickle_path', help='Existing users.pkl')
+    parser.add_argument('out_path', help='Target .parquet or .arrow file')
+    args = parser.parse_args()
+
+    n = migrate_pickle(args.pickle_path, args.out_path)
+    print(f"Migrated {n} users from {args.pickle_path} to {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Compact per-author store of one raw file's posts and comments
+
+Replaces a dict per item: numeric fields live in typed arrays, subreddit
+names and types are interned once per file, and bodies are UTF-8 slices
+of one shared buffer addressed by offsets. Items are grouped by author as
+arrays of row numbers.
+
+The store reads like the `{author: [content dict, ...]}` mapping it
+replaces: `store[author]` is a list of lightweight `Content` views that
+support `content['content']` / `content.get('id')`, so dedup, the
+pre-filter and the chunker take either form. A body is only decoded when
+read, e.g. when a user's prompt is assembled.
+"""
+from typing import Dict, List, Any, Iterator, Optional
+from array import array
+from collections.abc import Mapping
+
+FIELDS = ('id', 'content', 'score', 'subreddit', 'subreddit_type', 'depth')
+
+
+class Content:
+    """View of one stored item; reads like the item dict it replaces"""
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store: 'ContentStore', row: int):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.store.ids[self.row]
+
+    @property
+    def content(self) -> str:
+        return self.store.text(self.row)
+
+    @property
+    def score(self) -> float:
+        return self.store.scores[self.row]
+
+    @property
+    def subreddit(self) -> Optional[str]:
+        return self.store.name(self.store.subreddits[self.row])
+
+    @property
+    def subreddit_type(self) -> Optional[str]:
+        return self.store.name(self.store.subreddit_types[self.row])
+
+    @property
+    def depth(self) -> int:
+        return self.store.depths[self.row]
+
+    @property
+    def index_row(self) -> int:
+        """Row of the item in the file's comment index (-1 without one)"""
+        return self.store.index_rows[self.row]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key) if key in FIELDS else None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in FIELDS}
+
+    def __eq__(self, other) -> bool:
+        other = other.to_dict() if isinstance(other, Content) else other
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Content({self.to_dict()!r})"
+
+
+class ContentStore(Mapping):
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self.scores = array('d')
+        self.depths = array('h')
+        self.subreddits = array('i')
+        self.subreddit_types = array('i')
+        self.index_rows = array('q')
+        self.offsets = array('q', [0])  # Body of row i is buffer[offsets[i]:offsets[i + 1]]
+        self.names: List[str] = []  # Interned subreddit names and types
+        self._name_codes: Dict[str, int] = {}
+        self._buffer = bytearray()
+        self._rows: Dict[str, array] = {}  # Author -> rows, in insertion order
+
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._name_codes.get(value)
+        if code is None:
+            code = self._name_codes[value] = len(self.names)
+            self.names.append(value)
+        return code
+
+    def name(self, code: int) -> Optional[str]:
+        return self.names[code] if code >= 0 else None
+
+    def add(
+        self,
+        author: str,
+        item_id: Optional[str],
+        text: str,
+        score: float,
+        subreddit: Optional[str],
+        subreddit_type: Optional[str],
+        depth: int = 0,
+        index_row: int = -1
+    ) -> None:
+        row = len(self.ids)
+        self.ids.append(item_id)
+        self.scores.append(score or 0)
+        self.depths.append(depth or 0)
+        self.subreddits.append(self._intern(subreddit))
+        self.subreddit_types.append(self._intern(subreddit_type))
+        self.index_rows.append(index_row)
+        self._buffer += text.encode('utf-8', 'surrogatepass')
+        self.offsets.append(len(self._buffer))
+        rows = self._rows.get(author)
+        if rows is None:
+            rows = self._rows[author] = array('i')
+        rows.append(row)
+
+    def text(self, row: int) -> str:
+        return self._buffer[self.offsets[row]:self.offsets[row + 1]].decode('utf-8', 'surrogatepass')
+
+    @property
+    def n_items(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, author: str) -> List[Content]:
+        return [Content(self, row) for row in self._rows[author]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, author) -> bool:
+        return author in self._rows
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ContentStore):
+            return Mapping.__eq__(self, other)
+        return (
+            self.ids == other.ids and self.scores == other.scores and self.depths == other.depths
+            and self.index_rows == other.index_rows
+            and [self.name(c) for c in self.subreddits] == [other.name(c) for c in other.subreddits]
+            and [self.name(c) for c in self.subreddit_types] == [other.name(c) for c in other.subreddit_types]
+            and self.offsets == other.offsets and bytes(self._buffer) == bytes(other._buffer)
+            and self._rows == other._rows
+        )
+
+    __hash__ = None
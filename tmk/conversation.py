@@ -0,0 +1,191 @@
+"""Array-backed index of a raw file's posts and comments, for conversation-structure metrics
+
+Built in the same single pass that groups content by author: every post
+and comment becomes one row of parallel typed arrays (parent row, author
+code, depth, score, created_utc, thread row, subreddit-type code),
+with author names and subreddit types interned to small integer codes.
+Per-author metrics are then a handful of vectorized NumPy reductions and
+sorts over those arrays, with no per-author Python loops:
+
+- max_comment_depth: deepest comment the author wrote
+- conversation_count: distinct threads (posts) the author posted or commented in
+- parent_interactions: the author's replies to someone else's post or comment
+- replies_received: other users' masked replies to the author's posts and
+  comments (the replied-to item may be old), so each reply is credited once,
+  when it is ingested; recipients without masked items of their own are
+  included too
+- subreddit_types: subreddit types the author was active in
+
+Metrics are computed over a mask of items (the content delta being
+ingested), so merging them into stored profiles never counts an item twice;
+a thread only counts as a new conversation if none of the author's
+unmasked items (already ingested, or unchanged context) are in it.
+"""
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from array import array
+import numpy as np
+
+POST_DEPTH = -1
+
+
+def _item_id(reddit_id: Optional[str]) -> Optional[str]:
+    """'t1_abc' / 't3_xyz' fullnames and bare IDs map to the bare ID"""
+    if reddit_id and len(reddit_id) > 3 and reddit_id[2] == '_' and reddit_id[0] == 't':
+        return reddit_id[3:]
+    return reddit_id
+
+
+def _distinct(keys: np.ndarray) -> np.ndarray:
+    """Sorted distinct values (sort-based; np.unique's hash path is far slower on large int64 keys)"""
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+
+class CommentIndex:
+    def __init__(self):
+        self.codes: Dict[str, int] = {}  # item ID -> row, while building (callers keep the rows add() returns)
+        self.authors: List[str] = []
+        self.subreddit_types: List[str] = []
+        # Typed arrays while building (no boxed value per item); NumPy arrays once frozen
+        self.parent: Any = array('q')
+        self.author: Any = array('q')
+        self.depth: Any = array('h')
+        self.score: Any = array('d')
+        self.created_utc: Any = array('d')
+        self.thread: Any = array('q')
+        self.subreddit_type: Any = array('h')
+        self._name_codes = ({}, {})  # author / subreddit type -> code
+        self._unresolved: List[Tuple[int, str]] = []  # (row, parent ID) of replies added before their parent
+        self._frozen = False
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @staticmethod
+    def _intern(value: Optional[str], codes: Dict[str, int], names: List[str]) -> int:
+        """Code of value in names (appended if new); -1 for missing or deleted"""
+        code = codes.get(value)
+        if code is None:
+            if value in (None, '', '[deleted]', '[removed]'):
+                return -1
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def add(self, item: Dict[str, Any], thread: int, subreddit_type: Optional[str], is_post: bool = False) -> int:
+        """Append one post or comment; returns its row
+
+        Comment trees are walked parents first, so a reply's parent row is
+        normally known here; the rest are resolved in freeze().
+        """
+        row = len(self.parent)
+        item_id = item.get('id')
+        if item_id is not None:
+            self.codes[item_id] = row
+        parent = -1
+        parent_id = None if is_post else item.get('parent_id')
+        if parent_id:
+            parent = self.codes.get(_item_id(parent_id), -1)
+            if parent < 0:
+                self._unresolved.append((row, parent_id))
+        self.parent.append(parent)
+        self.author.append(self._intern(item.get('author'), self._name_codes[0], self.authors))
+        self.depth.append(POST_DEPTH if is_post else item.get('depth') or 0)
+        self.score.append(item.get('score') or 0)
+        self.created_utc.append(item.get('created_utc') or 0)
+        self.thread.append(row if is_post else thread)
+        self.subreddit_type.append(self._intern(subreddit_type, self._name_codes[1], self.subreddit_types))
+        return row
+
+    def freeze(self) -> 'CommentIndex':
+        """Resolve late parents and view the columns as NumPy arrays (also makes the index cheap to pickle)"""
+        if self._frozen:
+            return self
+        for row, parent_id in self._unresolved:
+            self.parent[row] = self.codes.get(_item_id(parent_id), -1)
+        self.parent = np.frombuffer(self.parent, dtype=np.int64)
+        self.author = np.frombuffer(self.author, dtype=np.int64)
+        self.subreddit_type = np.frombuffer(self.subreddit_type, dtype=np.int16)
+        self.depth = np.frombuffer(self.depth, dtype=np.int16)
+        self.score = np.frombuffer(self.score, dtype=np.float64)
+        self.created_utc = np.frombuffer(self.created_utc, dtype=np.float64)
+        self.thread = np.frombuffer(self.thread, dtype=np.int64)
+        self.codes, self._name_codes, self._unresolved = {}, ({}, {}), []
+        self._frozen = True
+        return self
+
+    def mask(self, rows: Iterable[int]) -> np.ndarray:
+        """Boolean row mask of the given rows (negative rows, i.e. items not in the index, are ignored)"""
+        rows = np.fromiter(rows, dtype=np.int64)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows[rows >= 0]] = True
+        return mask
+
+    def _replies(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows of replies to someone else's item (both authors known) and of the items they reply to"""
+        children = np.flatnonzero((self.author >= 0) & (self.parent >= 0))
+        parents = self.parent[children]
+        parent_authors = self.author[parents]
+        replies = (parent_authors >= 0) & (parent_authors != self.author[children])
+        return children[replies], parents[replies]
+
+    def reply_pairs(self, mask: np.ndarray = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(author names, replier codes, replied-to author codes) of the masked replies to someone else"""
+        self.freeze()
+        children, parents = self._replies()
+        if mask is not None:
+            children, parents = children[mask[children]], parents[mask[children]]
+        return self.authors, self.author[children], self.author[parents]
+
+    def metrics(self, mask: np.ndarray = None) -> Dict[str, Dict[str, Any]]:
+        """Conversation metrics per author name over the masked items (all items by default)"""
+        self.freeze()
+        n_authors = len(self.authors)
+        known = self.author >= 0
+        rows = np.flatnonzero(known if mask is None else mask & known)
+        authors = self.author[rows]
+
+        max_depth = np.zeros(n_authors, dtype=np.int64)
+        comments = self.depth[rows] >= 0
+        np.maximum.at(max_depth, authors[comments], self.depth[rows][comments])
+
+        # Distinct (author, thread) pairs, minus threads the author was already in outside the mask
+        stride = max(len(self), 1)
+        pairs = authors * stride + self.thread[rows]
+        if mask is not None:
+            seen = np.flatnonzero(~mask & known)
+            seen_pairs = _distinct(self.author[seen] * stride + self.thread[seen])
+            position = np.minimum(np.searchsorted(seen_pairs, pairs), max(len(seen_pairs) - 1, 0))
+            if len(seen_pairs):
+                pairs = pairs[seen_pairs[position] != pairs]
+        conversations = np.bincount(_distinct(pairs) // stride, minlength=n_authors)
+
+        children, parents = self._replies()
+        parent_authors = self.author[parents]
+        if mask is not None:
+            # Both given and received count masked (new) replies
+            new_replies = mask[children]
+            interactions = np.bincount(self.author[children[new_replies]], minlength=n_authors)
+            received = np.bincount(parent_authors[new_replies], minlength=n_authors)
+        else:
+            interactions = np.bincount(self.author[children], minlength=n_authors)
+            received = np.bincount(parent_authors, minlength=n_authors)
+
+        # Distinct (author, subreddit type) pairs
+        type_codes = self.subreddit_type[rows].astype(np.int64)
+        typed = type_codes >= 0
+        type_pairs = _distinct((authors[typed] << 16) + type_codes[typed])
+        types: Dict[int, List[str]] = {}
+        for pair in type_pairs.tolist():
+            types.setdefault(pair >> 16, []).append(self.subreddit_types[pair & 0xFFFF])
+
+        return {
+            self.authors[code]: {
+                'max_comment_depth': int(max_depth[code]),
+                'conversation_count': int(conversations[code]),
+                'parent_interactions': int(interactions[code]),
+                'replies_received': int(received[code]),
+                'subreddit_types': types.get(code, []),
+            }
+            for code in _distinct(np.concatenate([authors, np.flatnonzero(received)])).tolist()
+        }
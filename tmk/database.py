@@ -1,67 +1,239 @@
+import os
+import weakref
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union, Iterable, Tuple
 from datetime import datetime
+from tmk.storage import USER_COLUMNS, SQLiteUserStore, is_sqlite_path
+from tmk.columnar import is_columnar_path, save_columnar, load_columnar
+from tmk.query import Predicate, UserIndex, from_criteria, index_path
 
-def init_db() -> pd.DataFrame:
-    """Initialize empty users DataFrame"""
-    return pd.DataFrame(columns=[
-        # User info
-        'user_id', 'username', 'created_at', 'updated_at',
-        # Demographics
-        'age_range', 'gender', 'location', 'income_level', 'education_level',
-        # Health
-        'illness_types', 'treatment_history',
-        # Interest
-        'clinical_trial_interest', 'money_making_interest',
-        # Sentiment
-        'clinical_trials_sentiment', 'treatment_sentiment',
-        # Engagement
-        'num_comments', 'avg_score',
-        # New columns
-        'conversation_depth', 'conversation_count',
-        'parent_interactions', 'subreddit_types'
-    ])
-
-def upsert_user(df: pd.DataFrame, user_data: Dict) -> pd.DataFrame:
+# A user DB is either the reference pandas DataFrame or an indexed store backend
+UserDB = Union[pd.DataFrame, SQLiteUserStore]
+
+# Secondary indexes of DataFrame DBs, keyed by id() and guarded by a weak reference
+# (a new frame reusing a dead frame's id never sees its index). Index positions are
+# the frame's row positions; the functions below keep both in step.
+_frame_indexes: Dict[int, Tuple[weakref.ref, UserIndex]] = {}
+
+def _attach_index(df: pd.DataFrame, index: UserIndex) -> None:
+    key = id(df)
+
+    def forget(ref: weakref.ref) -> None:
+        if _frame_indexes.get(key, (None,))[0] is ref:
+            del _frame_indexes[key]
+
+    _frame_indexes[key] = (weakref.ref(df, forget), index)
+
+def _frame_index(df: pd.DataFrame, build: bool = False) -> Optional[UserIndex]:
+    """The index of a DataFrame DB (built on demand if build), or None if it has none"""
+    entry = _frame_indexes.get(id(df))
+    if entry is not None and entry[0]() is df and entry[1].size == len(df):
+        return entry[1]
+    if not build or df['user_id'].duplicated().any():
+        # Row positions of a frame with repeated user IDs don't map onto index positions
+        return None
+    index = UserIndex.from_frame(df)
+    _attach_index(df, index)
+    return index
+
+def _file_stamp(path: str) -> str:
+    """Identifies one write of a DB file, to match it with its saved index"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def init_db(backend: str = None, path: str = None) -> UserDB:
+    """Initialize an empty user DB
+
+    backend: 'dataframe' (reference, pickled) or 'sqlite'. Defaults to the
+    backend implied by the path's extension (.sqlite/.db -> sqlite).
+    """
+    backend = backend or ('sqlite' if is_sqlite_path(path) else 'dataframe')
+    if backend == 'sqlite':
+        return SQLiteUserStore(path or 'data/users.sqlite')
+    if backend != 'dataframe':
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return pd.DataFrame(columns=USER_COLUMNS)
+
+def upsert_user(df: UserDB, user_data: Dict) -> UserDB:
     """Insert or update user record"""
-    if user_data['user_id'] in df['user_id'].values:
-        df.loc[df['user_id'] == user_data['user_id']] = user_data
+    if not isinstance(df, pd.DataFrame):
+        df.upsert(user_data)
+        return df
+
+    index = _frame_index(df)
+    if index is not None:
+        position = index.positions.get(user_data['user_id'])
+        row = None if position is None else df.index[position]
+    elif user_data['user_id'] in df['user_id'].values:
+        row = df.index[df['user_id'] == user_data['user_id']][0]
+    else:
+        row = None
+    if row is not None:
+        # Assign cell by cell: row assignment from a dict breaks on list-valued fields
+        for column, value in user_data.items():
+            df.at[row, column] = value
     else:
         df = pd.concat([df, pd.DataFrame([user_data])], ignore_index=True)
+    if index is not None:
+        index.update(user_data)
+        _attach_index(df, index)
+    return df
+
+def upsert_users(df: UserDB, records: Iterable[Dict]) -> UserDB:
+    """Insert or update many user records (one transaction on store backends)"""
+    if not isinstance(df, pd.DataFrame):
+        df.upsert_many(records)
+        return df
+    for record in records:
+        df = upsert_user(df, record)
+    return df
+
+def update_columns(df: UserDB, user_ids: List[str], columns: Dict[str, Iterable]) -> UserDB:
+    """Overwrite some columns of many users at once; user IDs not in the DB are ignored"""
+    if not isinstance(df, pd.DataFrame):
+        df.update_columns(user_ids, columns)
+        return df
+    index = _frame_index(df)
+    positions = df['user_id'].map(pd.Series(range(len(user_ids)), index=user_ids))
+    found = positions.notna().to_numpy()
+    rows = positions[found].astype(int).to_numpy()
+    for column, values in columns.items():
+        df.loc[found, column] = np.asarray(values)[rows]
+    if index is not None:
+        index.update_columns(user_ids, columns)
     return df
 
-def query_users(df: pd.DataFrame, criteria: Dict) -> pd.DataFrame:
+def get_user(df: UserDB, user_id: str) -> Optional[Dict]:
+    """Return a user's record as a dict, or None if absent"""
+    if not isinstance(df, pd.DataFrame):
+        return df.get(user_id)
+    rows = df[df['user_id'] == user_id]
+    if rows.empty:
+        return None
+    return rows.iloc[-1].to_dict()
+
+def query_users(df: UserDB, criteria: Union[Dict, Predicate]) -> pd.DataFrame:
     """Query users based on criteria
-    
+
     Example criteria:
     {
         'gender': 'M',
-        'clinical_trial_interest': 'high',
-        'num_comments': ('>', 5)
+        'clinical_trial_interest': ('in', ['high', 'medium']),
+        'num_comments': ('>', 5),
+        'treatment_sentiment': ('between', (-1, -0.3)),
+        'illness_types': ('contains_any', ['fibromyalgia', 'lupus'])
     }
+
+    Criteria may also be a composed predicate from tmk.query, e.g.
+    ContainsAny('illness_types', ['fibromyalgia']) & Eq('clinical_trial_interest', 'high')
     """
-    mask = pd.Series([True] * len(df))
-    
-    for column, value in criteria.items():
-        if isinstance(value, tuple):
-            operator, val = value
-            if operator == '>':
-                mask &= df[column] > val
-            elif operator == '<':
-                mask &= df[column] < val
-            elif operator == '>=':
-                mask &= df[column] >= val
-            elif operator == '<=':
-                mask &= df[column] <= val
-        else:
+    if not isinstance(df, pd.DataFrame):
+        return df.query(criteria)
+
+    predicate = criteria if isinstance(criteria, Predicate) else from_criteria(criteria)
+    index = _frame_index(df, build=predicate.indexed)
+    if index is not None and predicate.indexed:
+        return df.iloc[np.flatnonzero(predicate.evaluate(index))]
+    return df[predicate.mask(df)]
+
+def search_users(df: UserDB, criteria: Union[Dict, Predicate]) -> List[str]:
+    """IDs of the users matching query_users criteria, without materializing their rows"""
+    predicate = criteria if isinstance(criteria, Predicate) else from_criteria(criteria)
+    if not isinstance(df, pd.DataFrame):
+        return df.search(predicate)
+    index = _frame_index(df, build=predicate.indexed)
+    if index is not None and predicate.indexed:
+        return index.search(predicate)
+    return df['user_id'][predicate.mask(df)].tolist()
+
+def as_frame(df: UserDB) -> pd.DataFrame:
+    """Materialize any user DB as a DataFrame"""
+    return df if isinstance(df, pd.DataFrame) else df.to_frame()
+
+def save_db(df: UserDB, path: str) -> None:
+    """Save DataFrame to disk (Parquet/Arrow for .parquet/.arrow paths, pickle otherwise)
+
+    File backends are written to a temporary file and renamed into place, so
+    a crash mid-save leaves the previous DB intact. The DataFrame's secondary
+    indexes are saved next to it, tagged with the new file's size and mtime.
+    """
+    if not isinstance(df, pd.DataFrame):
+        df.save(path)
+        return
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{extension}"
+    if is_columnar_path(path):
+        save_columnar(df, tmp_path)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    index = _frame_index(df, build=True)
+    if index is not None:
+        index.save(index_path(path), _file_stamp(path))
+
+def _apply_filters(df: pd.DataFrame, filters: List) -> pd.DataFrame:
+    """Evaluate Parquet-style (column, op, value) filters on an in-memory DataFrame"""
+    mask = pd.Series(True, index=df.index)
+    for column, operator, value in filters:
+        if operator in ('=', '=='):
             mask &= df[column] == value
-            
+        elif operator == '!=':
+            mask &= df[column] != value
+        elif operator == '>':
+            mask &= df[column] > value
+        elif operator == '<':
+            mask &= df[column] < value
+        elif operator == '>=':
+            mask &= df[column] >= value
+        elif operator == '<=':
+            mask &= df[column] <= value
+        elif operator == 'in':
+            mask &= df[column].isin(value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
     return df[mask]
 
-def save_db(df: pd.DataFrame, path: str) -> None:
-    """Save DataFrame to disk"""
-    df.to_pickle(path)
+def load_db(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List] = None,
+    memory_map: bool = False
+) -> UserDB:
+    """Load DataFrame from disk
+
+    columns: only load these columns
+    filters: [(column, op, value), ...] predicates; pushed down to row groups for Parquet
+    memory_map: memory-map Parquet/Arrow files instead of reading them
+
+    A SQLite path opens the live store, or, with columns or filters, reads
+    a DataFrame of just those columns and rows in one SQL query.
+    """
+    if is_sqlite_path(path):
+        store = SQLiteUserStore(path)
+        if not columns and not filters:
+            return store
+        try:
+            return store.select(columns, filters)
+        finally:
+            store.close()
+    if is_columnar_path(path):
+        df = load_columnar(path, columns=columns, filters=filters, memory_map=memory_map)
+        if not columns and not filters:
+            _load_index(df, path)
+        return df
+
+    df = pd.read_pickle(path)
+    if filters:
+        df = _apply_filters(df, filters)
+    if columns:
+        df = df[columns]
+    if not columns and not filters:
+        _load_index(df, path)
+    return df
 
-def load_db(path: str) -> pd.DataFrame:
-    """Load DataFrame from disk"""
-    return pd.read_pickle(path) 
\ No newline at end of file
+def _load_index(df: pd.DataFrame, path: str) -> None:
+    """Attach the saved secondary indexes of a whole DB file, if they match it"""
+    index = UserIndex.load(index_path(path), _file_stamp(path))
+    if index is not None and index.size == len(df):
+        _attach_index(df, index)
@@ -0,0 +1,159 @@
+"""Near-duplicate content detection with MinHash LSH
+
+Cross-posted and copy-pasted bodies (and replies that mostly quote their
+parent) are collapsed before prompt assembly and engagement metrics, so
+the same text is neither paid for twice nor counted twice. Signatures and
+LSH buckets persist in SQLite, so duplicates of content ingested in
+earlier runs are caught too.
+"""
+from typing import Dict, List, Any, Optional
+import os
+import re
+import sqlite3
+import zlib
+import numpy as np
+from tmk.llm_engine import estimate_tokens
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """31-bit hashes of the distinct word n-grams of a text"""
+        words = _WORD.findall(text.lower())
+        n = self.shingle_size
+        grams = {' '.join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        return np.fromiter(
+            (zlib.crc32(g.encode('utf-8')) & _MERSENNE_PRIME for g in grams), dtype=np.uint64, count=len(grams)
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        # (a * x + b) mod p for every permutation and shingle; a, x < 2^31 so no uint64 overflow
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class DedupIndex:
+    """Persistent MinHash LSH index of content bodies, keyed by content ID"""
+
+    def __init__(
+        self,
+        path: str,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        min_words: int = 8
+    ):
+        if num_perm % bands:
+            raise ValueError("dedup.num_perm must be divisible by dedup.bands")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_words = min_words
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.stats = {'checked': 0, 'collapsed': 0, 'tokens_saved': 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS signatures (content_id TEXT PRIMARY KEY, signature BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS lsh_buckets (bucket INTEGER, content_id TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_bucket ON lsh_buckets(bucket)")
+        self.conn.commit()
+
+    def _buckets(self, signature: np.ndarray) -> List[int]:
+        return [
+            (band << 32) | zlib.crc32(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def find_duplicate(self, content_id: Optional[str], signature: np.ndarray) -> Optional[str]:
+        """ID of an indexed item at or above the similarity threshold, other than the item itself"""
+        buckets = self._buckets(signature)
+        candidates = self.conn.execute(
+            f"SELECT DISTINCT s.content_id, s.signature FROM lsh_buckets b "
+            f"JOIN signatures s ON s.content_id = b.content_id "
+            f"WHERE b.bucket IN ({', '.join('?' for _ in buckets)})", buckets
+        ).fetchall()
+        for candidate_id, blob in candidates:
+            if candidate_id == content_id:
+                continue
+            similarity = np.mean(np.frombuffer(blob, dtype=np.uint32) == signature)
+            if similarity >= self.threshold:
+                return candidate_id
+        return None
+
+    def add(self, content_id: str, signature: np.ndarray) -> None:
+        """Index an item (uncommitted until commit())"""
+        inserted = self.conn.execute(
+            "INSERT OR IGNORE INTO signatures (content_id, signature) VALUES (?, ?)",
+            (content_id, signature.tobytes())
+        ).rowcount
+        if inserted:
+            self.conn.executemany(
+                "INSERT INTO lsh_buckets (bucket, content_id) VALUES (?, ?)",
+                [(bucket, content_id) for bucket in self._buckets(signature)]
+            )
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def collapse(self, user_contents: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Drop items that near-duplicate earlier content (this run or indexed), indexing the rest
+
+        Items too short to shingle meaningfully (under min_words) are kept
+        as-is and not indexed.
+        """
+        collapsed = {}
+        for username, contents in user_contents.items():
+            kept = []
+            for content in contents:
+                text = content.get('content') or ''
+                if content.get('id') is None or len(_WORD.findall(text)) < self.min_words:
+                    kept.append(content)
+                    continue
+                self.stats['checked'] += 1
+                signature = self.hasher.signature(text)
+                if self.find_duplicate(content['id'], signature) is not None:
+                    self.stats['collapsed'] += 1
+                    self.stats['tokens_saved'] += estimate_tokens(text)
+                    continue
+                self.add(content['id'], signature)
+                kept.append(content)
+            if kept:
+                collapsed[username] = kept
+        self.commit()
+        return collapsed
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_dedup_index(config: Dict[str, Any], data_dir: str) -> Optional[DedupIndex]:
+    """The persistent dedup index configured under `dedup`, or None when disabled"""
+    dedup_config = config.get('dedup') or {}
+    if not dedup_config.get('enabled'):
+        return None
+    return DedupIndex(
+        os.path.join(data_dir, dedup_config.get('index_file', 'dedup_index.sqlite')),
+        threshold=dedup_config.get('threshold', 0.8),
+        num_perm=dedup_config.get('num_perm', 64),
+        bands=dedup_config.get('bands', 16),
+        shingle_size=dedup_config.get('shingle_size', 3),
+        min_words=dedup_config.get('min_words', 8)
+    )
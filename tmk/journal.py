@@ -0,0 +1,88 @@
+"""Append-only journal of per-user extraction results, for crash-safe, resumable processing
+
+Each user's validated features are appended (one JSON line, flushed) as
+soon as their LLM calls finish, tagged with the raw file and the content
+IDs they were extracted from. After a crash or Ctrl-C, reprocessing the
+file replays journaled users instead of paying for them again, so only
+in-flight requests are lost. A checkpoint saves the user store and then
+compacts (truncates) the journal, whose entries the store now covers.
+"""
+from typing import Dict, List, Any, Optional
+import json
+import os
+
+
+class Journal:
+    def __init__(self, path: str, fsync: bool = False):
+        """fsync: also fsync every entry (survives power loss, not just process crashes)"""
+        self.path = path
+        self.fsync = fsync
+        self.source: Optional[str] = None
+        self.stats = {'appended': 0, 'replayed': 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._entries = self._read()
+        self._file = open(path, 'a')
+
+    def _read(self) -> Dict[tuple, Dict[str, Any]]:
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        valid = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                entries[(entry['source'], entry['user'])] = entry
+                valid += len(line)
+        # Cut a torn final line from a crash mid-write, so appends start on a clean line
+        if valid < os.path.getsize(self.path):
+            os.truncate(self.path, valid)
+        return entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def begin(self, source: str) -> None:
+        """Tag subsequent entries with a raw file name"""
+        self.source = source
+
+    def append(self, username: str, content_ids: List[str], features: Dict[str, Any]) -> None:
+        entry = {'source': self.source, 'user': username, 'content_ids': content_ids, 'features': features}
+        self._file.write(json.dumps(entry, default=str) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._entries[(self.source, username)] = entry
+        self.stats['appended'] += 1
+
+    def replay(self, username: str, content_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """Journaled features of a user for the current file, if extracted from the same content"""
+        entry = self._entries.get((self.source, username))
+        if entry is None or entry['content_ids'] != content_ids:
+            return None
+        self.stats['replayed'] += 1
+        return entry['features']
+
+    def compact(self) -> None:
+        """Drop all entries; call only after the user store has been saved with them"""
+        self._file.close()
+        self._file = open(self.path, 'w')
+        os.fsync(self._file.fileno())
+        self._entries = {}
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def open_journal(processing_config: Dict[str, Any], data_dir: str) -> Optional[Journal]:
+    """The journal configured under processing.journal, or None when disabled"""
+    options = processing_config.get('journal') or {}
+    if not options.get('enabled'):
+        return None
+    return Journal(os.path.join(data_dir, options.get('file', 'processing_journal.jsonl')),
+                   fsync=options.get('fsync', False))
@@ -0,0 +1,229 @@
+"""Persistent per-user-type top-k leaderboards, updated on every upsert
+
+Scores use min/max normalization bounds frozen at the last full rebuild;
+values outside the bounds are clipped to [0, 1] (bounded rescaling) and
+counted as drift. Once drift exceeds `rebuild_drift` of the users seen at
+rebuild time, or a leaderboard can no longer prove its top k is exact,
+the leaderboards report themselves stale and are rebuilt from the DB.
+"""
+from typing import Dict, List, Optional, Tuple, Any
+import bisect
+import math
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from tmk.user_ranker import REPORT_COLUMNS, encode_column, encode_value, top_k_positions
+
+
+class TopK:
+    """The best `capacity` users by score, kept sorted, with an upper bound on everyone else
+
+    Invariant: every user outside the buffer scores at most `outside_max`,
+    and every buffered user scores at least `outside_max`. The top k is
+    exact while the buffer holds k users or nobody is outside it.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: List[Tuple[float, str]] = []  # ascending (-score, user_id): best first
+        self._scores: Dict[str, float] = {}
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.outside_max = -math.inf
+        self.has_outsiders = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, user_id: str) -> None:
+        score = self._scores.pop(user_id)
+        del self._entries[bisect.bisect_left(self._entries, (-score, user_id))]
+        del self.records[user_id]
+
+    def update(self, user_id: str, score: float, record: Dict[str, Any]) -> None:
+        if user_id in self._scores:
+            self._remove(user_id)
+        if score < self.outside_max:
+            # Users outside the buffer may score higher, so it cannot be placed
+            self.has_outsiders = True
+            return
+        bisect.insort(self._entries, (-score, user_id))
+        self._scores[user_id] = score
+        self.records[user_id] = record
+        if len(self._entries) > self.capacity:
+            neg_score, evicted = self._entries[-1]
+            self._remove(evicted)
+            self.outside_max = max(self.outside_max, -neg_score)
+            self.has_outsiders = True
+
+    def is_exact(self, k: int) -> bool:
+        return not self.has_outsiders or len(self._entries) >= k
+
+    def kth_score(self, k: int) -> float:
+        """Score a user must reach to enter the top k (-inf while fewer than k are known)"""
+        if len(self._entries) < k:
+            return -math.inf
+        return -self._entries[k - 1][0]
+
+    def top(self, k: int) -> List[Tuple[str, float, Dict[str, Any]]]:
+        return [(user_id, -neg_score, self.records[user_id]) for neg_score, user_id in self._entries[:k]]
+
+
+class Leaderboards:
+    def __init__(
+        self,
+        weights: Dict[str, Dict[str, float]],
+        k: int,
+        capacity_factor: int = 4,
+        rebuild_drift: float = 0.1
+    ):
+        """weights: ranking weights per user type; k: report size"""
+        self.weights = weights
+        self.k = k
+        self.capacity = max(k, k * capacity_factor)
+        self.rebuild_drift = rebuild_drift
+        self.keys = sorted({key for w in weights.values() for key in w})
+        self.bounds: Dict[str, Tuple[float, float]] = {}
+        self.boards = {user_type: TopK(self.capacity) for user_type in weights}
+        self.n_users = 0
+        self.drift_updates = 0
+        self.updates = 0
+        self.path: Optional[str] = None
+
+    @property
+    def columns(self) -> List[str]:
+        """Fields kept in board records: the report columns plus every weighted column"""
+        columns = list(REPORT_COLUMNS)
+        for key in self.keys:
+            column = key.partition(':')[0]
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def _normalize(self, key: str, raw: float) -> Tuple[float, bool]:
+        """Normalized value and whether it fell outside the frozen bounds"""
+        if key not in self.bounds or raw != raw:
+            return 0.0, False
+        low, high = self.bounds[key]
+        if high <= low:
+            return 0.0, raw != low
+        scaled = (raw - low) / (high - low)
+        return min(max(scaled, 0.0), 1.0), scaled < 0 or scaled > 1
+
+    def score(self, record: Dict[str, Any]) -> Tuple[Dict[str, float], bool]:
+        """Scores of one user for every user type, and whether any feature drifted"""
+        features, drifted = {}, False
+        for key in self.keys:
+            features[key], out_of_bounds = self._normalize(key, encode_value(key, record.get(key.partition(':')[0])))
+            drifted |= out_of_bounds
+        scores = {
+            user_type: sum(weight * features[key] for key, weight in weights.items())
+            for user_type, weights in self.weights.items()
+        }
+        return scores, drifted
+
+    def update(self, record: Dict[str, Any]) -> None:
+        """Fold an upserted user record into every leaderboard"""
+        scores, drifted = self.score(record)
+        self.updates += 1
+        self.drift_updates += drifted
+        # Boards keep only what reports read, not content_ids and the like
+        record = {column: record.get(column) for column in self.columns}
+        for user_type, board in self.boards.items():
+            board.update(record['user_id'], scores[user_type], record)
+
+    def would_rank(self, record: Dict[str, Any]) -> bool:
+        """Whether the record would make the current top k of any user type"""
+        scores, _ = self.score(record)
+        return any(scores[user_type] >= board.kth_score(self.k) for user_type, board in self.boards.items())
+
+    def rebuild(self, df: pd.DataFrame) -> None:
+        """Recompute bounds and all leaderboards from a full user table"""
+        self.bounds, columns = {}, []
+        for key in self.keys:
+            raw = encode_column(df, key)
+            if raw is None or np.isnan(raw).all():
+                columns.append(np.zeros(len(df)))
+                continue
+            low, high = float(np.nanmin(raw)), float(np.nanmax(raw))
+            self.bounds[key] = (low, high)
+            columns.append(np.nan_to_num((raw - low) / (high - low), nan=0.0) if high > low else np.zeros(len(df)))
+        X = np.column_stack(columns) if columns else np.zeros((len(df), 0))
+        kept = [column for column in self.columns if column in df.columns]
+
+        for user_type, weights in self.weights.items():
+            scores = X @ np.array([weights.get(key, 0.0) for key in self.keys])
+            positions = top_k_positions(scores, self.capacity + 1)
+            board = TopK(self.capacity)
+            records = df.iloc[positions[:self.capacity]][kept].to_dict('records')
+            for position, record in zip(positions, records):
+                board.update(record['user_id'], float(scores[position]), record)
+            if len(positions) > self.capacity:
+                board.outside_max = float(scores[positions[-1]])
+                board.has_outsiders = True
+            self.boards[user_type] = board
+        self.n_users = len(df)
+        self.drift_updates = 0
+        self.updates = 0
+
+    def is_stale(self, weights: Dict[str, Dict[str, float]] = None, k: int = None) -> bool:
+        """Whether a full rebuild is needed before reporting"""
+        if weights is not None and weights != self.weights:
+            return True
+        if k is not None and k > self.capacity:
+            return True
+        if not self.bounds and self.n_users == 0:
+            return True
+        if self.drift_updates > self.rebuild_drift * max(self.n_users, 1):
+            return True
+        return not all(board.is_exact(k or self.k) for board in self.boards.values())
+
+    def top(self, user_type: str, k: int = None) -> pd.DataFrame:
+        """Top-k users of a type with their ranking_score, best first; O(k)"""
+        entries = self.boards[user_type].top(k or self.k)
+        ranked = pd.DataFrame([record for _, _, record in entries])
+        ranked['ranking_score'] = [score for _, score, _ in entries]
+        return ranked
+
+    def save(self, path: str = None) -> None:
+        """Atomically replace the leaderboards file"""
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def load(path: str) -> Optional['Leaderboards']:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def ranking_weights(ranking_config: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Weights per user type from the '<type>_weights' sections of the ranking config"""
+    return {key[:-len('_weights')]: weights for key, weights in ranking_config.items() if key.endswith('_weights')}
+
+
+def open_leaderboards(ranking_config: Dict[str, Any], data_dir: str) -> Optional[Leaderboards]:
+    """Load the persisted leaderboards (ranking.leaderboards), or None when disabled
+
+    Leaderboards built for other weights or a smaller k are replaced by
+    empty ones, which stay stale until rebuilt.
+    """
+    options = ranking_config.get('leaderboards') or {}
+    if not options.get('enabled'):
+        return None
+    path = os.path.join(data_dir, options.get('file', 'leaderboards.pkl'))
+    weights, k = ranking_weights(ranking_config), ranking_config['top_n']
+    leaderboards = Leaderboards.load(path)
+    if leaderboards is None or leaderboards.weights != weights or leaderboards.capacity < k:
+        leaderboards = Leaderboards(
+            weights, k,
+            capacity_factor=options.get('capacity_factor', 4),
+            rebuild_drift=options.get('rebuild_drift', 0.1)
+        )
+    leaderboards.path = path
+    return leaderboards
@@ -0,0 +1,129 @@
+from typing import List, Dict, Any, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def cache_key(
+    model: str,
+    temperature: float,
+    messages: List[Dict[str, str]],
+    response_format: Optional[Dict[str, Any]] = None
+) -> str:
+    """Content address of a completion request"""
+    system = "\n".join(m['content'] for m in messages if m['role'] == 'system')
+    user = "\n".join(m['content'] for m in messages if m['role'] != 'system')
+    payload = json.dumps([model, temperature, response_format, system, user], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """SQLite-backed cache of completion contents with size- and age-based eviction"""
+
+    def __init__(
+        self,
+        path: str,
+        max_size_mb: Optional[float] = 512,
+        max_age_days: Optional[float] = 30,
+    ):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_created ON completions(created)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached content or None; expired entries count as misses"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.max_age and row[1] < time.time() - self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        size = len(content.encode('utf-8'))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, content, size, created) VALUES (?, ?, ?, ?)",
+                (key, content, size, time.time())
+            )
+            self._conn.commit()
+            self._size += size - (old[0] if old else 0)
+        if self.max_bytes and self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then the oldest ones until under the size limit"""
+        with self._lock:
+            if self.max_age:
+                self._conn.execute("DELETE FROM completions WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_bytes:
+                # Trim to 90% of the limit so we don't evict on every put
+                target = int(self.max_bytes * 0.9)
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+                if total > target:
+                    cursor = self._conn.execute("SELECT key, size FROM completions ORDER BY created")
+                    stale = []
+                    for key, size in cursor:
+                        if total <= target:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_completion_cache(openai_config: Dict[str, Any], data_dir: str) -> Optional[CompletionCache]:
+    """The completion cache configured under `openai.cache`, or None when disabled"""
+    cache_config = openai_config.get('cache') or {}
+    if not cache_config.get('enabled'):
+        return None
+    return CompletionCache(
+        os.path.join(data_dir, cache_config.get('file', 'llm_cache.sqlite')),
+        max_size_mb=cache_config.get('max_size_mb', 512),
+        max_age_days=cache_config.get('max_age_days', 30)
+    )
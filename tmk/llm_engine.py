@@ -0,0 +1,305 @@
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import random
+import time
+from tmk.llm_cache import CompletionCache, cache_key, open_completion_cache
+from tmk.metrics import METRICS
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+# Statuses worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token for English text)"""
+    return max(1, len(text) // 4)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estimate prompt tokens for a list of chat messages"""
+    return sum(estimate_tokens(m['content']) + 4 for m in messages)
+
+
+def pack_batches(texts: Dict[str, str], token_budget: int, max_items: int = 50) -> List[List[str]]:
+    """Greedily pack keys into batches whose estimated text tokens stay within the budget
+
+    Keys keep their input order; an item larger than the budget gets a batch of its own.
+    """
+    batches, current, current_tokens = [], [], 0
+    for key, text in texts.items():
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(key)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute
+
+    The buckets outlive event loops: only the lock is tied to a loop and
+    is recreated by bind_loop(), so a new loop does not start with a full
+    budget again.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def bind_loop(self) -> None:
+        """Replace the lock for a new event loop, keeping the bucket state"""
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self._request_allowance = min(self.rpm, self._request_allowance + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_allowance = min(self.tpm, self._token_allowance + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        """Seconds until both buckets can cover the request (0 if they already can)"""
+        wait = 0.0
+        if self.rpm and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60 / self.rpm)
+        if self.tpm:
+            # Requests larger than the whole bucket are let through once it is full
+            needed = min(tokens, self.tpm)
+            if self._token_allowance < needed:
+                wait = max(wait, (needed - self._token_allowance) * 60 / self.tpm)
+        return wait
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until a request of the given token size fits in both budgets"""
+        if not self.rpm and not self.tpm:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._request_allowance -= 1
+            if self.tpm:
+                self._token_allowance -= tokens
+
+
+class LLMEngine:
+    def __init__(
+        self,
+        openai_config: Dict[str, Any],
+        cache: Optional[CompletionCache] = None,
+        data_dir: str = 'data'
+    ):
+        """Initialize shared chat-completion engine from the `openai` config section
+
+        data_dir: where the configured completion cache file lives (the user DB's directory)
+        """
+        self.openai_config = openai_config
+        self.model = openai_config.get('model', 'gpt-4o-mini')
+        self.temperature = openai_config.get('temperature', 0.1)
+        self.base_url = openai_config.get('base_url') or None
+        self.max_concurrency = openai_config.get('max_concurrency', 8)
+        self.max_retries = openai_config.get('max_retries', 5)
+        self.backoff_base = openai_config.get('backoff_base', 1.0)
+        self.backoff_max = openai_config.get('backoff_max', 30.0)
+        self.request_timeout = openai_config.get('request_timeout', 60.0)
+        self.expected_completion_tokens = openai_config.get('expected_completion_tokens', 300)
+        self.requests_per_minute = openai_config.get('requests_per_minute')
+        self.tokens_per_minute = openai_config.get('tokens_per_minute')
+
+        self.cache = cache if cache is not None else open_completion_cache(openai_config, data_dir)
+
+        # Traffic counters (cache hits excluded)
+        self.api_requests = 0
+        self.prompt_tokens_sent = 0
+
+        self._client = None
+        self._async_client = None
+        self._semaphore = None
+        # Shared by every event loop the engine runs on, so budgets carry across asyncio.run calls
+        self._rate_limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        self._loop = None
+
+    @property
+    def client(self) -> 'OpenAI':
+        if self._client is None:
+            # Imported on first use: the openai package is slow to import
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.openai_config['api_key'],
+                base_url=self.base_url,
+                timeout=self.request_timeout,
+                max_retries=0
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> 'AsyncOpenAI':
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(
+                api_key=self.openai_config['api_key'],
+                base_url=self.base_url,
+                timeout=self.request_timeout,
+                max_retries=0
+            )
+        return self._async_client
+
+    def _bind_loop(self) -> None:
+        """(Re)create the asyncio primitives for the running event loop; rate-limit state is kept"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._rate_limiter.bind_loop()
+            # The async HTTP client is bound to the loop it was first used on; callers close it
+            # with aclose() before that loop ends, this only drops one that was not closed
+            self._async_client = None
+
+    async def aclose(self) -> None:
+        """Close the async HTTP client; call on its event loop before the loop ends"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def _build_request(self, messages: List[Dict[str, str]], json_mode: bool) -> Dict[str, Any]:
+        request = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': self.temperature,
+        }
+        if json_mode:
+            request['response_format'] = {"type": "json_object"}
+        return request
+
+    def _is_retryable(self, error: Exception) -> bool:
+        from openai import APIStatusError, APIConnectionError, APITimeoutError
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code in RETRYABLE_STATUS
+        return False
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when present"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _count_request(self, messages: List[Dict[str, str]]) -> None:
+        self.api_requests += 1
+        self.prompt_tokens_sent += estimate_message_tokens(messages)
+
+    def _record_success(self, operation: str, started: float, response) -> None:
+        usage = getattr(response, 'usage', None)
+        METRICS.record_llm_call(
+            self.model, operation, time.perf_counter() - started, 'ok',
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0
+        )
+
+    def _record_failure(self, operation: str, started: float, error: Exception, retrying: bool) -> None:
+        reason = str(getattr(error, 'status_code', None) or type(error).__name__)
+        METRICS.record_llm_call(self.model, operation, time.perf_counter() - started, reason)
+        if retrying:
+            METRICS.inc('llm_retries_total', model=self.model, operation=operation, reason=reason)
+
+    def _cached(
+        self,
+        messages: List[Dict[str, str]],
+        json_mode: bool,
+        operation: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Return (cache key, cached content) for a request; both None without a cache"""
+        if self.cache is None:
+            return None, None
+        key = cache_key(
+            self.model, self.temperature, messages, self._build_request(messages, json_mode).get('response_format')
+        )
+        content = self.cache.get(key)
+        METRICS.inc('llm_cache_total', operation=operation, result='miss' if content is None else 'hit')
+        return key, content
+
+    def complete(self, messages: List[Dict[str, str]], json_mode: bool = True, operation: str = 'completion') -> str:
+        """Blocking chat completion with retries; returns the message content
+
+        `operation` labels the call in the run metrics (e.g. 'extract', 'validate').
+        """
+        key, content = self._cached(messages, json_mode, operation)
+        if content is not None:
+            return content
+
+        request = self._build_request(messages, json_mode)
+        for attempt in range(self.max_retries + 1):
+            self._count_request(messages)
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(**request)
+                self._record_success(operation, started, response)
+                content = response.choices[0].message.content
+                if key is not None:
+                    self.cache.put(key, content)
+                return content
+            except Exception as e:
+                retrying = attempt < self.max_retries and self._is_retryable(e)
+                self._record_failure(operation, started, e, retrying)
+                if not retrying:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def acomplete(
+        self,
+        messages: List[Dict[str, str]],
+        json_mode: bool = True,
+        operation: str = 'completion'
+    ) -> str:
+        """Async chat completion bounded by the concurrency and rate limits"""
+        key, content = self._cached(messages, json_mode, operation)
+        if content is not None:
+            return content
+
+        self._bind_loop()
+        request = self._build_request(messages, json_mode)
+        tokens = estimate_message_tokens(messages) + self.expected_completion_tokens
+
+        for attempt in range(self.max_retries + 1):
+            await self._rate_limiter.acquire(tokens)
+            self._count_request(messages)
+            started = None
+            try:
+                async with self._semaphore:
+                    # Latency excludes the wait for a concurrency slot
+                    started = time.perf_counter()
+                    response = await self.async_client.chat.completions.create(**request)
+                self._record_success(operation, started, response)
+                content = response.choices[0].message.content
+                if key is not None:
+                    self.cache.put(key, content)
+                return content
+            except Exception as e:
+                retrying = attempt < self.max_retries and self._is_retryable(e)
+                self._record_failure(operation, started or time.perf_counter(), e, retrying)
+                if not retrying:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
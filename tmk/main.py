@@ -2,17 +2,23 @@ import argparse
 from tmk.set_config import Config
 from tmk.utils import setup_directories, scrape_subreddits, rank_and_report
 from tmk.processor import process_raw_data
+from tmk.metrics import METRICS
 
 def main():
     parser = argparse.ArgumentParser(description='TMK: Clinical Trial Recruitment System')
     parser.add_argument('--config', default='config/default_config.yaml', 
                        help='Path to configuration file')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Processes for parsing raw files (overrides processing.workers)')
     
     args = parser.parse_args()
+    metrics_config = {}
     
     try:
         # Load configuration
         config = Config(args.config)
+        metrics_config = config.config.get('metrics') or {}
+        METRICS.configure(metrics_config)
         
         # Setup directories
         setup_directories(config)
@@ -24,8 +30,9 @@ def main():
         process_raw_data(
             raw_data_dir=config.directories['raw_data'],
             processed_dir=config.directories['processed_data'],
-            db_path=f"{config.directories['data']}/users.pkl",
-            config=config
+            db_path=config.db_path,
+            config=config,
+            workers=args.workers
         )
         
         # Step 3: Generate ranking reports
@@ -36,6 +43,11 @@ def main():
     except Exception as e:
         print(f"\nError during processing: {e}")
         raise
+    finally:
+        # Metrics of failed runs are written too; they are the ones worth reading
+        if metrics_config.get('enabled'):
+            json_path, prom_path = METRICS.write()
+            print(f"\n{METRICS.summary()}\nMetrics written to {json_path} and {prom_path}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
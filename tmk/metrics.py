@@ -0,0 +1,235 @@
+"""Run metrics: stage timings, LLM latency histograms, token usage, cost, retries and cache hits
+
+A process-wide registry (`METRICS`) is filled by the pipeline stages and
+written at the end of a run as JSON and as a Prometheus text-format
+snapshot (suitable for the node-exporter textfile collector).
+
+    with METRICS.stage('process'):
+        ...
+    METRICS.inc('llm_retries_total', model='gpt-4o-mini', reason='429')
+
+Stages listed in `metrics.profile_stages` are also run under cProfile
+(accumulated across repeated runs of the stage, outermost profiled stage
+only) and dumped to `<metrics dir>/<stage>.prof` by write().
+"""
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+
+# USD per 1M tokens (prompt, completion); override or extend via metrics.prices
+DEFAULT_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_DONE = object()
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.prices = dict(DEFAULT_PRICES)
+        self.profile_stages: List[str] = []
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._profiling = False
+        self.output_dir = 'data/metrics'
+        self.started = datetime.now()
+
+    def configure(self, metrics_config: Dict[str, Any] = None) -> None:
+        """Apply the `metrics` config section"""
+        metrics_config = metrics_config or {}
+        self.output_dir = metrics_config.get('dir', self.output_dir)
+        self.profile_stages = list(metrics_config.get('profile_stages') or [])
+        for model, price in (metrics_config.get('prices') or {}).items():
+            self.prices[model] = (price['prompt'], price['completion'])
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters, self.histograms = {}, {}
+            self._profiles = {}
+            self.started = datetime.now()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage (wall clock), profiling it if configured"""
+        # Only one profiler can be active at a time
+        profiler = None
+        if name in self.profile_stages and not self._profiling:
+            profiler = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc('stage_seconds_total', time.perf_counter() - start, stage=name)
+            self.inc('stage_runs_total', stage=name)
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+
+    def timed_iter(self, iterable: Iterable, stage: str) -> Iterator:
+        """Yield from an iterable, timing each step (producer time only) as a stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(stage):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    def record_llm_call(
+        self,
+        model: str,
+        operation: str,
+        seconds: float,
+        status: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0
+    ) -> None:
+        """One API attempt: latency, outcome, token usage (from response.usage) and cost"""
+        self.observe('llm_request_seconds', seconds, model=model, operation=operation)
+        self.inc('llm_requests_total', model=model, operation=operation, status=status)
+        if prompt_tokens or completion_tokens:
+            self.inc('llm_prompt_tokens_total', prompt_tokens, model=model, operation=operation)
+            self.inc('llm_completion_tokens_total', completion_tokens, model=model, operation=operation)
+            prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+            cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+            self.inc('llm_cost_usd_total', cost, model=model, operation=operation)
+
+    def total(self, name: str, **labels) -> float:
+        """Sum of a counter over all series matching the given labels"""
+        wanted = set(_labels(labels))
+        return sum(v for k, v in self.counters.get(name, {}).items() if wanted <= set(k))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'started': self.started.isoformat(),
+                'finished': datetime.now().isoformat(),
+                'counters': {
+                    name: [{'labels': dict(k), 'value': v} for k, v in series.items()]
+                    for name, series in self.counters.items()
+                },
+                'histograms': {
+                    name: [{
+                        'labels': dict(k), 'count': h.count, 'sum': h.sum,
+                        'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'p99': h.quantile(0.99),
+                        'buckets': dict(zip([str(b) for b in h.buckets] + ['+Inf'], h.counts)),
+                    } for k, h in series.items()]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def prometheus_text(self, prefix: str = 'tmk_') -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{prefix}{name}{_format_labels(labels)} {value:.6g}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for labels, h in series.items():
+                    cumulative = 0
+                    for bound, n in zip([str(b) for b in h.buckets] + ['+Inf'], h.counts):
+                        cumulative += n
+                        lines.append(f"{prefix}{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {h.sum:.6g}")
+                    lines.append(f"{prefix}{name}_count{_format_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: str = None) -> Tuple[str, str]:
+        """Write <dir>/run_<timestamp>.json, <dir>/tmk.prom and stage profiles; returns the first two paths"""
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"run_{self.started.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(json_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        prom_path = os.path.join(output_dir, 'tmk.prom')
+        with open(prom_path + '.tmp', 'w') as f:
+            f.write(self.prometheus_text())
+        # Atomic replace, so a scraping collector never reads a partial file
+        os.replace(prom_path + '.tmp', prom_path)
+        for stage, profiler in self._profiles.items():
+            profiler.dump_stats(os.path.join(output_dir, f"{stage}.prof"))
+        return json_path, prom_path
+
+    def summary(self) -> str:
+        stages = ", ".join(
+            f"{dict(k)['stage']} {v:.1f}s" for k, v in self.counters.get('stage_seconds_total', {}).items()
+        )
+        return (f"Stages: {stages or 'none'}\n"
+                f"LLM: {self.total('llm_requests_total'):.0f} requests, "
+                f"{self.total('llm_retries_total'):.0f} retries, "
+                f"{self.total('llm_cache_total', result='hit'):.0f} cache hits, "
+                f"{self.total('llm_prompt_tokens_total'):.0f} prompt + "
+                f"{self.total('llm_completion_tokens_total'):.0f} completion tokens, "
+                f"~${self.total('llm_cost_usd_total'):.4f}")
+
+
+METRICS = Metrics()
@@ -0,0 +1,242 @@
+"""Local relevance pre-filter that runs before any LLM call
+
+Two scorers, usable alone or together:
+- KeywordMatcher: one compiled, case-insensitive regex over illness,
+  treatment and money/trial vocabulary (word-bounded, longest terms first),
+  counting hits per category.
+- HashedTfidfModel: unigrams and bigrams hashed into a fixed number of
+  buckets, TF-IDF weighted, scored by a logistic-regression model trained
+  on a labeled sample.
+
+In 'both' mode a user passes if either scorer accepts them, which favours
+recall: a skipped user is a lost recruitment target, a kept one only costs
+an LLM call.
+
+Usage:
+    python -m tmk.prefilter train labeled.jsonl data/prefilter_model.npz
+    python -m tmk.prefilter audit labeled.jsonl [--config config/default_config.yaml]
+
+Labeled files are JSONL with {"text": ..., "label": 0 or 1} per user.
+"""
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+import argparse
+import json
+import re
+import zlib
+import numpy as np
+
+DEFAULT_VOCABULARY = {
+    'illness': [
+        'chronic pain', 'fibromyalgia', 'lupus', 'arthritis', 'migraine', 'diabetes', 'cancer',
+        'multiple sclerosis', 'crohn', "crohn's", 'ibs', 'endometriosis', 'neuropathy',
+        'depression', 'anxiety', 'chronic fatigue', 'me/cfs', 'eds', 'diagnosed',
+        'diagnosis', 'flare', 'flare-up', 'symptoms', 'condition', 'illness', 'disease', 'syndrome',
+    ],
+    'treatment': [
+        'treatment', 'medication', 'meds', 'prescribed', 'prescription', 'doctor', 'rheumatologist',
+        'neurologist', 'specialist', 'therapy', 'physical therapy', 'surgery', 'infusion', 'dose',
+        'dosage', 'side effects', 'gabapentin', 'lyrica', 'duloxetine', 'cymbalta', 'opioids',
+        'steroids', 'biologic', 'biologics', 'ldn', 'naltrexone', 'insurance',
+    ],
+    'money': [
+        'clinical trial', 'clinical trials', 'trial', 'trials', 'study', 'studies', 'research study',
+        'paid study', 'compensation', 'compensated', 'paid', 'pay', 'money', 'income', 'side hustle',
+        'passive income', 'earn', 'stipend', 'volunteer', 'participant', 'enroll', 'enrolled',
+    ],
+}
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+class KeywordMatcher:
+    def __init__(self, vocabulary: Dict[str, List[str]] = None):
+        vocabulary = vocabulary or DEFAULT_VOCABULARY
+        self.categories = {}
+        for category, terms in vocabulary.items():
+            for term in terms:
+                self.categories.setdefault(term.lower(), category)
+        # Longest first, so 'clinical trials' wins over 'trial' at the same position
+        alternation = '|'.join(re.escape(t) for t in sorted(self.categories, key=len, reverse=True))
+        self.pattern = re.compile(rf"(?<![\w/-])(?:{alternation})(?![\w/-])", re.IGNORECASE)
+
+    def hits(self, text: str) -> Dict[str, int]:
+        """Matched-term counts per category"""
+        counts = {}
+        for match in self.pattern.finditer(text):
+            category = self.categories[match.group(0).lower()]
+            counts[category] = counts.get(category, 0) + 1
+        return counts
+
+
+def _features(text: str) -> List[str]:
+    tokens = _TOKEN.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class HashedTfidfModel:
+    """Logistic regression over hashed, TF-IDF weighted unigrams and bigrams"""
+
+    def __init__(self, n_features: int = 1 << 18):
+        self.n_features = n_features
+        self.idf = np.ones(n_features, dtype=np.float32)
+        self.weights = np.zeros(n_features, dtype=np.float32)
+        self.bias = 0.0
+
+    def _buckets(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Bucket indices and sublinear term frequencies of a text"""
+        counts = {}
+        for feature in _features(text):
+            bucket = zlib.crc32(feature.encode('utf-8')) % self.n_features
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if not counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        return buckets, tf
+
+    def _vector(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        buckets, tf = self._buckets(text)
+        values = tf * self.idf[buckets]
+        norm = np.linalg.norm(values)
+        return buckets, values / norm if norm else values
+
+    def predict_proba(self, text: str) -> float:
+        buckets, values = self._vector(text)
+        z = float(values @ self.weights[buckets]) + self.bias
+        return 1 / (1 + np.exp(-z))
+
+    def fit(self, texts: List[str], labels: List[int], epochs: int = 10, learning_rate: float = 0.5,
+            l2: float = 1e-6, seed: int = 0) -> 'HashedTfidfModel':
+        """Learn IDF weights from the sample, then train with SGD on the log loss"""
+        document_frequency = np.zeros(self.n_features, dtype=np.float32)
+        for text in texts:
+            document_frequency[self._buckets(text)[0]] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        vectors = [self._vector(text) for text in texts]
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            for i in rng.permutation(len(vectors)):
+                buckets, values = vectors[i]
+                z = float(values @ self.weights[buckets]) + self.bias
+                gradient = 1 / (1 + np.exp(-z)) - labels[i]
+                self.weights[buckets] -= learning_rate * (gradient * values + l2 * self.weights[buckets])
+                self.bias -= learning_rate * gradient
+        return self
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, idf=self.idf, weights=self.weights, bias=np.array([self.bias]))
+
+    @classmethod
+    def load(cls, path: str) -> 'HashedTfidfModel':
+        data = np.load(path)
+        model = cls(n_features=len(data['weights']))
+        model.idf, model.weights, model.bias = data['idf'], data['weights'], float(data['bias'][0])
+        return model
+
+
+class RelevanceFilter:
+    def __init__(self, prefilter_config: Dict[str, Any] = None):
+        """Configure from the `prefilter` config section
+
+        mode: 'keyword', 'model' or 'both'
+        min_keyword_hits: total vocabulary hits needed to pass
+        min_categories: distinct categories (illness/treatment/money) needed to pass
+        model_path / model_threshold: trained HashedTfidfModel and its cut-off
+        """
+        prefilter_config = prefilter_config or {}
+        self.mode = prefilter_config.get('mode', 'keyword')
+        if self.mode not in ('keyword', 'model', 'both'):
+            raise ValueError(f"Unknown prefilter mode: {self.mode}")
+        self.min_keyword_hits = prefilter_config.get('min_keyword_hits', 1)
+        self.min_categories = prefilter_config.get('min_categories', 1)
+        self.model_threshold = prefilter_config.get('model_threshold', 0.5)
+        self.matcher = KeywordMatcher(prefilter_config.get('vocabulary'))
+        self.model: Optional[HashedTfidfModel] = None
+        if self.mode != 'keyword':
+            if not prefilter_config.get('model_path'):
+                raise ValueError(f"prefilter mode '{self.mode}' requires prefilter.model_path")
+            self.model = HashedTfidfModel.load(prefilter_config['model_path'])
+        self.stats = {'kept': 0, 'skipped': 0}
+
+    def keyword_pass(self, text: str) -> bool:
+        hits = self.matcher.hits(text)
+        return sum(hits.values()) >= self.min_keyword_hits and len(hits) >= self.min_categories
+
+    def model_pass(self, text: str) -> bool:
+        return self.model.predict_proba(text) >= self.model_threshold
+
+    def is_relevant(self, text: str) -> bool:
+        if self.mode == 'keyword':
+            return self.keyword_pass(text)
+        if self.mode == 'model':
+            return self.model_pass(text)
+        return self.keyword_pass(text) or self.model_pass(text)
+
+    def filter_users(self, user_contents: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Keep only users whose content passes the filter"""
+        kept = {
+            username: contents for username, contents in user_contents.items()
+            if self.is_relevant("\n".join(c['content'] for c in contents))
+        }
+        self.stats['kept'] += len(kept)
+        self.stats['skipped'] += len(user_contents) - len(kept)
+        return kept
+
+
+def audit(relevance_filter: RelevanceFilter, samples: Iterable[Tuple[str, int]]) -> Dict[str, float]:
+    """Recall, precision and pass rate of the filter on a labeled sample"""
+    tp = fp = fn = tn = 0
+    for text, label in samples:
+        passed = relevance_filter.is_relevant(text)
+        if passed and label:
+            tp += 1
+        elif passed:
+            fp += 1
+        elif label:
+            fn += 1
+        else:
+            tn += 1
+    total = tp + fp + fn + tn
+    return {
+        'samples': total,
+        'recall': tp / (tp + fn) if tp + fn else 1.0,
+        'precision': tp / (tp + fp) if tp + fp else 1.0,
+        'pass_rate': (tp + fp) / total if total else 0.0,
+    }
+
+
+def read_labeled(path: str) -> List[Tuple[str, int]]:
+    with open(path) as f:
+        return [(row['text'], int(row['label'])) for row in map(json.loads, f) if row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or audit the LLM pre-filter")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train = subparsers.add_parser('train', help='Train the hashed TF-IDF model on a labeled JSONL sample')
+    train.add_argument('labeled')
+    train.add_argument('model_path')
+    train.add_argument('--epochs', type=int, default=10)
+    audit_parser = subparsers.add_parser('audit', help='Measure recall of the configured filter on a labeled sample')
+    audit_parser.add_argument('labeled')
+    audit_parser.add_argument('--config', default='config/default_config.yaml')
+    args = parser.parse_args()
+
+    samples = read_labeled(args.labeled)
+    if args.command == 'train':
+        texts, labels = zip(*samples)
+        HashedTfidfModel().fit(list(texts), list(labels), epochs=args.epochs).save(args.model_path)
+        print(f"Trained on {len(samples)} samples; saved {args.model_path}")
+        return
+
+    import yaml
+    with open(args.config) as f:
+        prefilter_config = yaml.safe_load(f).get('prefilter', {})
+    report = audit(RelevanceFilter(prefilter_config), samples)
+    print(f"{report['samples']} samples: recall {report['recall']:.1%}, "
+          f"precision {report['precision']:.1%}, pass rate {report['pass_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
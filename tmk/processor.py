@@ -1,126 +1,719 @@
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Callable, Optional, TYPE_CHECKING
+import asyncio
 import os
 import glob
-import pandas as pd
+import time
+from collections import deque
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from tmk.base_extractor import BaseFeatureExtractor
 from tmk.validation import FeatureValidator
-from tmk.user import create_user_record
-from tmk.database import init_db, upsert_user, save_db
+from tmk.llm_engine import LLMEngine, pack_batches, estimate_tokens
+from tmk.chunker import build_user_chunks
+from tmk.raw_reader import iter_comments
+from tmk.raw_format import iter_raw_file, list_raw_files, marker_name
+from tmk.user import (
+    create_user_record, merge_features, combine_features, parse_list_field, summarize_profile, GRAPH_FIELDS
+)
+from tmk.database import init_db, upsert_user, save_db, load_db, get_user, update_columns, as_frame
+from tmk.leaderboard import open_leaderboards
+from tmk.prefilter import RelevanceFilter
+from tmk.dedup import DedupIndex, open_dedup_index
+from tmk.metrics import METRICS, FAST_BUCKETS
+from tmk.journal import Journal, open_journal
+from tmk.conversation import CommentIndex
+from tmk.content_store import ContentStore
 
-def _process_comment_tree(comment_data, user_contents):
-    """Process hierarchical comment data"""
-    # Skip deleted/removed comments or those without authors
-    if not comment_data.get('author') or comment_data['author'] in ['[deleted]', '[removed]']:
+if TYPE_CHECKING:
+    from tmk.reply_graph import ReplyGraph
+
+def aggregate_user_contents(
+    posts: Iterable[Dict[str, Any]],
+    comment_index: CommentIndex = None
+) -> ContentStore:
+    """Group posts and comments by author, consuming posts as a stream
+
+    Items go into a compact ContentStore (typed columns, interned subreddits,
+    bodies in one UTF-8 buffer) that reads like `{author: [content dict, ...]}`.
+    If a comment index is given, every post and comment (including unchanged
+    context and deleted authors) is also appended to it in the same pass, and
+    each stored item keeps its index row.
+    """
+    user_contents = ContentStore()
+    for post in posts:
+        row = thread = -1
+        if comment_index is not None:
+            row = thread = comment_index.add(post, -1, post.get('subreddit_type'), is_post=True)
+        # Process post (incremental scrapes tag already-ingested context as unchanged)
+        if post.get('author') and post.get('delta') != 'unchanged':
+            user_contents.add(
+                post['author'], post.get('id'), f"Title: {post['title']}\n{post['text']}", post['score'],
+                post['subreddit'], post['subreddit_type'], index_row=row
+            )
+
+        # Process comment tree
+        for comment in iter_comments(post):
+            # Comments inherit the subreddit of their post
+            subreddit_type = comment.get('subreddit_type') or post.get('subreddit_type')
+            if comment_index is not None:
+                row = comment_index.add(comment, thread, subreddit_type)
+            # Skip deleted/removed comments or those without authors
+            author = comment.get('author')
+            if not author or author in ['[deleted]', '[removed]'] or comment.get('delta') == 'unchanged':
+                continue
+
+            user_contents.add(
+                author, comment.get('id'), comment.get('text', ''), comment.get('score', 0),
+                comment.get('subreddit') or post.get('subreddit'), subreddit_type,
+                depth=comment.get('depth', 0), index_row=row
+            )
+    return user_contents
+
+def _aggregate_file(path: str) -> Tuple[ContentStore, CommentIndex]:
+    """Parse one raw file into its partial per-author aggregate and comment index (runs in pool workers)"""
+    comment_index = CommentIndex()
+    user_contents = aggregate_user_contents(iter_raw_file(path), comment_index)
+    return user_contents, comment_index.freeze()
+
+def iter_file_aggregates(
+    paths: List[str],
+    workers: int = 1
+) -> Iterator[Tuple[str, ContentStore, CommentIndex]]:
+    """Yield (path, per-author aggregate, comment index) for each raw file, in input order
+
+    With workers > 1, files are parsed and aggregated in a process pool while
+    the caller consumes earlier results; at most 2 * workers partials are in
+    flight, so a slow consumer does not let parsed files pile up in memory.
+    Results are yielded strictly in input order, so merging them downstream
+    is deterministic and identical to a single-process run.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield (path, *_aggregate_file(path))
         return
-        
-    # Add comment to user's content
-    if comment_data['author'] not in user_contents:
-        user_contents[comment_data['author']] = []
-    
-    user_contents[comment_data['author']].append({
-        'content': comment_data.get('text', ''),
-        'score': comment_data.get('score', 0),
-        'depth': comment_data.get('depth', 0),
-        'parent_id': comment_data.get('parent_id'),
-        'subreddit': comment_data.get('subreddit'),
-        'subreddit_type': comment_data.get('subreddit_type')
-    })
-    
-    # Process replies recursively
-    for reply in comment_data.get('replies', []):
-        _process_comment_tree(reply, user_contents)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(paths)
+        in_flight = deque()
+        for path in remaining:
+            in_flight.append((path, pool.submit(_aggregate_file, path)))
+            if len(in_flight) >= 2 * workers:
+                break
+        while in_flight:
+            path, future = in_flight.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                in_flight.append((next_path, pool.submit(_aggregate_file, next_path)))
+            yield (path, *future.result())
+
+def _run_async(coro, engine: LLMEngine = None):
+    """Run a coroutine to completion, also from inside an already running loop (e.g. Jupyter)
+
+    engine: its async HTTP client is closed before the coroutine's loop ends
+    """
+    if engine is not None:
+        coro = _closing_engine(coro, engine)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+async def _closing_engine(coro, engine: LLMEngine):
+    try:
+        return await coro
+    finally:
+        await engine.aclose()
+
+async def _extract_and_validate(
+    extractor: BaseFeatureExtractor,
+    validator: FeatureValidator,
+    username: str,
+    chunks: List[str],
+    previous: Dict[str, Any] = None
+) -> Optional[Dict[str, Any]]:
+    """Extract then validate one user's features; runs concurrently with other users
+
+    Prolific users arrive as several chunks: each chunk is extracted and validated
+    against its own text in parallel, then the chunk results are reduced into one profile.
+    Returns None if any call failed after retries, so the user is left for the next run.
+    """
+    async def extract_and_validate_chunk(text: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        features = await extractor.aextract_features(text)
+        if features is None:
+            return False, None
+        return await validator.avalidate_selected(username, text, features, previous)
+
+    results = await asyncio.gather(*(extract_and_validate_chunk(chunk) for chunk in chunks))
+    if any(features is None for _, features in results):
+        return None
+    is_valid = all(valid for valid, _ in results)
+    if len(results) == 1:
+        validated_features = results[0][1]
+    else:
+        validated_features = combine_features([
+            (features, estimate_tokens(chunk)) for (_, features), chunk in zip(results, chunks)
+        ])
+
+    if not is_valid:
+        print(f"Warning: Potential hallucinations in features for user {username}")
+
+    return validated_features
+
+async def _extract_and_validate_batch(
+    extractor: BaseFeatureExtractor,
+    validator: FeatureValidator,
+    user_texts: Dict[str, str],
+    previous: Dict[str, Dict[str, Any]] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Extract then validate a packed batch of users, falling back to single calls for omissions
+
+    Users whose extraction or validation failed map to None.
+    """
+    previous = previous or {}
+    if len(user_texts) == 1:
+        username, text = next(iter(user_texts.items()))
+        return {username: await _extract_and_validate(extractor, validator, username, [text], previous.get(username))}
+
+    features = await extractor.aextract_features_batch(user_texts)
+    missing = [u for u in user_texts if u not in features]
+    fallback = await asyncio.gather(*(extractor.aextract_features(user_texts[u]) for u in missing))
+    features.update(zip(missing, fallback))
+
+    validations = await validator.avalidate_selected_batch(
+        {u: (user_texts[u], features[u]) for u in user_texts if features[u] is not None}, previous
+    )
+
+    results = {}
+    for username in user_texts:
+        is_valid, validated_features = validations.get(username, (True, None))
+        if not is_valid:
+            print(f"Warning: Potential hallucinations in features for user {username}")
+        results[username] = validated_features
+    return results
+
+async def _process_users(
+    extractor: BaseFeatureExtractor,
+    validator: FeatureValidator,
+    user_chunks: Dict[str, List[str]],
+    batching: Dict[str, Any] = None,
+    previous: Dict[str, Dict[str, Any]] = None,
+    on_result: Callable[[str, Dict[str, Any]], None] = None
+) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Pipeline extraction and validation across all users of a file
+
+    previous: stored profiles of returning users, for change-based validation
+    on_result: called with (username, validated_features) as soon as each user is done;
+        users whose extraction or validation failed (features None) are not reported
+    """
+    previous = previous or {}
+    usernames = list(user_chunks)
+
+    async def single(username: str) -> Dict[str, Any]:
+        features = await _extract_and_validate(
+            extractor, validator, username, user_chunks[username], previous.get(username)
+        )
+        if on_result is not None and features is not None:
+            on_result(username, features)
+        return features
+
+    async def batch(batch_users: List[str]) -> Dict[str, Dict[str, Any]]:
+        results = await _extract_and_validate_batch(
+            extractor, validator, {u: single_chunks[u] for u in batch_users},
+            {u: previous[u] for u in batch_users if u in previous}
+        )
+        if on_result is not None:
+            for username, features in results.items():
+                if features is not None:
+                    on_result(username, features)
+        return results
+
+    if not batching or not batching.get('enabled'):
+        results = await asyncio.gather(*(single(username) for username in usernames))
+        return list(zip(usernames, results))
+
+    # Only single-chunk users are packed; prolific users go through map-reduce
+    single_chunks = {u: chunks[0] for u, chunks in user_chunks.items() if len(chunks) == 1}
+    batches = pack_batches(
+        single_chunks,
+        token_budget=batching.get('token_budget', 3000),
+        max_items=batching.get('max_users', 20)
+    )
+    chunked = [u for u in usernames if u not in single_chunks]
+
+    merged = {}
+    batch_results, chunked_results = await asyncio.gather(
+        asyncio.gather(*(batch(batch_users) for batch_users in batches)),
+        asyncio.gather(*(single(u) for u in chunked))
+    )
+    for batch_result in batch_results:
+        merged.update(batch_result)
+    merged.update(zip(chunked, chunked_results))
+    return [(username, merged[username]) for username in usernames]
+
+def _report_throughput(n_users: int, elapsed: float, requests: int, prompt_tokens: int, mode: str) -> None:
+    if not n_users:
+        return
+    users_per_minute = n_users / elapsed * 60 if elapsed > 0 else float('inf')
+    print(f"Extracted {n_users} users in {elapsed:.1f}s ({mode} mode): "
+          f"{users_per_minute:.0f} users/min, {requests} API requests, "
+          f"~{prompt_tokens / n_users:.0f} prompt tokens/user")
+
+def _ingest_user_contents(
+    user_contents: Dict[str, List[Dict[str, Any]]],
+    users_df,
+    extractor: BaseFeatureExtractor,
+    validator: FeatureValidator,
+    openai_config: Dict[str, Any],
+    leaderboards=None,
+    relevance_filter: RelevanceFilter = None,
+    dedup_index: DedupIndex = None,
+    journal: Journal = None,
+    checkpoint: Callable[[Any], None] = None,
+    checkpoint_every: int = None,
+    comment_index: CommentIndex = None,
+    reply_graph: 'ReplyGraph' = None
+) -> Tuple[Any, List[str]]:
+    """Extract, validate and merge the new content of each user into the user DB
+
+    Returns the updated store and the users whose extraction or validation
+    failed after retries. Those users are not upserted, so their content IDs
+    stay unrecorded and the content is extracted again on the next run.
+
+    New items that near-duplicate earlier content are collapsed first (if a
+    dedup index is given), so they reach neither prompts nor engagement
+    metrics. New users whose content fails the relevance filter (if given) are
+    not sent to the LLM; users already in the DB always are, so their stored
+    profile keeps up with their engagement. Every upserted record is also folded into the
+    leaderboards, if given.
+
+    With a journal, each user's results are journaled as they arrive and
+    users already journaled for this file are replayed without LLM calls;
+    users are then processed in slices of `checkpoint_every`, calling
+    `checkpoint(users_df)` between slices.
+
+    With the comment index of the content's file, each record also gets the
+    conversation metrics (depth, threads, replies given) of its new items.
+    Slice by slice, the replies of the upserted users are credited to their
+    recipients' replies_received (stored recipients are updated even without
+    new items of their own) and added to the reply graph, if given, so a
+    checkpointed store or graph never counts replies of unsaved users.
+    """
+    engine = extractor.engine
+    batching = openai_config.get('batching') or {}
+    max_chunk_tokens = openai_config.get('max_chunk_tokens')
+
+    # Keep only content not yet ingested for each user
+    deltas, existing_users, prior_summaries = {}, {}, {}
+    with METRICS.stage('delta'):
+        for username, contents in user_contents.items():
+            existing = get_user(users_df, username)
+            seen = set(parse_list_field(existing.get('content_ids'))) if existing else set()
+            delta = [c for c in contents if c.get('id') is None or c['id'] not in seen]
+            if not delta:
+                continue
+            deltas[username] = delta
+            if existing:
+                existing_users[username] = existing
+                prior_summaries[username] = summarize_profile(existing)
+
+    total_items = sum(len(c) for c in user_contents.values())
+    delta_items = sum(len(c) for c in deltas.values())
+    METRICS.inc('items_total', total_items, kind='seen')
+    METRICS.inc('items_total', delta_items, kind='new')
+    print(f"{delta_items}/{total_items} items are new; {len(deltas)} of {len(user_contents)} users have new content")
+
+    if dedup_index is not None and deltas:
+        collapsed_before = dedup_index.stats['collapsed']
+        with METRICS.stage('dedup'):
+            deltas = dedup_index.collapse(deltas)
+        METRICS.inc('items_total', dedup_index.stats['collapsed'] - collapsed_before, kind='collapsed')
+        print(f"Collapsed {dedup_index.stats['collapsed'] - collapsed_before} near-duplicate items")
+
+    if relevance_filter is not None and deltas:
+        # Only users not yet profiled are judged; stored profiles keep merging their engagement
+        candidates = {username: contents for username, contents in deltas.items() if username not in existing_users}
+        with METRICS.stage('prefilter'):
+            kept = relevance_filter.filter_users(candidates)
+        deltas = {username: contents for username, contents in deltas.items()
+                  if username in existing_users or username in kept}
+        skipped = len(candidates) - len(kept)
+        METRICS.inc('users_total', skipped, outcome='prefiltered')
+        # One extraction and one validation call per user in single mode
+        print(f"Pre-filter skipped {skipped}/{len(candidates)} new users (~{2 * skipped} LLM calls saved)")
+
+    # Conversation structure of the new items, in one vectorized pass over the file's index
+    conversation = {}
+    if comment_index is not None and deltas:
+        with METRICS.stage('conversation'):
+            new_rows = (c.index_row for contents in deltas.values() for c in contents)
+            conversation = comment_index.metrics(comment_index.mask(new_rows))
+
+    if validator.policy.top_n_only:
+        validator.policy.candidate_filter = _top_n_candidates(leaderboards, deltas, existing_users, conversation)
+
+    # Users journaled before a crash are replayed instead of paid for again
+    replayed, on_result = {}, None
+    if journal is not None:
+        for username in deltas:
+            features = journal.replay(username, _content_ids(deltas[username]))
+            if features is not None:
+                replayed[username] = features
+        if replayed:
+            print(f"Resuming: replayed {len(replayed)} users from the journal")
+
+        def on_result(username: str, features: Dict[str, Any]) -> None:
+            journal.append(username, _content_ids(deltas[username]), features)
+
+    usernames = list(deltas)
+    failed, upserted = [], set()
+    # Replies received by users whose record is still to be built in this call
+    pending_received: Dict[str, int] = {}
+    step = checkpoint_every or max(len(usernames), 1)
+    for offset in range(0, len(usernames), step):
+        part = usernames[offset:offset + step]
+        # Prompts are assembled per slice, so only one slice's texts are held at a time
+        with METRICS.stage('chunk'):
+            pending = {
+                username: build_user_chunks(deltas[username], prior_summaries.get(username, ""), max_chunk_tokens)
+                for username in part if username not in replayed
+            }
+        n_chunked = sum(len(chunks) > 1 for chunks in pending.values())
+        if n_chunked:
+            print(f"Splitting {n_chunked} prolific users into chunks of ~{max_chunk_tokens} tokens")
+        start, requests, tokens = time.perf_counter(), engine.api_requests, engine.prompt_tokens_sent
+        with METRICS.stage('extract_validate'):
+            extracted = dict(_run_async(
+                _process_users(extractor, validator, pending, batching, existing_users, on_result), engine
+            ))
+        _report_throughput(
+            len(pending), time.perf_counter() - start,
+            engine.api_requests - requests, engine.prompt_tokens_sent - tokens,
+            'batched' if batching.get('enabled') else 'single'
+        )
+
+        # Process each user
+        part_failed = [username for username in part if username not in replayed and extracted[username] is None]
+        if part_failed:
+            print(f"Extraction failed for {len(part_failed)} users; their content will be retried next run")
+            failed.extend(part_failed)
+            part = [username for username in part if username not in part_failed]
+        with METRICS.stage('upsert'):
+            for username in part:
+                validated_features = replayed[username] if username in replayed else extracted[username]
+                user_conversation = conversation.get(username)
+                if comment_index is not None:
+                    # Received replies are credited as they are ingested, below
+                    user_conversation = dict(user_conversation or {}, replies_received=pending_received.pop(username, 0))
+                user_record = _build_record(
+                    username, validated_features, deltas[username], existing_users.get(username),
+                    user_conversation
+                )
+                started = time.perf_counter()
+                users_df = upsert_user(users_df, user_record)
+                METRICS.observe('upsert_seconds', time.perf_counter() - started, buckets=FAST_BUCKETS)
+                if leaderboards is not None:
+                    leaderboards.update(user_record)
+        upserted.update(part)
+        METRICS.inc('users_total', len(part), outcome='upserted')
+        METRICS.inc('users_total', len(part_failed), outcome='failed')
+        if comment_index is not None:
+            part_mask = comment_index.mask(c.index_row for username in part for c in deltas[username])
+            for recipient, count in _received_replies(comment_index, part_mask).items():
+                if recipient in deltas and recipient not in upserted:
+                    pending_received[recipient] = pending_received.get(recipient, 0) + count
+                else:
+                    users_df = _credit_replies(users_df, recipient, count, leaderboards)
+            if reply_graph is not None:
+                reply_graph.add_replies(comment_index, part_mask)
+
+        if checkpoint is not None and offset + step < len(usernames):
+            checkpoint(users_df)
+
+    # Replies to users whose extraction failed
+    for recipient, count in pending_received.items():
+        users_df = _credit_replies(users_df, recipient, count, leaderboards)
+
+    return users_df, failed
+
+def _received_replies(comment_index: CommentIndex, mask) -> Dict[str, int]:
+    """Number of masked replies each recipient got"""
+    authors, _, recipients = comment_index.reply_pairs(mask)
+    codes, counts = np.unique(recipients, return_counts=True)
+    return {authors[code]: count for code, count in zip(codes.tolist(), counts.tolist())}
+
+def _credit_replies(users_df, username: str, count: int, leaderboards=None):
+    """Add replies to a stored user's replies_received (users not in the store are skipped)"""
+    record = get_user(users_df, username)
+    if record is None:
+        return users_df
+    received = record.get('replies_received')
+    # Rows from before the column existed hold None or NaN
+    record['replies_received'] = (0 if received is None or received != received else int(received)) + count
+    users_df = upsert_user(users_df, record)
+    if leaderboards is not None:
+        leaderboards.update(record)
+    return users_df
+
+def _content_ids(contents: List[Dict[str, Any]]) -> List[str]:
+    return [c.get('id') for c in contents]
+
+def _build_record(
+    username: str,
+    validated_features: Dict[str, Any],
+    contents: List[Dict[str, Any]],
+    existing: Dict[str, Any] = None,
+    conversation: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """User record for a content delta, merged into the stored profile if there is one"""
+    if conversation:
+        validated_features.update(conversation)
+    new_ids = [c['id'] for c in contents if c.get('id') is not None]
+    score_sum = sum(c['score'] for c in contents)
+
+    if existing:
+        # Merge the delta into the stored profile
+        validated_features['content_ids'] = new_ids
+        features = merge_features(existing, validated_features, len(contents), score_sum)
+        created_at = existing.get('created_at')
+    else:
+        # Add engagement metrics
+        features = validated_features
+        features['num_comments'] = len(contents)
+        features['avg_score'] = score_sum / len(contents)
+        features['content_ids'] = new_ids
+        created_at = None
+
+    # Create user record
+    return create_user_record(
+        user_id=username,
+        username=username,
+        features=features,
+        created_at=created_at
+    )
+
+def _top_n_candidates(leaderboards, deltas, existing_users, conversation):
+    """Policy hook: whether a user's provisional record could enter a top-N leaderboard"""
+    if leaderboards is None or leaderboards.is_stale():
+        # Without current leaderboards nobody can be ruled out
+        return None
+
+    def is_candidate(username: str, features: Dict[str, Any]) -> bool:
+        record = _build_record(
+            username, dict(features), deltas[username], existing_users.get(username), conversation.get(username)
+        )
+        return leaderboards.would_rank(record)
+    return is_candidate
+
+def _score_reply_graph(reply_graph: 'ReplyGraph', users_df, leaderboards=None):
+    """Rescore the reply graph and write its columns to every user in it"""
+    columns = reply_graph.score()
+    users_df = update_columns(users_df, reply_graph.users, columns)
+    n_communities = len(set(columns['community_id'].tolist()))
+    print(f"Reply graph: {len(reply_graph)} users, {reply_graph.n_edges} edges, {n_communities} communities")
+    if leaderboards is not None and set(GRAPH_FIELDS) & {key.partition(':')[0] for key in leaderboards.keys}:
+        # Every user's graph score moved, which incremental updates cannot track
+        leaderboards.rebuild(as_frame(users_df))
+    return users_df
+
+def _report_validation(validator: FeatureValidator) -> None:
+    print(f"Validation: {validator.policy.report()}")
+
+def _open_db(db_path: str):
+    """Load the user DB, or initialize one for the path's backend"""
+    if os.path.exists(db_path):
+        return load_db(db_path)
+    return init_db(path=db_path)
+
+def _open_prefilter(config: Dict[str, Any]):
+    """The configured relevance filter, or None when prefilter.enabled is off"""
+    prefilter_config = config.get('prefilter') or {}
+    return RelevanceFilter(prefilter_config) if prefilter_config.get('enabled') else None
+
+def _open_reply_graph(config: Dict[str, Any], data_dir: str) -> Optional['ReplyGraph']:
+    """The configured reply graph, or None when graph.enabled is off"""
+    if not (config.get('graph') or {}).get('enabled'):
+        return None
+    # Imported only when enabled: the graph module pulls in scipy, which is slow to import
+    from tmk.reply_graph import open_reply_graph
+    return open_reply_graph(config, data_dir)
+
+def _report_prefilter(relevance_filter) -> None:
+    if relevance_filter is not None:
+        stats = relevance_filter.stats
+        print(f"Pre-filter: kept {stats['kept']}, skipped {stats['skipped']} new users")
+
+def _report_dedup(dedup_index) -> None:
+    if dedup_index is not None:
+        stats = dedup_index.stats
+        print(f"Dedup: collapsed {stats['collapsed']} of {stats['checked']} checked items "
+              f"(~{stats['tokens_saved']} prompt tokens saved; {len(dedup_index)} items indexed)")
+        dedup_index.close()
+
+def _report_journal(journal: Journal) -> None:
+    stats = journal.stats
+    if stats['replayed']:
+        print(f"Journal: replayed {stats['replayed']} users, journaled {stats['appended']}")
+    journal.close()
+
+def _report_cache(engine: LLMEngine) -> None:
+    if engine.cache is not None:
+        stats = engine.cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate, {stats['entries']} entries)")
 
 def process_raw_data(
     raw_data_dir: str = "raw_data",
     processed_dir: str = "processed_data",
     db_path: str = "data/users.pkl",
     config = None,
+    workers: int = None,
 ) -> None:
-    """Process raw data files and update database"""
-    extractor = BaseFeatureExtractor(config.config)
-    validator = FeatureValidator(config.config)
+    """Process raw data files and update database
+
+    workers: processes used to parse and aggregate raw files (default:
+    processing.workers). Partial aggregates are merged into the DB one file
+    at a time in file order, so the result matches a single-process run.
+    """
+    if workers is None:
+        workers = config.config.get('processing', {}).get('workers', 1)
+    engine = LLMEngine(config.config['openai'], data_dir=os.path.dirname(db_path))
+    extractor = BaseFeatureExtractor(config.config, engine=engine)
+    validator = FeatureValidator(config.config, engine=engine)
     
     # Initialize or load database
-    if os.path.exists(db_path):
-        users_df = pd.read_pickle(db_path)
-    else:
-        users_df = init_db()
+    users_df = _open_db(db_path)
+    leaderboards = open_leaderboards(config.config.get('ranking', {}), os.path.dirname(db_path))
+    relevance_filter = _open_prefilter(config.config)
+    dedup_index = open_dedup_index(config.config, os.path.dirname(db_path))
+    processing_config = config.config.get('processing', {})
+    journal = open_journal(processing_config, os.path.dirname(db_path))
+    checkpoint_every = (processing_config.get('journal') or {}).get('checkpoint_users')
+    reply_graph = _open_reply_graph(config.config, os.path.dirname(db_path))
+
+    def checkpoint(users_df) -> None:
+        """Save the store (atomically), leaderboards and reply graph, then drop the journal entries they now cover"""
+        with METRICS.stage('checkpoint'):
+            save_db(users_df, db_path)
+            if leaderboards is not None:
+                leaderboards.save()
+            if reply_graph is not None:
+                reply_graph.save()
+            journal.compact()
 
     # Create processed directory if it doesn't exist
     os.makedirs(processed_dir, exist_ok=True)
 
-    # Get all unprocessed JSON files
-    raw_files = glob.glob(f"{raw_data_dir}/*.json")
-    processed_files = set(os.path.basename(f).replace('.json', '.processed')
-                         for f in glob.glob(f"{processed_dir}/*.processed"))
+    # Get all unprocessed raw files (legacy JSON arrays and JSONL shards)
+    raw_files = list_raw_files(raw_data_dir)
+    processed_files = set(os.path.basename(f)
+                          for f in glob.glob(f"{processed_dir}/*.processed"))
     
+    pending_files = []
     for raw_file in raw_files:
         filename = os.path.basename(raw_file)
-        if filename.replace('.json', '.processed') in processed_files:
+        if marker_name(filename) in processed_files:
             print(f"Skipping already processed file: {filename}")
             continue
+        pending_files.append(raw_file)
 
-        print(f"Processing {filename}...")
-        
-        # Load raw data
-        with open(raw_file, 'r') as f:
-            raw_data = json.load(f)
-
-        # Process each user's content
-        user_contents = {}
-        for post in raw_data:
-            # Process post
-            if post.get('author'):
-                if post['author'] not in user_contents:
-                    user_contents[post['author']] = []
-                user_contents[post['author']].append({
-                    'content': f"Title: {post['title']}\n{post['text']}",
-                    'score': post['score'],
-                    'subreddit': post['subreddit'],
-                    'subreddit_type': post['subreddit_type']
-                })
-            
-            # Process comment tree
-            for comment in post.get('comments', []):
-                _process_comment_tree(comment, user_contents)
+    if workers > 1 and len(pending_files) > 1:
+        print(f"Aggregating {len(pending_files)} raw files with {workers} worker processes")
 
-        # Process each user
-        for username, contents in user_contents.items():
-            # Combine all user's content
-            combined_text = "\n---\n".join(
-                f"[r/{c['subreddit']}] {c['content']}" for c in contents
-            )
-            
-            # Extract features
-            features = extractor.extract_features(combined_text)
-            
-            # Validate features
-            is_valid, validated_features = validator.validate_features(
-                combined_text, features
-            )
-            
-            if not is_valid:
-                print(f"Warning: Potential hallucinations in features for user {username}")
-            
-            # Add engagement metrics
-            validated_features['num_comments'] = len(contents)
-            validated_features['avg_score'] = sum(c['score'] for c in contents) / len(contents)
-            
-            # Create and upsert user record
-            user_record = create_user_record(
-                user_id=username,
-                username=username,
-                features=validated_features
+    # Stream posts from each raw file and group content by user (in worker processes when workers > 1)
+    for raw_file, user_contents, comment_index in METRICS.timed_iter(
+        iter_file_aggregates(pending_files, workers), 'aggregate'
+    ):
+        filename = os.path.basename(raw_file)
+        print(f"Processing {filename}...")
+        if journal is not None:
+            journal.begin(filename)
+        with METRICS.stage('ingest'):
+            users_df, failed = _ingest_user_contents(
+                user_contents, users_df, extractor, validator, config.config['openai'],
+                leaderboards, relevance_filter, dedup_index,
+                journal, checkpoint if journal is not None else None, checkpoint_every,
+                comment_index=comment_index, reply_graph=reply_graph
             )
-            users_df = upsert_user(users_df, user_record)
+        METRICS.inc('files_total', stage='process')
+        if journal is not None:
+            # The store must hold the file's users before the file is marked done
+            checkpoint(users_df)
+
+        if failed:
+            # Left unmarked so the failed users' content is retried; ingested users are skipped as seen
+            print(f"Not marking {filename} as processed: {len(failed)} users failed")
+            continue
 
         # Mark file as processed
-        processed_mark = f"{processed_dir}/{filename.replace('.json', '.processed')}"
+        processed_mark = f"{processed_dir}/{marker_name(filename)}"
         with open(processed_mark, 'w') as f:
             f.write(str(datetime.now()))
 
-    # Save updated database
+    # Rescore the reply graph once per run (also after a run that crashed before scoring)
+    if reply_graph is not None and not reply_graph.scored:
+        with METRICS.stage('graph'):
+            users_df = _score_reply_graph(reply_graph, users_df, leaderboards)
+        if journal is not None:
+            checkpoint(users_df)
+
+    # Save updated database (already checkpointed file by file when journaling)
+    if journal is None:
+        with METRICS.stage('save_db'):
+            save_db(users_df, db_path)
+            if leaderboards is not None:
+                leaderboards.save()
+            if reply_graph is not None:
+                reply_graph.save()
+    else:
+        _report_journal(journal)
+    print(f"Database updated at {db_path}")
+    _report_dedup(dedup_index)
+    _report_validation(validator)
+    _report_prefilter(relevance_filter)
+    _report_cache(engine)
+
+def reprocess_posts(
+    raw_file: str,
+    post_ids: List[str],
+    db_path: str = "data/users.pkl",
+    config = None,
+) -> None:
+    """Process only the given posts of a raw file
+
+    Shards are read through their offset index, so only those posts are
+    decompressed. Content already ingested for a user is still skipped.
+    """
+    engine = LLMEngine(config.config['openai'], data_dir=os.path.dirname(db_path))
+    extractor = BaseFeatureExtractor(config.config, engine=engine)
+    validator = FeatureValidator(config.config, engine=engine)
+    users_df = _open_db(db_path)
+    leaderboards = open_leaderboards(config.config.get('ranking', {}), os.path.dirname(db_path))
+    relevance_filter = _open_prefilter(config.config)
+    dedup_index = open_dedup_index(config.config, os.path.dirname(db_path))
+    reply_graph = _open_reply_graph(config.config, os.path.dirname(db_path))
+
+    print(f"Reprocessing {len(post_ids)} posts from {os.path.basename(raw_file)}...")
+    comment_index = CommentIndex()
+    user_contents = aggregate_user_contents(iter_raw_file(raw_file, post_ids), comment_index)
+    users_df, failed = _ingest_user_contents(
+        user_contents, users_df, extractor, validator, config.config['openai'],
+        leaderboards, relevance_filter, dedup_index, comment_index=comment_index, reply_graph=reply_graph
+    )
+    if failed:
+        print(f"Extraction failed for {len(failed)} users; rerun to retry their posts")
+    if reply_graph is not None and not reply_graph.scored:
+        users_df = _score_reply_graph(reply_graph, users_df, leaderboards)
+
     save_db(users_df, db_path)
-    print(f"Database updated at {db_path}") 
\ No newline at end of file
+    print(f"Database updated at {db_path}")
+    if leaderboards is not None:
+        leaderboards.save()
+    if reply_graph is not None:
+        reply_graph.save()
+    _report_dedup(dedup_index)
+    _report_validation(validator)
+    _report_prefilter(relevance_filter)
+    _report_cache(engine)
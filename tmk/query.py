@@ -0,0 +1,496 @@
+"""Composable user queries with bitmap and inverted indexes
+
+Predicates can be evaluated directly on a DataFrame (reference path) or
+through a UserIndex, which keeps:
+- a boolean bitmap per value of each low-cardinality categorical column
+- an inverted index from each normalized list term (illness, treatment,
+  subreddit type) to row positions
+- dense float arrays for numeric columns
+all maintained incrementally on upsert and saved next to the user DB
+(see index_path), so a new process loads rather than rebuilds them.
+
+Example:
+    ContainsAny('illness_types', ['fibromyalgia']) & Eq('clinical_trial_interest', 'high')
+"""
+from typing import Dict, List, Any, Iterable, Optional, Set
+from abc import ABC, abstractmethod
+import os
+import pickle
+import re
+import numpy as np
+import pandas as pd
+from tmk.user import parse_list_field
+
+CATEGORICAL_COLUMNS = [
+    'gender', 'income_level', 'education_level',
+    'clinical_trial_interest', 'money_making_interest'
+]
+LIST_COLUMNS = ['illness_types', 'treatment_history', 'subreddit_types']
+NUMERIC_COLUMNS = [
+    'num_comments', 'avg_score', 'clinical_trials_sentiment', 'treatment_sentiment',
+    'conversation_depth', 'conversation_count', 'parent_interactions', 'replies_received',
+    'pagerank', 'community_id', 'community_centrality'
+]
+
+INDEXED_COLUMNS = CATEGORICAL_COLUMNS + LIST_COLUMNS + NUMERIC_COLUMNS
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_term(value: Any) -> Optional[str]:
+    """Case- and whitespace-insensitive form used for categorical values and list terms"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return _WHITESPACE.sub(' ', str(value).strip().lower())
+
+
+def _normalized_in(values: pd.Series, wanted: Set[Optional[str]]) -> np.ndarray:
+    """Rows whose normalized value is in wanted (None matches missing values)
+
+    Normalizes each distinct value once rather than every row.
+    """
+    codes, uniques = pd.factorize(values)
+    hits = np.array([normalize_term(u) in wanted for u in uniques] + [None in wanted], dtype=bool)
+    return hits[codes]
+
+
+def index_path(db_path: str) -> str:
+    """Where the UserIndex of a user DB file is saved"""
+    return f"{os.path.splitext(db_path)[0]}.index.pkl"
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Predicate(ABC):
+    """Both evaluation paths agree; in particular a None value matches missing values"""
+
+    def __and__(self, other: 'Predicate') -> 'Predicate':
+        return And(self, other)
+
+    def __or__(self, other: 'Predicate') -> 'Predicate':
+        return Or(self, other)
+
+    @property
+    @abstractmethod
+    def indexed(self) -> bool:
+        """Whether evaluate() can answer this from a UserIndex (else use mask())"""
+
+    @property
+    @abstractmethod
+    def columns(self) -> Set[str]:
+        """Columns mask() reads"""
+
+    @abstractmethod
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Evaluate on a DataFrame without indexes"""
+
+    @abstractmethod
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        """Evaluate through a UserIndex; returns a boolean mask over index positions"""
+
+
+class ColumnPredicate(Predicate):
+    """Predicate on a single column"""
+    column: str
+
+    @property
+    def columns(self) -> Set[str]:
+        return {self.column}
+
+
+class Compare(ColumnPredicate):
+    OPERATORS = {
+        '==': np.equal, '!=': np.not_equal,
+        '>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal,
+    }
+
+    def __init__(self, column: str, operator: str, value: Any):
+        if operator not in self.OPERATORS:
+            raise ValueError(f"Unsupported operator: {operator}")
+        self.column, self.operator, self.value = column, operator, value
+
+    @property
+    def indexed(self) -> bool:
+        return self.column in NUMERIC_COLUMNS
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        if self.column in NUMERIC_COLUMNS:
+            values = pd.to_numeric(df[self.column], errors='coerce').to_numpy(dtype=float)
+            return self.OPERATORS[self.operator](values, self.value)
+        return self.OPERATORS[self.operator](df[self.column].to_numpy(), self.value).astype(bool)
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        return self.OPERATORS[self.operator](index.numeric(self.column), self.value)
+
+
+class Eq(ColumnPredicate):
+    """Equality; Eq(column, None) matches missing values"""
+
+    def __init__(self, column: str, value: Any):
+        self.column, self.value = column, value
+
+    @property
+    def indexed(self) -> bool:
+        return self.column in NUMERIC_COLUMNS or self.column in CATEGORICAL_COLUMNS
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        if self.column in CATEGORICAL_COLUMNS:
+            return _normalized_in(df[self.column], {normalize_term(self.value)})
+        if self.value is None:
+            return df[self.column].isna().to_numpy(dtype=bool)
+        return (df[self.column] == self.value).to_numpy(dtype=bool)
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        if self.column in NUMERIC_COLUMNS:
+            values = index.numeric(self.column)
+            return np.isnan(values) if self.value is None else values == self.value
+        return index.bitmap(self.column, self.value).copy()
+
+
+class In(ColumnPredicate):
+    def __init__(self, column: str, values: Iterable[Any]):
+        self.column, self.values = column, list(values)
+
+    @property
+    def indexed(self) -> bool:
+        return self.column in NUMERIC_COLUMNS or self.column in CATEGORICAL_COLUMNS
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        if self.column in CATEGORICAL_COLUMNS:
+            return _normalized_in(df[self.column], {normalize_term(v) for v in self.values})
+        return df[self.column].isin(self.values).to_numpy(dtype=bool)
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        if self.column in NUMERIC_COLUMNS:
+            return np.isin(index.numeric(self.column), self.values)
+        result = np.zeros(index.size, dtype=bool)
+        for value in self.values:
+            result |= index.bitmap(self.column, value)
+        return result
+
+
+class Between(ColumnPredicate):
+    """Inclusive range on a numeric column"""
+
+    def __init__(self, column: str, low: float, high: float):
+        self.column, self.low, self.high = column, low, high
+
+    @property
+    def indexed(self) -> bool:
+        return self.column in NUMERIC_COLUMNS
+
+    def _between(self, values: np.ndarray) -> np.ndarray:
+        return (values >= self.low) & (values <= self.high)
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        return self._between(pd.to_numeric(df[self.column], errors='coerce').to_numpy(dtype=float))
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        return self._between(index.numeric(self.column))
+
+
+class ContainsAny(ColumnPredicate):
+    """List column contains at least one of the terms"""
+
+    def __init__(self, column: str, terms: Iterable[str]):
+        self.column = column
+        self.terms = {normalize_term(t) for t in terms} - {None}
+
+    @property
+    def indexed(self) -> bool:
+        return self.column in LIST_COLUMNS
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        return np.array([
+            not self.terms.isdisjoint(normalize_term(v) for v in parse_list_field(values))
+            for values in df[self.column]
+        ], dtype=bool)
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        result = np.zeros(index.size, dtype=bool)
+        for term in self.terms:
+            result[index.postings(self.column, term)] = True
+        return result
+
+
+class ContainsAll(ContainsAny):
+    """List column contains every one of the terms"""
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        return np.array([
+            self.terms.issubset(normalize_term(v) for v in parse_list_field(values))
+            for values in df[self.column]
+        ], dtype=bool)
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        if not self.terms:
+            return np.ones(index.size, dtype=bool)
+        # Intersect postings starting from the rarest term
+        postings = sorted((index.postings(self.column, t) for t in self.terms), key=len)
+        positions = postings[0]
+        for other in postings[1:]:
+            positions = np.intersect1d(positions, other, assume_unique=True)
+        result = np.zeros(index.size, dtype=bool)
+        result[positions] = True
+        return result
+
+
+class And(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    @property
+    def indexed(self) -> bool:
+        return all(p.indexed for p in self.predicates)
+
+    @property
+    def columns(self) -> Set[str]:
+        return set().union(*(p.columns for p in self.predicates))
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        result = np.ones(len(df), dtype=bool)
+        for predicate in self.predicates:
+            result &= predicate.mask(df)
+        return result
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        result = np.ones(index.size, dtype=bool)
+        for predicate in self.predicates:
+            result &= predicate.evaluate(index)
+        return result
+
+
+class Or(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    @property
+    def indexed(self) -> bool:
+        return all(p.indexed for p in self.predicates)
+
+    @property
+    def columns(self) -> Set[str]:
+        return set().union(*(p.columns for p in self.predicates))
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        result = np.zeros(len(df), dtype=bool)
+        for predicate in self.predicates:
+            result |= predicate.mask(df)
+        return result
+
+    def evaluate(self, index: 'UserIndex') -> np.ndarray:
+        result = np.zeros(index.size, dtype=bool)
+        for predicate in self.predicates:
+            result |= predicate.evaluate(index)
+        return result
+
+
+def from_criteria(criteria: Dict) -> Predicate:
+    """Convert query_users-style criteria into a predicate
+
+    Values are either a literal (equality) or a tuple (operator, value) with
+    operator one of >, <, >=, <=, ==, !=, 'in', 'between' (value is (low, high)),
+    'contains_any' or 'contains_all'.
+    """
+    predicates = []
+    for column, value in criteria.items():
+        if not isinstance(value, tuple):
+            predicates.append(Eq(column, value))
+            continue
+        operator, val = value
+        if operator == 'in':
+            predicates.append(In(column, val))
+        elif operator == 'between':
+            predicates.append(Between(column, *val))
+        elif operator == 'contains_any':
+            predicates.append(ContainsAny(column, val))
+        elif operator == 'contains_all':
+            predicates.append(ContainsAll(column, val))
+        else:
+            predicates.append(Compare(column, operator, val))
+    return And(*predicates)
+
+
+class UserIndex:
+    """Secondary indexes over user rows, addressed by stable row positions"""
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self._capacity = capacity
+        self.user_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self._bitmaps: Dict[str, Dict[str, np.ndarray]] = {c: {} for c in CATEGORICAL_COLUMNS}
+        self._categories: Dict[str, List[Optional[str]]] = {c: [] for c in CATEGORICAL_COLUMNS}
+        self._inverted: Dict[str, Dict[str, Set[int]]] = {c: {} for c in LIST_COLUMNS}
+        self._terms: Dict[str, List[Set[str]]] = {c: [] for c in LIST_COLUMNS}
+        self._postings_cache: Dict[tuple, np.ndarray] = {}
+        self._numeric = {c: np.full(capacity, np.nan) for c in NUMERIC_COLUMNS}
+        self._empty = np.zeros(capacity, dtype=bool)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'UserIndex':
+        """Bulk-build indexes from a users DataFrame"""
+        n = len(df)
+        index = cls(capacity=max(1024, n))
+        if n == 0:
+            return index
+        if df['user_id'].duplicated().any():
+            # Later rows win, exactly as repeated upserts would
+            for record in df.to_dict('records'):
+                index.upsert(record)
+            return index
+
+        index.size = n
+        index.user_ids = list(df['user_id'])
+        index.positions = {user_id: i for i, user_id in enumerate(index.user_ids)}
+
+        for column in CATEGORICAL_COLUMNS:
+            values = [normalize_term(v) for v in df[column]] if column in df else [None] * n
+            index._categories[column] = values
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+            for code, value in enumerate(uniques):
+                bitmap = np.zeros(index._capacity, dtype=bool)
+                bitmap[:n] = codes == code
+                index._bitmaps[column][value] = bitmap
+
+        for column in LIST_COLUMNS:
+            terms = index._terms[column]
+            inverted = index._inverted[column]
+            for position, values in enumerate(df[column] if column in df else [None] * n):
+                row_terms = {normalize_term(v) for v in parse_list_field(values)} - {None}
+                terms.append(row_terms)
+                for term in row_terms:
+                    inverted.setdefault(term, set()).add(position)
+
+        for column in NUMERIC_COLUMNS:
+            if column in df:
+                index._numeric[column][:n] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        return index
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        for bitmaps in self._bitmaps.values():
+            for value, bitmap in bitmaps.items():
+                bitmaps[value] = np.concatenate([bitmap, np.zeros(len(bitmap), dtype=bool)])
+        for column, values in self._numeric.items():
+            self._numeric[column] = np.concatenate([values, np.full(len(values), np.nan)])
+        self._empty = np.zeros(self._capacity, dtype=bool)
+
+    def _position(self, user_id: str) -> int:
+        position = self.positions.get(user_id)
+        if position is None:
+            if self.size == self._capacity:
+                self._grow()
+            position = self.size
+            self.size += 1
+            self.positions[user_id] = position
+            self.user_ids.append(user_id)
+            for column in CATEGORICAL_COLUMNS:
+                self._categories[column].append(None)
+            for column in LIST_COLUMNS:
+                self._terms[column].append(set())
+        return position
+
+    def _assign(self, position: int, values: Dict[str, Any], columns: Iterable[str]) -> None:
+        for column in columns:
+            if column in self._bitmaps:
+                old, new = self._categories[column][position], normalize_term(values.get(column))
+                if old == new:
+                    continue
+                if old is not None:
+                    self._bitmaps[column][old][position] = False
+                if new is not None:
+                    if new not in self._bitmaps[column]:
+                        self._bitmaps[column][new] = np.zeros(self._capacity, dtype=bool)
+                    self._bitmaps[column][new][position] = True
+                self._categories[column][position] = new
+            elif column in self._inverted:
+                old = self._terms[column][position]
+                new = {normalize_term(v) for v in parse_list_field(values.get(column))} - {None}
+                for term in old - new:
+                    self._inverted[column][term].discard(position)
+                    self._postings_cache.pop((column, term), None)
+                for term in new - old:
+                    self._inverted[column].setdefault(term, set()).add(position)
+                    self._postings_cache.pop((column, term), None)
+                self._terms[column][position] = new
+            elif column in self._numeric:
+                self._numeric[column][position] = _to_float(values.get(column))
+
+    def upsert(self, record: Dict[str, Any]) -> None:
+        """Add or update one user, replacing its previous index entries"""
+        self._assign(self._position(record['user_id']), record, INDEXED_COLUMNS)
+
+    def update(self, record: Dict[str, Any]) -> None:
+        """Add or update one user, changing only the indexed columns present in the record"""
+        self._assign(self._position(record['user_id']), record, [c for c in INDEXED_COLUMNS if c in record])
+
+    def update_columns(self, user_ids: List[str], columns: Dict[str, Iterable]) -> None:
+        """Overwrite some columns of many existing users; unknown user IDs are ignored"""
+        positions = np.array([self.positions.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+        found = positions >= 0
+        for column, values in columns.items():
+            values = np.asarray(values)
+            if column in self._numeric:
+                self._numeric[column][positions[found]] = pd.to_numeric(
+                    pd.Series(values[found], dtype=object), errors='coerce'
+                ).to_numpy(dtype=float)
+            elif column in INDEXED_COLUMNS:
+                for position, value in zip(positions[found], values[found]):
+                    self._assign(position, {column: value}, [column])
+
+    def bitmap(self, column: str, value: Any) -> np.ndarray:
+        if column not in self._bitmaps:
+            raise KeyError(f"Column is not bitmap-indexed: {column}")
+        value = normalize_term(value)
+        if value is None:
+            # Rows with no value are the ones in no bitmap
+            present = np.zeros(self.size, dtype=bool)
+            for bitmap in self._bitmaps[column].values():
+                present |= bitmap[:self.size]
+            return ~present
+        return self._bitmaps[column].get(value, self._empty)[:self.size]
+
+    def postings(self, column: str, term: str) -> np.ndarray:
+        """Sorted row positions whose list column contains the (normalized) term"""
+        if column not in self._inverted:
+            raise KeyError(f"Column has no inverted index: {column}")
+        key = (column, term)
+        if key not in self._postings_cache:
+            positions = self._inverted[column].get(term, ())
+            self._postings_cache[key] = np.fromiter(sorted(positions), dtype=np.int64, count=len(positions))
+        return self._postings_cache[key]
+
+    def numeric(self, column: str) -> np.ndarray:
+        if column not in self._numeric:
+            raise KeyError(f"Column is not a numeric index: {column}")
+        return self._numeric[column][:self.size]
+
+    def search(self, predicate: Predicate) -> List[str]:
+        """User IDs matching the predicate, in insertion order"""
+        return [self.user_ids[i] for i in np.flatnonzero(predicate.evaluate(self))]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state['_postings_cache'] = {}
+        return state
+
+    def save(self, path: str, stamp: str) -> None:
+        """Atomically write the index, tagged with a stamp identifying the DB state it covers"""
+        with open(f"{path}.tmp", 'wb') as f:
+            pickle.dump((stamp, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def load(path: str, stamp: Optional[str]) -> Optional['UserIndex']:
+        """The saved index, or None if missing or saved for another DB state than stamp"""
+        if stamp is None or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            saved_stamp, index = pickle.load(f)
+        return index if saved_stamp == stamp else None
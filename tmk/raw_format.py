@@ -0,0 +1,186 @@
+"""Raw-data file formats
+
+Legacy: one pretty-printed JSON array per subreddit per run (`*.json`).
+Sharded: compressed JSONL shards (`*.jsonl.gz` / `*.jsonl.zst`), one post per
+line, where every post is its own gzip member / zstd frame. Each shard has a
+sidecar index (`<shard>.idx.json`) mapping post ID to [byte offset, length] in
+the compressed file, so single posts can be read without touching the rest.
+"""
+from typing import Dict, Any, List, Iterator, Iterable, Optional, Tuple
+import glob
+import gzip
+import io
+import json
+import os
+from tmk.raw_reader import iter_posts
+
+LEGACY_EXTENSION = '.json'
+SHARD_EXTENSIONS = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst', 'none': '.jsonl'}
+RAW_EXTENSIONS = ('.jsonl.gz', '.jsonl.zst', '.jsonl', '.json')
+INDEX_SUFFIX = '.idx.json'
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd shards require the zstandard package: pip install zstandard") from e
+    return zstandard
+
+
+def _compression_for(path: str) -> str:
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == 'zstd':
+        return _zstd().ZstdCompressor(level=6).compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data)
+    return data
+
+
+def raw_stem(filename: str) -> str:
+    """File name without its raw-data extension"""
+    for extension in RAW_EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+
+def marker_name(filename: str) -> str:
+    """Name of the `.processed` marker for a raw file"""
+    return raw_stem(filename) + '.processed'
+
+
+def list_raw_files(raw_data_dir: str) -> List[str]:
+    """All legacy and sharded raw files in a directory, sorted by name"""
+    files = []
+    for extension in RAW_EXTENSIONS:
+        files.extend(glob.glob(os.path.join(raw_data_dir, f"*{extension}")))
+    return sorted(f for f in set(files) if not f.endswith(INDEX_SUFFIX))
+
+
+def write_shards(
+    posts: Iterable[Dict[str, Any]],
+    output_dir: str,
+    name: str,
+    compression: str = 'gzip',
+    shard_size: int = 1000
+) -> List[str]:
+    """Write posts as compressed JSONL shards of at most `shard_size` posts, with offset indexes
+
+    Returns the shard paths.
+    """
+    if compression not in SHARD_EXTENSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd':
+        _zstd()
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths, f, index, shard = [], None, {}, 0
+    try:
+        for i, post in enumerate(posts):
+            if i % shard_size == 0:
+                if f is not None:
+                    f.close()
+                    _write_index(paths[-1], index)
+                path = os.path.join(output_dir, f"{name}-{shard:05d}{SHARD_EXTENSIONS[compression]}")
+                paths.append(path)
+                f, index, shard = open(path, 'wb'), {}, shard + 1
+
+            line = json.dumps(post, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            member = _compress(line, compression)
+            index[str(post.get('id', i))] = [f.tell(), len(member)]
+            f.write(member)
+    finally:
+        if f is not None:
+            f.close()
+            _write_index(paths[-1], index)
+    return paths
+
+
+def _write_index(shard_path: str, index: Dict[str, List[int]]) -> None:
+    with open(shard_path + INDEX_SUFFIX, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+
+
+def load_index(shard_path: str) -> Dict[str, Tuple[int, int]]:
+    with open(shard_path + INDEX_SUFFIX) as f:
+        return json.load(f)
+
+
+def iter_shard(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream posts from a JSONL shard, decompressing on the fly"""
+    compression = _compression_for(path)
+    if compression == 'gzip':
+        stream = gzip.open(path, 'rt', encoding='utf-8')
+    elif compression == 'zstd':
+        raw = open(path, 'rb')
+        reader = _zstd().ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        stream = io.TextIOWrapper(reader, encoding='utf-8')
+    else:
+        stream = open(path, 'r', encoding='utf-8')
+    with stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_posts(path: str, post_ids: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Read selected posts from a shard via its offset index (seek + decompress one member each)"""
+    index = load_index(path)
+    compression = _compression_for(path)
+    with open(path, 'rb') as f:
+        for post_id in post_ids:
+            if post_id not in index:
+                raise KeyError(f"Post {post_id} not in {path}")
+            offset, length = index[post_id]
+            f.seek(offset)
+            yield json.loads(_decompress(f.read(length), compression))
+
+
+def iter_raw_file(path: str, post_ids: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream posts from a legacy JSON array or a JSONL shard, optionally only selected posts"""
+    if path.endswith(LEGACY_EXTENSION):
+        posts = iter_posts(path)
+        if post_ids is None:
+            return posts
+        wanted = set(post_ids)
+        return (post for post in posts if post.get('id') in wanted)
+    if post_ids is not None and os.path.exists(path + INDEX_SUFFIX):
+        return read_posts(path, post_ids)
+    return iter_shard(path)
+
+
+def write_raw_posts(
+    posts: List[Dict[str, Any]],
+    output_dir: str,
+    name: str,
+    scraping_config: Dict[str, Any] = None
+) -> List[str]:
+    """Save scraped posts in the configured raw format; returns the written files"""
+    scraping_config = scraping_config or {}
+    raw_format = scraping_config.get('raw_format', 'jsonl')
+    if raw_format == 'json':
+        path = os.path.join(output_dir, f"{name}{LEGACY_EXTENSION}")
+        with open(path, 'w') as f:
+            json.dump(posts, f, indent=2)
+        return [path]
+    return write_shards(
+        posts, output_dir, name,
+        compression=scraping_config.get('compression', 'gzip'),
+        shard_size=scraping_config.get('shard_size', 1000)
+    )
@@ -0,0 +1,68 @@
+from typing import Dict, Any, Iterator
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_posts(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Yield posts one at a time from a raw JSON array file
+
+    Only the post being decoded (plus one read chunk) is held in memory, so
+    peak memory is bounded by the largest single post, not the file size.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip(_WHITESPACE)
+        if not buffer:
+            return
+        if buffer[0] != '[':
+            raise ValueError(f"{path}: expected a JSON array of posts")
+        buffer = buffer[1:]
+        eof = False
+        read_size = chunk_size
+
+        while True:
+            buffer = buffer.lstrip(_WHITESPACE + ',')
+            if buffer.startswith(']'):
+                return
+            if not buffer or buffer[0] != '{':
+                if eof:
+                    if not buffer:
+                        raise ValueError(f"{path}: unexpected end of file")
+                    raise ValueError(f"{path}: expected a post object, got {buffer[:20]!r}")
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+
+            try:
+                post, end = _decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Incomplete object: read more, growing the read size for very large posts
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer += chunk
+                read_size = min(read_size * 2, 1 << 26)
+                continue
+
+            yield post
+            buffer = buffer[end:]
+            read_size = chunk_size
+
+
+def iter_comments(post: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Pre-order walk of a post's comment tree using an explicit stack
+
+    Yields comments in the same order as a recursive depth-first traversal,
+    without the recursion limit on deep threads.
+    """
+    stack = list(reversed(post.get('comments', [])))
+    while stack:
+        comment = stack.pop()
+        yield comment
+        replies = comment.get('replies')
+        if replies:
+            stack.extend(reversed(replies))
+
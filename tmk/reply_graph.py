@@ -0,0 +1,204 @@
+"""Persistent user reply graph with PageRank centrality and label-propagation communities
+
+Edges are replier -> replied-to author, weighted by reply count, kept as a
+scipy.sparse CSR adjacency matrix over users interned to stable integer
+codes. Each ingested slice of content adds its replies (from the file's
+comment index), so the graph grows incrementally across runs; scores are
+recomputed once per run, warm-started from the previous run's PageRank
+vector and community labels:
+
+- pagerank: share of the random-reply-walk stationary distribution (sums to 1)
+- community_id: label-propagation community on the undirected graph, named
+  after a member's code + 1 (0 = not in the graph)
+- community_centrality: pagerank relative to the community's most central member
+"""
+from typing import Dict, List, Any, Optional
+import os
+import pickle
+import numpy as np
+from scipy import sparse
+from tmk.conversation import CommentIndex
+
+
+def _resized(matrix: sparse.csr_matrix, n: int) -> sparse.csr_matrix:
+    if matrix.shape == (n, n):
+        return matrix
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize((n, n))
+    return matrix
+
+
+def _edge_positions(indptr: np.ndarray, users: np.ndarray):
+    """Positions of the users' edges in a CSR matrix, and the index into `users` owning each"""
+    starts = indptr[users]
+    degrees = indptr[users + 1] - starts
+    owners = np.repeat(np.arange(len(users)), degrees)
+    positions = np.arange(len(owners)) + np.repeat(starts - np.cumsum(degrees) + degrees, degrees)
+    return positions, owners
+
+
+def _label_votes(voters: np.ndarray, labels: np.ndarray, weights: np.ndarray, n_voters: int, n_labels: int):
+    """Summed weight per distinct (voter, label) pair, sorted by voter then label"""
+    votes = sparse.csr_matrix((weights, (voters, labels)), shape=(n_voters, n_labels))
+    votes.sum_duplicates()
+    return np.repeat(np.arange(n_voters), np.diff(votes.indptr)), votes.indices.astype(np.int64), votes.data
+
+
+class ReplyGraph:
+    def __init__(self, damping: float = 0.85, tol: float = 1e-8, max_iter: int = 100, community_iter: int = 100):
+        self.damping = damping
+        self.tol = tol
+        self.max_iter = max_iter
+        self.community_iter = community_iter
+        self.users: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float64)  # [replier, replied-to] reply counts
+        self.pagerank = np.zeros(0)
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.scored = True  # False once edges were added after the last score()
+        self.path: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    @property
+    def n_edges(self) -> int:
+        return self.matrix.nnz
+
+    def add_replies(self, comment_index: CommentIndex, mask: np.ndarray = None) -> int:
+        """Add the masked replies of a comment index as edges; returns the number of replies added"""
+        authors, repliers, parents = comment_index.reply_pairs(mask)
+        if not len(repliers):
+            return 0
+        # Intern only the authors that take part in a reply
+        involved = np.flatnonzero(np.bincount(np.concatenate([repliers, parents]), minlength=len(authors)))
+        to_graph = np.full(len(authors), -1, dtype=np.int64)
+        for code in involved.tolist():
+            name = authors[code]
+            if name not in self.codes:
+                self.codes[name] = len(self.users)
+                self.users.append(name)
+            to_graph[code] = self.codes[name]
+
+        n = len(self.users)
+        added = sparse.csr_matrix(
+            (np.ones(len(repliers)), (to_graph[repliers], to_graph[parents])), shape=(n, n)
+        )
+        self.matrix = _resized(self.matrix, n) + added
+        self.scored = False
+        return len(repliers)
+
+    def _pagerank(self) -> np.ndarray:
+        """Power iteration on the row-normalized reply matrix; dangling users teleport uniformly"""
+        n = len(self.users)
+        out_weight = np.asarray(self.matrix.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        inverse_out = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+        transposed = self.matrix.T.tocsr()
+
+        # Warm start: last run's vector, with new users at the uniform share
+        rank = np.full(n, 1.0 / n)
+        rank[:len(self.pagerank)] = self.pagerank
+        rank /= rank.sum()
+        for _ in range(self.max_iter):
+            spread = self.damping * (transposed @ (rank * inverse_out))
+            new_rank = spread + (self.damping * rank[dangling].sum() + 1 - self.damping) / n
+            converged = np.abs(new_rank - rank).sum() < self.tol
+            rank = new_rank
+            if converged:
+                break
+        return rank
+
+    def _communities(self) -> np.ndarray:
+        """Label propagation on the undirected reply graph, half of the users per round
+
+        Each round sums, per visited user, the reply weight behind every
+        neighbour label (one sparse matrix build over their edges) and moves the
+        user to the heaviest label if it outweighs the current one. Updating
+        alternate halves avoids the label swapping of fully synchronous rounds,
+        and only users with a neighbour that changed label since their last
+        round are revisited, so late rounds touch a small part of the graph.
+        """
+        n = len(self.users)
+        undirected = (self.matrix + self.matrix.T).tocsr()
+        indptr, neighbours, weights = undirected.indptr, undirected.indices, undirected.data
+        labels = np.arange(n, dtype=np.int64)
+        labels[:len(self.labels)] = self.labels
+        half = np.arange(n) % 2
+        pending = np.ones(n, dtype=bool)
+        for round_ in range(self.community_iter):
+            visit = np.flatnonzero(pending & (half == round_ % 2))
+            if not len(visit):
+                if not pending.any():
+                    break
+                continue
+            pending[visit] = False
+            positions, owners = _edge_positions(indptr, visit)
+            if not len(positions):
+                continue
+            voters, candidates, votes = _label_votes(owners, labels[neighbours[positions]], weights[positions], len(visit), n)
+
+            # Heaviest label per visited user (the smallest such label on ties)
+            voter_starts = np.flatnonzero(np.concatenate(([True], voters[1:] != voters[:-1])))
+            heaviest = np.repeat(np.maximum.reduceat(votes, voter_starts), np.diff(np.append(voter_starts, len(votes))))
+            top = np.flatnonzero(votes == heaviest)
+            top = top[np.concatenate(([True], voters[top[1:]] != voters[top[:-1]]))]
+
+            # Weight behind each visited user's current label
+            current = np.zeros(len(visit))
+            is_current = candidates == labels[visit[voters]]
+            current[voters[is_current]] = votes[is_current]
+
+            top = top[votes[top] > current[voters[top]]]
+            changed = visit[voters[top]]
+            labels[changed] = candidates[top]
+            pending[neighbours[_edge_positions(indptr, changed)[0]]] = True
+        return labels
+
+    def score(self) -> Dict[str, np.ndarray]:
+        """Recompute pagerank and communities; graph columns aligned with self.users"""
+        if len(self.users):
+            self.pagerank = self._pagerank()
+            self.labels = self._communities()
+        self.scored = True
+        community_max = np.zeros(len(self.users))
+        np.maximum.at(community_max, self.labels, self.pagerank)
+        return {
+            'pagerank': self.pagerank,
+            'community_id': self.labels + 1,
+            'community_centrality': np.divide(
+                self.pagerank, community_max[self.labels],
+                out=np.zeros(len(self.users)), where=community_max[self.labels] > 0
+            ),
+        }
+
+    def save(self, path: str = None) -> None:
+        """Atomically replace the graph file"""
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def load(path: str) -> Optional['ReplyGraph']:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def open_reply_graph(config: Dict[str, Any], data_dir: str) -> Optional[ReplyGraph]:
+    """The persistent reply graph configured under `graph`, or None when disabled"""
+    graph_config = config.get('graph') or {}
+    if not graph_config.get('enabled'):
+        return None
+    path = os.path.join(data_dir, graph_config.get('file', 'reply_graph.pkl'))
+    graph = ReplyGraph.load(path) or ReplyGraph()
+    graph.damping = graph_config.get('damping', 0.85)
+    graph.tol = graph_config.get('tol', 1e-8)
+    graph.max_iter = graph_config.get('max_iter', 100)
+    graph.community_iter = graph_config.get('community_iter', 100)
+    graph.path = path
+    return graph
@@ -0,0 +1,98 @@
+from typing import Dict, List, Any, Iterable, Optional
+import os
+import sqlite3
+import threading
+import time
+
+# Per-item fields compared between runs; any difference marks the item as changed
+TRACKED_FIELDS = ('score', 'edited', 'num_comments')
+
+
+def edited_timestamp(edited: Any) -> float:
+    """praw reports `edited` as False or an edit timestamp"""
+    return float(edited or 0)
+
+
+class ScrapeState:
+    """High-water marks of scraped posts and comments, persisted in SQLite
+
+    Records each seen item's score, edit timestamp and (for posts) comment
+    count, so later runs fetch and emit only new or changed items. Observed
+    items are staged per subreddit and only committed once that subreddit's
+    delta has been written, so a failed run is simply re-scraped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_items ("
+            "id TEXT PRIMARY KEY, kind TEXT, subreddit TEXT, "
+            "score INTEGER, edited REAL, num_comments INTEGER, last_seen REAL)"
+        )
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self._staged: Dict[str, List[tuple]] = {}
+        self.stats = {'new': 0, 'changed': 0, 'unchanged': 0}
+
+    def lookup(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored marks for the given item IDs (unseen IDs are absent)"""
+        ids = list(ids)
+        marks = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT id, score, edited, num_comments FROM seen_items "
+                    f"WHERE id IN ({', '.join('?' for _ in batch)})", batch
+                )
+                for item_id, score, edited, num_comments in rows:
+                    marks[item_id] = {'score': score, 'edited': edited, 'num_comments': num_comments}
+        return marks
+
+    def classify(self, item: Dict[str, Any], mark: Optional[Dict[str, Any]]) -> str:
+        """'new', 'changed' or 'unchanged' relative to the stored mark"""
+        if mark is None:
+            status = 'new'
+        elif any(field in item and item[field] != mark[field] for field in TRACKED_FIELDS):
+            status = 'changed'
+        else:
+            status = 'unchanged'
+        with self._lock:
+            self.stats[status] += 1
+        return status
+
+    def stage(self, subreddit: str, kind: str, item: Dict[str, Any]) -> None:
+        """Queue an observed item's marks until the subreddit is committed"""
+        row = (item['id'], kind, subreddit, item.get('score'), item.get('edited', 0.0),
+               item.get('num_comments'), time.time())
+        with self._lock:
+            self._staged.setdefault(subreddit, []).append(row)
+
+    def commit(self, subreddit: str) -> None:
+        """Persist the marks staged for a subreddit (call after its delta is saved)"""
+        with self._lock:
+            rows = self._staged.pop(subreddit, [])
+            if not rows:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO seen_items "
+                    "(id, kind, subreddit, score, edited, num_comments, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+
+    def discard(self, subreddit: str) -> None:
+        with self._lock:
+            self._staged.pop(subreddit, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM seen_items").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
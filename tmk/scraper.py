@@ -1,17 +1,80 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Callable
 import praw
 from datetime import datetime
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import threading
+import time
+from tmk.raw_format import write_raw_posts
+from tmk.raw_reader import iter_comments
+from tmk.scrape_state import ScrapeState, edited_timestamp
+
+# Reddit listings return at most 100 submissions per request
+LISTING_PAGE_SIZE = 100
+
+
+class RequestBudget:
+    """Thread-safe token bucket shared by every scraper worker
+
+    Each Reddit API request takes one token; workers block once the
+    per-minute budget is spent instead of tripping the API's rate limit.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None):
+        self.rpm = requests_per_minute
+        self._allowance = float(requests_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def acquire(self, n: int = 1) -> None:
+        """Block until `n` requests fit in the budget, then spend them"""
+        with self._lock:
+            self.requests += n
+            if not self.rpm:
+                return
+            while True:
+                now = time.monotonic()
+                self._allowance = min(self.rpm, self._allowance + (now - self._last_refill) * self.rpm / 60)
+                self._last_refill = now
+                if self._allowance >= n:
+                    self._allowance -= n
+                    return
+                # Holding the lock while sleeping keeps waiting workers in FIFO-ish order
+                time.sleep((n - self._allowance) * 60 / self.rpm)
+
 
 class RedditScraper:
-    def __init__(self, client_id: str, client_secret: str, user_agent: str):
-        """Initialize Reddit API client"""
-        self.reddit = praw.Reddit(
-            client_id=client_id,
-            client_secret=client_secret,
-            user_agent=user_agent
-        )
+    def __init__(
+        self,
+        client_id: str = None,
+        client_secret: str = None,
+        user_agent: str = None,
+        reddit: Any = None,
+        requests_per_minute: Optional[int] = None,
+        state: Optional[ScrapeState] = None
+    ):
+        """Initialize Reddit API client
+
+        reddit: an already constructed praw.Reddit-compatible client (e.g. a
+        fake API for tests); by default one praw client is created per worker
+        thread, since praw instances are not thread-safe.
+        state: scrape high-water marks; when given, only new or changed
+        posts and comments are fetched and returned.
+        """
+        self._credentials = dict(client_id=client_id, client_secret=client_secret, user_agent=user_agent)
+        self._shared_reddit = reddit
+        self._local = threading.local()
+        self.budget = RequestBudget(requests_per_minute)
+        self.state = state
+
+    @property
+    def reddit(self):
+        if self._shared_reddit is not None:
+            return self._shared_reddit
+        if not hasattr(self._local, 'reddit'):
+            self._local.reddit = praw.Reddit(**self._credentials)
+        return self._local.reddit
 
     def get_comment_tree(self, comment, depth=0, max_depth=3):
         """Recursively get comment tree"""
@@ -26,6 +89,7 @@ class RedditScraper:
             'score': comment.score,
             'depth': depth,
             'created_utc': comment.created_utc,
+            'edited': edited_timestamp(getattr(comment, 'edited', False)),
             'parent_id': comment.parent_id,  # Track parent relationship
             'replies': []
         }
@@ -39,46 +103,185 @@ class RedditScraper:
         
         return comment_data
 
+    def _post_record(self, submission, subreddit_name: str) -> Dict[str, Any]:
+        """Post record (without comments) from a listing entry; plain data, safe to pass between threads"""
+        return {
+            'type': 'post',
+            'id': submission.id,
+            'author': submission.author.name if submission.author else None,
+            'title': submission.title,
+            'text': submission.selftext,
+            'score': submission.score,
+            'created_utc': submission.created_utc,
+            'edited': edited_timestamp(getattr(submission, 'edited', False)),
+            'num_comments': getattr(submission, 'num_comments', None),
+            'subreddit': subreddit_name,
+            'subreddit_type': 'clinical_trials' if subreddit_name in ['clinical_trials', 'passive_income'] else 'health',
+            'comments': []  # Store hierarchical comments
+        }
+
+    def list_submissions(self, subreddit_name: str, post_limit: int = 10) -> List[Dict[str, Any]]:
+        """Fetch the subreddit's hot listing as post records"""
+        subreddit = self.reddit.subreddit(subreddit_name)
+        posts = []
+        for i, submission in enumerate(subreddit.hot(limit=post_limit)):
+            if i % LISTING_PAGE_SIZE == 0:
+                self.budget.acquire()
+            posts.append(self._post_record(submission, subreddit_name))
+        return posts
+
+    def scrape_submission(self, post_data: Dict[str, Any], subreddit_name: str) -> Optional[Dict[str, Any]]:
+        """Complete a listed post record with its hierarchical comments
+
+        The submission is re-fetched by ID through this thread's own client,
+        so praw objects never cross threads.
+
+        With a scrape state, returns only the delta since the last run: None
+        when nothing changed, otherwise the post and the new or changed
+        comments, each tagged 'delta': 'new' | 'changed' | 'unchanged'
+        (unchanged items are kept only as context for changed replies).
+        """
+        fetch_comments = True
+        if self.state is not None:
+            mark = self.state.lookup([post_data['id']]).get(post_data['id'])
+            post_data['delta'] = self.state.classify(post_data, mark)
+            self.state.stage(subreddit_name, 'post', post_data)
+            if post_data['delta'] == 'unchanged':
+                return None
+            # A seen post whose comment count is unchanged has no new comments to fetch
+            fetch_comments = mark is None or mark['num_comments'] != post_data['num_comments']
+            if mark is not None and (mark['score'], mark['edited']) == (post_data['score'], post_data['edited']):
+                post_data['delta'] = 'unchanged'
+
+        if fetch_comments:
+            # Loading the comment forest is one API request per submission
+            self.budget.acquire()
+            submission = self.reddit.submission(id=post_data['id'])
+            submission.comments.replace_more(limit=0)
+            for comment in submission.comments:
+                comment_tree = self.get_comment_tree(comment)
+                if comment_tree:
+                    post_data['comments'].append(comment_tree)
+            if self.state is not None:
+                post_data['comments'] = self._comment_delta(post_data['comments'], subreddit_name)
+
+        if self.state is not None and post_data['delta'] == 'unchanged' and not post_data['comments']:
+            return None
+        return post_data
+
+    def _comment_delta(self, trees: List[Dict[str, Any]], subreddit_name: str) -> List[Dict[str, Any]]:
+        """Prune comment trees down to new/changed comments and their ancestors"""
+        marks = self.state.lookup(c['id'] for c in iter_comments({'comments': trees}))
+
+        def prune(nodes):
+            kept = []
+            for node in nodes:
+                node['replies'] = prune(node['replies'])
+                node['delta'] = self.state.classify(node, marks.get(node['id']))
+                self.state.stage(subreddit_name, 'comment', node)
+                if node['delta'] != 'unchanged' or node['replies']:
+                    kept.append(node)
+            return kept
+
+        return prune(trees)
+
     def scrape_subreddit(
         self, 
         subreddit_name: str, 
         post_limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Updated scrape_subreddit to include comment hierarchies"""
-        subreddit = self.reddit.subreddit(subreddit_name)
-        raw_data = []
-
-        for submission in subreddit.hot(limit=post_limit):
-            # Get post data
-            post_data = {
-                'type': 'post',
-                'id': submission.id,
-                'author': submission.author.name if submission.author else None,
-                'title': submission.title,
-                'text': submission.selftext,
-                'score': submission.score,
-                'created_utc': submission.created_utc,
-                'subreddit': subreddit_name,
-                'subreddit_type': 'clinical_trials' if subreddit_name in ['clinical_trials', 'passive_income'] else 'health',
-                'comments': []  # Store hierarchical comments
+        posts = (
+            self.scrape_submission(post_data, subreddit_name)
+            for post_data in self.list_submissions(subreddit_name, post_limit)
+        )
+        return [post for post in posts if post is not None]
+
+    def scrape_subreddits(
+        self,
+        subreddit_names: List[str],
+        post_limit: int = 10,
+        max_workers: int = 8,
+        on_subreddit_done: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+        """Scrape several subreddits concurrently through one worker pool
+
+        Listings and submission comment trees are fetched in parallel, all
+        drawing on the scraper's shared request budget. A failing subreddit
+        is reported and skipped without affecting the others; a failing
+        submission is dropped from its subreddit. With a scrape state, a
+        subreddit's marks are committed once `on_subreddit_done` returns.
+
+        Returns (posts per subreddit in listing order, error per failed subreddit).
+        """
+        results: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+        failures: Dict[str, str] = {}
+        pending_posts: Dict[str, int] = {}
+        done_subreddits = 0
+        total_posts = 0
+        done_posts = 0
+
+        def finish(name: str) -> None:
+            nonlocal done_subreddits
+            done_subreddits += 1
+            posts = [post for post in results.pop(name, []) if post is not None]
+            if name in failures:
+                print(f"[{done_subreddits}/{len(subreddit_names)}] r/{name} failed: {failures[name]}")
+                if self.state is not None:
+                    self.state.discard(name)
+                return
+            results[name] = posts
+            print(f"[{done_subreddits}/{len(subreddit_names)}] r/{name}: {len(posts)} posts")
+            if on_subreddit_done:
+                on_subreddit_done(name, posts)
+            if self.state is not None:
+                self.state.commit(name)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(self.list_submissions, name, post_limit): ('listing', name, None)
+                for name in subreddit_names
             }
-            
-            submission.comments.replace_more(limit=0)
-            for comment in submission.comments:
-                comment_tree = self.get_comment_tree(comment)
-                if comment_tree:
-                    post_data['comments'].append(comment_tree)
-            
-            raw_data.append(post_data)
+            while futures:
+                future = next(as_completed(futures))
+                kind, name, position = futures.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    if kind == 'listing':
+                        failures[name] = f"{type(e).__name__}: {e}"
+                        finish(name)
+                        continue
+                    print(f"  r/{name}: skipping post {position}: {type(e).__name__}: {e}")
+                    value = None
 
-        return raw_data
+                if kind == 'listing':
+                    results[name] = [None] * len(value)
+                    pending_posts[name] = len(value)
+                    total_posts += len(value)
+                    for i, post_data in enumerate(value):
+                        futures[pool.submit(self.scrape_submission, post_data, name)] = ('post', name, i)
+                    if not value:
+                        finish(name)
+                    continue
+
+                results[name][position] = value
+                pending_posts[name] -= 1
+                done_posts += 1
+                if done_posts % 25 == 0:
+                    print(f"  {done_posts}/{total_posts} posts scraped, {self.budget.requests} API requests")
+                if pending_posts[name] == 0:
+                    finish(name)
+
+        return results, failures
 
 def scrape_health_subreddits(
     client_id: str, 
     client_secret: str, 
     user_agent: str,
     output_dir: str = "raw_data",
-    subreddits: List[str] = None
+    subreddits: List[str] = None,
+    scraping_config: Dict[str, Any] = None
 ) -> None:
     """Main function to scrape health-related subreddits and save raw data"""
     if subreddits is None:
@@ -93,15 +296,25 @@ def scrape_health_subreddits(
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    scraper = RedditScraper(client_id, client_secret, user_agent)
+    scraping_config = scraping_config or {}
+    scraper = RedditScraper(
+        client_id, client_secret, user_agent,
+        requests_per_minute=scraping_config.get('requests_per_minute')
+    )
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
+    def save(subreddit: str, raw_data: List[Dict[str, Any]]) -> None:
+        # Save raw data as compressed JSONL shards (or legacy JSON, per scraping_config)
+        files = write_raw_posts(raw_data, output_dir, f"{subreddit}_{timestamp}", scraping_config)
+        print(f"Saved {len(raw_data)} items to {', '.join(files)}")
+
+    if scraping_config.get('max_workers', 1) > 1:
+        scraper.scrape_subreddits(
+            subreddits, scraping_config.get('post_limit', 10),
+            max_workers=scraping_config['max_workers'], on_subreddit_done=save
+        )
+        return
+
     for subreddit in subreddits:
         print(f"Scraping r/{subreddit}...")
-        raw_data = scraper.scrape_subreddit(subreddit)
-        
-        # Save raw data to JSON file
-        filename = f"{output_dir}/{subreddit}_{timestamp}.json"
-        with open(filename, 'w') as f:
-            json.dump(raw_data, f, indent=2)
-        print(f"Saved {len(raw_data)} items to {filename}") 
\ No newline at end of file
+        save(subreddit, scraper.scrape_subreddit(subreddit, scraping_config.get('post_limit', 10)))
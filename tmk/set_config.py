@@ -1,18 +1,34 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
 import yaml
 from pathlib import Path
 import os
 
+# Credentials each pipeline stage needs
+STAGE_CREDENTIALS = {
+    'scrape': [
+        ('reddit.client_id', "Reddit client ID is required"),
+        ('reddit.client_secret', "Reddit client secret is required"),
+    ],
+    'process': [
+        ('openai.api_key', "OpenAI API key is required"),
+    ],
+    'rank': [],
+    'query': [],
+}
+
 class Config:
-    def __init__(self, config_path: str):
-        """Load configuration from YAML file"""
+    def __init__(self, config_path: str, stages: Iterable[str] = ('scrape', 'process')):
+        """Load configuration from YAML file
+
+        stages: pipeline stages about to run; only their credentials are required
+        """
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
         # Load credentials from environment if not in config
         self._load_credentials()
         # Validate required fields
-        self._validate_config()
+        self._validate_config(stages)
 
     def _load_credentials(self):
         """Load credentials from environment variables if not in config"""
@@ -28,13 +44,13 @@ class Config:
             self.config['openai']['api_key'] = os.getenv('OPENAI_API_KEY')
     
         
-    def _validate_config(self):
-        """Validate required configuration fields"""
-        required_fields = [
-            ('reddit.client_id', "Reddit client ID is required"),
-            ('reddit.client_secret', "Reddit client secret is required"),
-            ('openai.api_key', "OpenAI API key is required")
-        ]
+    def _validate_config(self, stages: Iterable[str] = ('scrape', 'process')):
+        """Validate the configuration fields required by the given stages"""
+        required_fields = []
+        for stage in stages:
+            if stage not in STAGE_CREDENTIALS:
+                raise ValueError(f"Unknown pipeline stage: {stage}")
+            required_fields.extend(STAGE_CREDENTIALS[stage])
         
         for field, message in required_fields:
             if not self._get_nested(self.config, field.split('.')):
@@ -69,4 +85,13 @@ class Config:
     
     @property
     def scraping_config(self) -> Dict[str, Any]:
-        return self.config['scraping'] 
\ No newline at end of file
+        return self.config['scraping']
+
+    @property
+    def storage_config(self) -> Dict[str, Any]:
+        return self.config.get('storage', {})
+
+    @property
+    def db_path(self) -> str:
+        """Path of the user DB; the file extension selects the storage backend"""
+        return os.path.join(self.directories['data'], self.storage_config.get('db_file', 'users.pkl'))
@@ -0,0 +1,303 @@
+from typing import Dict, List, Optional, Iterable, Union
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from tmk.user import parse_list_field
+from tmk.query import (
+    UserIndex, Predicate, CATEGORICAL_COLUMNS, INDEXED_COLUMNS as QUERY_INDEXED_COLUMNS,
+    from_criteria, normalize_term, index_path
+)
+
+USER_COLUMNS = [
+    # User info
+    'user_id', 'username', 'created_at', 'updated_at',
+    # Demographics
+    'age_range', 'gender', 'location', 'income_level', 'education_level',
+    # Health
+    'illness_types', 'treatment_history',
+    # Interest
+    'clinical_trial_interest', 'money_making_interest',
+    # Sentiment
+    'clinical_trials_sentiment', 'treatment_sentiment',
+    # Engagement
+    'num_comments', 'avg_score',
+    # New columns
+    'conversation_depth', 'conversation_count',
+    'parent_interactions', 'subreddit_types', 'replies_received',
+    # Reply graph
+    'pagerank', 'community_id', 'community_centrality',
+    # Incremental processing
+    'content_ids'
+]
+
+# Columns stored as JSON text in SQLite
+JSON_COLUMNS = {'illness_types', 'treatment_history', 'subreddit_types', 'content_ids'}
+DATETIME_COLUMNS = {'created_at', 'updated_at'}
+COLUMN_TYPES = {
+    'clinical_trials_sentiment': 'REAL',
+    'treatment_sentiment': 'REAL',
+    'avg_score': 'REAL',
+    'num_comments': 'INTEGER',
+    'conversation_depth': 'INTEGER',
+    'conversation_count': 'INTEGER',
+    'parent_interactions': 'INTEGER',
+    'replies_received': 'INTEGER',
+    'pagerank': 'REAL',
+    'community_id': 'INTEGER',
+    'community_centrality': 'REAL',
+}
+# Columns recruiters commonly filter on
+INDEXED_COLUMNS = [
+    'gender', 'income_level', 'education_level',
+    'clinical_trial_interest', 'money_making_interest', 'num_comments'
+]
+
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+COMPARISON_OPERATORS = {'>', '<', '>=', '<='}
+# load_db filter operators (Parquet style) and their SQL form; 'in' is handled separately
+FILTER_OPERATORS = {'=': '=', '==': '=', '!=': '!=', '>': '>', '<': '<', '>=': '>=', '<=': '<='}
+
+
+def is_sqlite_path(path: Optional[str]) -> bool:
+    return bool(path) and path.endswith(SQLITE_EXTENSIONS)
+
+
+class SQLiteUserStore:
+    """User table in SQLite keyed on user_id, with buffered transactional upserts
+
+    The secondary indexes (tmk.query.UserIndex) are saved next to the
+    database by save(), tagged with a stamp that is also stored in the
+    database and cleared by every write, so a saved index is only loaded
+    when it covers exactly the rows on disk.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        self.path = path
+        self.index_file = index_path(path)
+        self.batch_size = batch_size
+        self._pending: Dict[str, Dict] = {}
+        # Secondary indexes, loaded (or rebuilt) on first use and then kept in sync
+        self._index: Optional[UserIndex] = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        columns = ",\n".join(
+            f"{c} {COLUMN_TYPES.get(c, 'TEXT')}" + (" PRIMARY KEY" if c == 'user_id' else "")
+            for c in USER_COLUMNS
+        )
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS users (\n{columns}\n)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # Add columns introduced after the table was created
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        for column in USER_COLUMNS:
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE users ADD COLUMN {column} {COLUMN_TYPES.get(column, 'TEXT')}")
+
+        for column in INDEXED_COLUMNS:
+            # Categorical values are matched case-insensitively (see tmk.query.normalize_term)
+            expression = f"LOWER({column})" if column in CATEGORICAL_COLUMNS else column
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_users_{column} ON users({expression})")
+        self.conn.commit()
+
+    def _encode(self, user_data: Dict) -> tuple:
+        values = []
+        for column in USER_COLUMNS:
+            value = user_data.get(column)
+            if column in JSON_COLUMNS:
+                value = json.dumps(parse_list_field(value))
+            elif column in DATETIME_COLUMNS and isinstance(value, datetime):
+                value = value.isoformat()
+            elif value is not None and value != value:  # NaN
+                value = None
+            values.append(value)
+        return tuple(values)
+
+    def _decode(self, row: Iterable, columns: List[str] = USER_COLUMNS) -> Dict:
+        record = dict(zip(columns, row))
+        for column in JSON_COLUMNS & record.keys():
+            record[column] = json.loads(record[column]) if record[column] else []
+        for column in DATETIME_COLUMNS & record.keys():
+            if record[column]:
+                record[column] = datetime.fromisoformat(record[column])
+        return record
+
+    def upsert(self, user_data: Dict) -> None:
+        """Buffer a record; buffered records are written in one transaction"""
+        self.index.upsert(user_data)
+        self._pending[user_data['user_id']] = user_data
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def upsert_many(self, records: Iterable[Dict]) -> None:
+        index = self.index
+        for record in records:
+            index.upsert(record)
+            self._pending[record['user_id']] = record
+        self.flush()
+
+    def _clear_index_stamp(self) -> None:
+        """Mark the saved index stale; call inside every write transaction"""
+        self.conn.execute("DELETE FROM meta WHERE key = 'index_stamp'")
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        placeholders = ", ".join("?" for _ in USER_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in USER_COLUMNS if c != 'user_id')
+        with self.conn:
+            self._clear_index_stamp()
+            self.conn.executemany(
+                f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+                [self._encode(r) for r in self._pending.values()]
+            )
+        self._pending.clear()
+
+    def update_columns(self, user_ids: List[str], columns: Dict[str, Iterable]) -> None:
+        """Overwrite some columns of many users in one transaction"""
+        index = self.index
+        self.flush()
+        names = list(columns)
+        with self.conn:
+            self._clear_index_stamp()
+            self.conn.executemany(
+                f"UPDATE users SET {', '.join(f'{c} = ?' for c in names)} WHERE user_id = ?",
+                zip(*(np.asarray(columns[c]).tolist() for c in names), user_ids)
+            )
+        index.update_columns(user_ids, columns)
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        if user_id in self._pending:
+            return dict(self._pending[user_id])
+        row = self.conn.execute(
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return self._decode(row) if row else None
+
+    def _index_stamp(self) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'index_stamp'").fetchone()
+        return row[0] if row else None
+
+    @property
+    def index(self) -> UserIndex:
+        """The secondary indexes: the saved ones if still current, else rebuilt from the table"""
+        if self._index is None:
+            self._index = UserIndex.load(self.index_file, self._index_stamp())
+            if self._index is None:
+                self._index = UserIndex.from_frame(self.to_frame(['user_id'] + QUERY_INDEXED_COLUMNS))
+        return self._index
+
+    def search(self, predicate: Predicate) -> List[str]:
+        """User IDs matching a predicate, answered from the in-memory indexes
+
+        Predicates on columns without an index are evaluated on just the columns they read.
+        """
+        if not predicate.indexed:
+            frame = self.to_frame(['user_id'] + sorted(predicate.columns - {'user_id'}))
+            return frame['user_id'][predicate.mask(frame)].tolist()
+        return self.index.search(predicate)
+
+    def fetch(self, user_ids: List[str]) -> pd.DataFrame:
+        self.flush()
+        rows = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(user_ids), 900):
+            chunk = user_ids[start:start + 900]
+            rows.extend(self.conn.execute(
+                f"SELECT {', '.join(USER_COLUMNS)} FROM users "
+                f"WHERE user_id IN ({', '.join('?' for _ in chunk)})", chunk
+            ))
+        return pd.DataFrame([self._decode(r) for r in rows], columns=USER_COLUMNS)
+
+    def query(self, criteria: Union[Dict, Predicate]) -> pd.DataFrame:
+        """Same criteria as database.query_users
+
+        Plain equality/comparison criteria are evaluated in SQL; list and set
+        operators and composed predicates go through the secondary indexes.
+        """
+        if isinstance(criteria, Predicate) or any(
+            isinstance(v, tuple) and v[0] not in COMPARISON_OPERATORS for v in criteria.values()
+        ):
+            predicate = criteria if isinstance(criteria, Predicate) else from_criteria(criteria)
+            return self.fetch(self.search(predicate))
+
+        self.flush()
+        clauses, params = [], []
+        for column, value in criteria.items():
+            if column not in USER_COLUMNS:
+                raise KeyError(column)
+            if isinstance(value, tuple):
+                operator, val = value
+                clauses.append(f"{column} {operator} ?")
+            elif column in CATEGORICAL_COLUMNS:
+                val = normalize_term(value)
+                clauses.append(f"LOWER({column}) = ?")
+            else:
+                val = value
+                clauses.append(f"{column} = ?")
+            params.append(val)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users{where}", params)
+        return pd.DataFrame([self._decode(r) for r in rows], columns=USER_COLUMNS)
+
+    def select(self, columns: Optional[List[str]] = None, filters: Optional[List] = None) -> pd.DataFrame:
+        """Only some columns of the rows matching Parquet-style (column, op, value) filters, evaluated in SQL"""
+        self.flush()
+        columns = list(columns or USER_COLUMNS)
+        clauses, params = [], []
+        for column, operator, value in filters or []:
+            if column not in USER_COLUMNS:
+                raise KeyError(column)
+            # Categorical values are matched case-insensitively, as in query()
+            expression = f"LOWER({column})" if column in CATEGORICAL_COLUMNS else column
+            if operator == 'in':
+                value = [normalize_term(v) if column in CATEGORICAL_COLUMNS else v for v in value]
+                clauses.append(f"{expression} IN ({', '.join('?' for _ in value)})")
+                params.extend(value)
+                continue
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            clauses.append(f"{expression} {FILTER_OPERATORS[operator]} ?")
+            params.append(normalize_term(value) if column in CATEGORICAL_COLUMNS else value)
+        for column in columns:
+            if column not in USER_COLUMNS:
+                raise KeyError(column)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM users{where}", params)
+        return pd.DataFrame([self._decode(r, columns) for r in rows], columns=columns)
+
+    def to_frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self.select(columns) if columns else self.query({})
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Commit pending writes and save the indexes; copy both when saving to another path"""
+        self.flush()
+        stamp = uuid.uuid4().hex
+        self.index.save(self.index_file, stamp)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('index_stamp', ?)", (stamp,))
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if path and os.path.abspath(path) != os.path.abspath(self.path):
+            shutil.copyfile(self.path, path)
+            shutil.copyfile(self.index_file, index_path(path))
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
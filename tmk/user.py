@@ -1,6 +1,18 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import ast
+from collections import Counter
 from datetime import datetime
 
+LIST_FIELDS = ['illness_types', 'treatment_history']
+SENTIMENT_FIELDS = ['clinical_trials_sentiment', 'treatment_sentiment']
+PROFILE_FIELDS = [
+    'age_range', 'gender', 'location', 'income_level', 'education_level',
+    'clinical_trial_interest', 'money_making_interest'
+]
+CONVERSATION_COUNTS = ['conversation_count', 'parent_interactions', 'replies_received']
+# Written by the reply graph once per run (tmk.reply_graph), not by extraction
+GRAPH_FIELDS = ['pagerank', 'community_id', 'community_centrality']
+
 def create_user_record(user_id: str, username: str, features: Dict[str, Any], created_at: datetime = None) -> Dict[str, Any]:
     record = {
         'user_id': user_id,
@@ -14,8 +26,8 @@ def create_user_record(user_id: str, username: str, features: Dict[str, Any], cr
         'income_level': features.get('income_level'),
         'education_level': features.get('education_level'),
         # Health
-        'illness_types': str(features.get('illness_types', [])),
-        'treatment_history': str(features.get('treatment_history', [])),
+        'illness_types': parse_list_field(features.get('illness_types')),
+        'treatment_history': parse_list_field(features.get('treatment_history')),
         # Interest
         'clinical_trial_interest': features.get('clinical_trial_interest'),
         'money_making_interest': features.get('money_making_interest'),
@@ -30,5 +42,146 @@ def create_user_record(user_id: str, username: str, features: Dict[str, Any], cr
         'conversation_count': features.get('conversation_count', 0),  # Number of comment threads
         'parent_interactions': features.get('parent_interactions', 0),  # Number of replies to others
         'subreddit_types': features.get('subreddit_types', []),  # Types of subreddits participated in
+        'replies_received': features.get('replies_received', 0),  # Number of replies from others
+        # Reply graph
+        'pagerank': features.get('pagerank'),  # Centrality in the reply graph (sums to 1 over users)
+        'community_id': features.get('community_id', 0),  # Reply-graph community; 0 = not in the graph
+        'community_centrality': features.get('community_centrality'),  # PageRank relative to the community's top
+        # Incremental processing
+        'content_ids': features.get('content_ids', []),  # Post/comment IDs already ingested
     }
-    return record 
\ No newline at end of file
+    return record
+
+def parse_list_field(value: Any) -> List[Any]:
+    """Parse a list column that may be stored as str(list)"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value) if value.startswith('[') else [value]
+        except (ValueError, SyntaxError):
+            return [value]
+    try:
+        return list(value)
+    except TypeError:
+        return []
+
+def _union(old: List[Any], new: List[Any]) -> List[Any]:
+    """Order-preserving union, case-insensitive for strings"""
+    merged, seen = [], set()
+    for item in list(old) + list(new):
+        key = item.strip().lower() if isinstance(item, str) else item
+        if item is None or key in seen:
+            continue
+        seen.add(key)
+        merged.append(item)
+    return merged
+
+def _weighted_mean(old: Optional[float], old_weight: float, new: Optional[float], new_weight: float) -> Optional[float]:
+    """Running average that ignores missing values on either side"""
+    try:
+        old = None if old is None else float(old)
+        new = None if new is None else float(new)
+    except (TypeError, ValueError):
+        return new if new is not None else old
+    if old is None or old != old or old_weight <= 0:
+        return new
+    if new is None or new != new or new_weight <= 0:
+        return old
+    return (old * old_weight + new * new_weight) / (old_weight + new_weight)
+
+def _count(value: Any) -> int:
+    """Stored counter value; rows from before a column existed hold None or NaN"""
+    if value is None or value != value:
+        return 0
+    return int(value)
+
+def merge_features(
+    existing: Dict[str, Any],
+    new_features: Dict[str, Any],
+    new_num_comments: int,
+    new_score_sum: float
+) -> Dict[str, Any]:
+    """Merge features extracted from a new content delta into an existing user row
+
+    - illness_types / treatment_history: union
+    - sentiments: running average weighted by number of comments
+    - categorical profile fields: newest non-null value wins
+    - num_comments / avg_score: cumulative
+    - conversation metrics: deepest comment wins, counts add up, subreddit types union
+    - reply-graph scores: kept until the graph is rescored
+    """
+    old_count = existing.get('num_comments') or 0
+    merged = dict(new_features)
+
+    for field in PROFILE_FIELDS:
+        if merged.get(field) is None:
+            merged[field] = existing.get(field)
+
+    for field in GRAPH_FIELDS:
+        merged[field] = existing.get(field)
+
+    for field in LIST_FIELDS:
+        merged[field] = _union(parse_list_field(existing.get(field)), parse_list_field(new_features.get(field)))
+
+    for field in SENTIMENT_FIELDS:
+        merged[field] = _weighted_mean(existing.get(field), old_count, new_features.get(field), new_num_comments)
+
+    total = old_count + new_num_comments
+    old_score_sum = (existing.get('avg_score') or 0) * old_count
+    merged['num_comments'] = total
+    merged['avg_score'] = (old_score_sum + new_score_sum) / total if total else 0
+    merged['max_comment_depth'] = max(_count(existing.get('conversation_depth')), _count(new_features.get('max_comment_depth')))
+    for field in CONVERSATION_COUNTS:
+        merged[field] = _count(existing.get(field)) + _count(new_features.get(field))
+    merged['subreddit_types'] = _union(
+        parse_list_field(existing.get('subreddit_types')), parse_list_field(new_features.get('subreddit_types'))
+    )
+    merged['content_ids'] = _union(parse_list_field(existing.get('content_ids')), new_features.get('content_ids', []))
+    return merged
+
+def combine_features(parts: List[Tuple[Dict[str, Any], float]]) -> Dict[str, Any]:
+    """Reduce features extracted from several chunks of one user's text into one profile
+
+    `parts` holds (features, weight) pairs, weighted by chunk size:
+    - illness_types / treatment_history: union
+    - sentiments: weighted average over chunks that report a value
+    - categorical profile fields: weighted majority vote over non-null values
+    """
+    combined = {}
+    for field in PROFILE_FIELDS:
+        votes = Counter()
+        for features, weight in parts:
+            value = features.get(field)
+            if value is not None:
+                votes[value] += weight
+        combined[field] = votes.most_common(1)[0][0] if votes else None
+
+    for field in LIST_FIELDS:
+        merged = []
+        for features, _ in parts:
+            merged = _union(merged, parse_list_field(features.get(field)))
+        combined[field] = merged
+
+    for field in SENTIMENT_FIELDS:
+        value, total_weight = None, 0
+        for features, weight in parts:
+            if features.get(field) is None:
+                continue
+            value = _weighted_mean(value, total_weight, features[field], weight)
+            total_weight += weight
+        combined[field] = value
+    return combined
+
+def summarize_profile(existing: Dict[str, Any]) -> str:
+    """Compact one-line summary of a stored profile to give the extractor prior context"""
+    parts = []
+    for field in PROFILE_FIELDS + SENTIMENT_FIELDS:
+        value = existing.get(field)
+        if value is not None and value == value:
+            parts.append(f"{field}={value}")
+    for field in LIST_FIELDS:
+        values = parse_list_field(existing.get(field))
+        if values:
+            parts.append(f"{field}={', '.join(map(str, values))}")
+    return "; ".join(parts) 
\ No newline at end of file
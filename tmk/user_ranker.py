@@ -1,35 +1,156 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+import weakref
 import pandas as pd
 import numpy as np
 from tmk.set_config import Config
+from tmk.query import LIST_COLUMNS, normalize_term
+from tmk.user import parse_list_field
+
+# Ordinal encoding of the high/medium/low levels the extractor emits
+ORDINAL_LEVELS = {'low': 0.0, 'medium': 0.5, 'high': 1.0}
+ORDINAL_COLUMNS = {'clinical_trial_interest', 'money_making_interest', 'income_level', 'education_level'}
+
+WEIGHTS_SUFFIX = '_weights'
+
+# Profile columns written to ranking reports (besides the weighted ones); leaves out content_ids
+REPORT_COLUMNS = [
+    'user_id', 'username', 'age_range', 'gender', 'location', 'income_level', 'education_level',
+    'illness_types', 'treatment_history', 'clinical_trial_interest', 'money_making_interest',
+    'clinical_trials_sentiment', 'treatment_sentiment', 'num_comments', 'avg_score'
+]
+
+
+def encode_column(df: pd.DataFrame, key: str) -> Optional[np.ndarray]:
+    """Raw float values for one weight key, or None if the column is missing
+
+    Keys are column names; list columns encode as their length, or as
+    membership of a term with 'column:term' (e.g. 'illness_types:lupus').
+    Values that cannot be encoded become NaN.
+    """
+    column, _, term = key.partition(':')
+    if column not in df.columns:
+        return None
+    values = df[column]
+
+    if column in LIST_COLUMNS:
+        lists = [v if isinstance(v, list) else parse_list_field(v) for v in values]
+        if term:
+            term = normalize_term(term)
+            return np.array([float(any(normalize_term(t) == term for t in l)) for l in lists])
+        return np.fromiter((len(l) for l in lists), dtype=float, count=len(lists))
+
+    if column in ORDINAL_COLUMNS:
+        # Map each distinct level once instead of every row
+        codes, uniques = pd.factorize(values)
+        levels = np.array([ORDINAL_LEVELS.get(normalize_term(u), np.nan) for u in uniques] + [np.nan])
+        return levels[codes]
+
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def encode_value(key: str, value) -> float:
+    """Raw float for one user's value of a weight key (scalar form of encode_column)"""
+    column, _, term = key.partition(':')
+    if column in LIST_COLUMNS:
+        items = value if isinstance(value, list) else parse_list_field(value)
+        if term:
+            return float(any(normalize_term(t) == normalize_term(term) for t in items))
+        return float(len(items))
+    if column in ORDINAL_COLUMNS:
+        return ORDINAL_LEVELS.get(normalize_term(value), np.nan)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def min_max_normalize(values: np.ndarray) -> np.ndarray:
+    """Scale to 0-1 over non-NaN values; NaN and constant columns contribute 0"""
+    if np.isnan(values).all():
+        return np.zeros(len(values))
+    min_val, max_val = np.nanmin(values), np.nanmax(values)
+    if max_val <= min_val:
+        return np.zeros(len(values))
+    return np.nan_to_num((values - min_val) / (max_val - min_val), nan=0.0)
+
+
+def top_k_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row positions of the k highest scores, best first (ties keep row order)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
 
 class UserRanker:
     def __init__(self, config: Config):
         """Initialize with config"""
         self.config = config
         self.ranking_criteria = {}  # Will be set in rank_users_by_type
-        
+        # Normalized feature matrix of the last ranked DataFrame, keyed by (weak reference, length);
+        # unlike id(), a weak reference dies with its frame, so a new frame never hits a stale entry
+        self._cache_key: Optional[Tuple[weakref.ref, int]] = None
+        self._features: Dict[str, np.ndarray] = {}
+
+    @property
+    def user_types(self) -> List[str]:
+        """User types with a '<type>_weights' section in the ranking config"""
+        return [key[:-len(WEIGHTS_SUFFIX)] for key in self.config.ranking_config if key.endswith(WEIGHTS_SUFFIX)]
+
+    def report_columns(self, user_types: List[str] = None) -> List[str]:
+        """Report columns plus every column the user types' weights read"""
+        columns = list(REPORT_COLUMNS)
+        for user_type in user_types or self.user_types:
+            for key in self.weights_for(user_type):
+                column = key.partition(':')[0]
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def weights_for(self, user_type: str) -> Dict[str, float]:
+        weights = self.config.ranking_config.get(f"{user_type}{WEIGHTS_SUFFIX}")
+        if weights is None:
+            raise ValueError(f"Unknown user type: {user_type}")
+        return weights
+
+    def invalidate(self) -> None:
+        """Drop the cached feature matrix (needed after editing a DataFrame in place)"""
+        self._cache_key = None
+        self._features = {}
+
+    def feature_matrix(self, df: pd.DataFrame, keys: List[str]) -> np.ndarray:
+        """Normalized (n_users, n_keys) matrix, encoding each column once per DataFrame"""
+        if self._cache_key is None or self._cache_key[0]() is not df or self._cache_key[1] != len(df):
+            self._cache_key = (weakref.ref(df), len(df))
+            self._features = {}
+        columns = []
+        for key in keys:
+            if key not in self._features:
+                encoded = encode_column(df, key)
+                self._features[key] = np.zeros(len(df)) if encoded is None else min_max_normalize(encoded)
+            columns.append(self._features[key])
+        return np.column_stack(columns) if columns else np.zeros((len(df), 0))
+
+    def score_matrix(self, df: pd.DataFrame, user_types: List[str] = None) -> pd.DataFrame:
+        """Scores of every user for every user type in one matrix product"""
+        user_types = user_types or self.user_types
+        weights = {user_type: self.weights_for(user_type) for user_type in user_types}
+        keys = sorted({key for w in weights.values() for key in w})
+        W = np.array([[weights[t].get(key, 0.0) for t in user_types] for key in keys]).reshape(len(keys), len(user_types))
+        scores = self.feature_matrix(df, keys) @ W
+        return pd.DataFrame(scores, index=df.index, columns=user_types)
+
     def calculate_ranking_scores(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate ranking scores for all users"""
-        # Initialize scores with zeros
-        scores = np.zeros(len(df))
-        
-        for column, weight in self.ranking_criteria.items():
-            if column in df.columns:
-                # Convert to numeric, replacing non-numeric with NaN
-                values = pd.to_numeric(df[column], errors='coerce')
-                
-                # Skip if all values are NaN
-                if values.isna().all():
-                    continue
-                    
-                # Normalize non-NaN values to 0-1 range
-                min_val = values.min()
-                max_val = values.max()
-                if max_val > min_val:
-                    normalized = (values - min_val) / (max_val - min_val)
-                    scores += normalized.fillna(0) * weight
-        
+        keys = list(self.ranking_criteria)
+        weights = np.array([self.ranking_criteria[key] for key in keys], dtype=float)
+        scores = self.feature_matrix(df, keys) @ weights
+
         # Add scores to DataFrame
         df_with_scores = df.copy()
         df_with_scores['ranking_score'] = scores.astype(float)
@@ -38,11 +159,17 @@ class UserRanker:
     def rank_users_by_type(self, df: pd.DataFrame, user_type: str) -> pd.DataFrame:
         """Rank users based on predefined user types"""
         # Get criteria from config
-        if user_type == "money_motivated":
-            self.ranking_criteria = self.config.ranking_config['money_motivated_weights']
-        elif user_type == "treatment_seeking":
-            self.ranking_criteria = self.config.ranking_config['treatment_seeking_weights']
-        else:
-            raise ValueError(f"Unknown user type: {user_type}")
-            
-        return self.calculate_ranking_scores(df)
\ No newline at end of file
+        self.ranking_criteria = self.weights_for(user_type)
+        return self.calculate_ranking_scores(df)
+
+    def top_users(self, df: pd.DataFrame, k: int, user_types: List[str] = None) -> Dict[str, pd.DataFrame]:
+        """Top-k users per user type, best first, each with its ranking_score"""
+        scores = self.score_matrix(df, user_types)
+        top = {}
+        for user_type in scores.columns:
+            type_scores = scores[user_type].to_numpy()
+            positions = top_k_positions(type_scores, k)
+            ranked = df.iloc[positions].copy()
+            ranked['ranking_score'] = type_scores[positions]
+            top[user_type] = ranked
+        return top
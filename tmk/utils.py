@@ -1,49 +1,131 @@
 import os
+import time
 from typing import Dict
-import json
 from datetime import datetime
 from tmk.set_config import Config
-from tmk.scraper import RedditScraper
-from tmk.user_ranker import UserRanker
-from tmk.database import load_db
+from tmk.metrics import METRICS
+
+# Stage dependencies (praw for scraping, pandas/numpy for ranking) are
+# imported inside each stage, so running one stage never loads the others'
 
 def setup_directories(config: Config) -> None:
     """Create necessary directories if they don't exist"""
     for dir_path in config.directories.values():
         os.makedirs(dir_path, exist_ok=True)
 
-def scrape_subreddits(config: Config) -> None:
-    """Scrape data from specified subreddits"""
-    scraper = RedditScraper(**config.reddit_config)
+@METRICS.stage('scrape')
+def scrape_subreddits(config: Config, reddit=None) -> None:
+    """Scrape data from specified subreddits
+
+    With scraping.max_workers > 1, subreddits and submissions are fetched
+    concurrently under the shared scraping.requests_per_minute budget.
+    With scraping.incremental, only posts and comments that are new or
+    changed since the previous run are fetched and written.
+    """
+    from tmk.scraper import RedditScraper
+    from tmk.scrape_state import ScrapeState
+    from tmk.raw_format import write_raw_posts
+
+    scraping_config = config.scraping_config
+    state = None
+    if scraping_config.get('incremental'):
+        state = ScrapeState(os.path.join(
+            config.directories['data'], scraping_config.get('state_file', 'scrape_state.sqlite')
+        ))
+    scraper = RedditScraper(
+        **config.reddit_config,
+        reddit=reddit,
+        requests_per_minute=scraping_config.get('requests_per_minute'),
+        state=state
+    )
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def save(subreddit: str, raw_data) -> None:
+        if not raw_data:
+            print(f"No new content in r/{subreddit}")
+            return
+        files = write_raw_posts(
+            raw_data, config.directories['raw_data'], f"{subreddit}_{timestamp}", scraping_config
+        )
+        METRICS.inc('posts_scraped_total', len(raw_data))
+        print(f"Saved {len(raw_data)} posts to {', '.join(files)}")
+
+    if scraping_config.get('max_workers', 1) > 1:
+        start = time.perf_counter()
+        _, failures = scraper.scrape_subreddits(
+            config.subreddits,
+            post_limit=scraping_config['post_limit'],
+            max_workers=scraping_config['max_workers'],
+            on_subreddit_done=save
+        )
+        print(f"Scraped {len(config.subreddits) - len(failures)}/{len(config.subreddits)} subreddits "
+              f"in {time.perf_counter() - start:.1f}s ({scraper.budget.requests} API requests)")
+        METRICS.inc('subreddits_total', len(failures), outcome='failed')
+        METRICS.inc('reddit_requests_total', scraper.budget.requests)
+        _report_scrape_state(state)
+        return
     
     for subreddit in config.subreddits:
         print(f"\nScraping r/{subreddit}...")
         raw_data = scraper.scrape_subreddit(
             subreddit, 
-            post_limit=config.scraping_config['post_limit']
+            post_limit=scraping_config['post_limit']
         )
         
         # Save raw data
-        filename = f"{config.directories['raw_data']}/{subreddit}_{timestamp}.json"
-        with open(filename, 'w') as f:
-            json.dump(raw_data, f, indent=2)
-        print(f"Saved {len(raw_data)} posts to {filename}")
+        save(subreddit, raw_data)
+        if state is not None:
+            state.commit(subreddit)
+    METRICS.inc('reddit_requests_total', scraper.budget.requests)
+    _report_scrape_state(state)
 
+def _report_scrape_state(state) -> None:
+    if state is None:
+        return
+    stats = state.stats
+    for kind in ('new', 'changed', 'unchanged'):
+        METRICS.inc('scraped_items_total', stats[kind], delta=kind)
+    print(f"Scrape delta: {stats['new']} new, {stats['changed']} changed, "
+          f"{stats['unchanged']} unchanged items ({len(state)} tracked)")
+    state.close()
+
+@METRICS.stage('rank')
 def rank_and_report(config: Config) -> None:
-    """Generate ranking reports for different user types"""
-    db_path = f"{config.directories['data']}/users.pkl"
-    df = load_db(db_path)
-    
-    ranker = UserRanker(config)
+    """Generate ranking reports for different user types
+
+    With ranking.leaderboards enabled, reports are read from the
+    incrementally maintained leaderboards in O(k); the DB is only loaded to
+    rebuild them when they are stale.
+    """
+    from tmk.user_ranker import UserRanker
+    from tmk.leaderboard import open_leaderboards
+    from tmk.database import load_db, as_frame
+    from tmk.storage import USER_COLUMNS
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    for user_type in ["money_motivated", "treatment_seeking"]:
+    top_n = config.ranking_config['top_n']
+    user_types = ["money_motivated", "treatment_seeking"]
+    ranker = UserRanker(config)
+    # Load only the weighted and reported columns, not content_ids and the like
+    columns = [c for c in ranker.report_columns(user_types) if c in USER_COLUMNS]
+
+    leaderboards = open_leaderboards(config.ranking_config, config.directories['data'])
+    if leaderboards is not None:
+        if leaderboards.is_stale(k=top_n):
+            print("Rebuilding leaderboards from the user DB...")
+            leaderboards.rebuild(as_frame(load_db(config.db_path, columns=columns)))
+            leaderboards.save()
+        top_users_by_type = {user_type: leaderboards.top(user_type, top_n) for user_type in user_types}
+    else:
+        df = as_frame(load_db(config.db_path, columns=columns))
+        # Score every user type in one pass over the cached feature matrix
+        top_users_by_type = ranker.top_users(df, top_n, user_types)
+
+    for user_type, top_users in top_users_by_type.items():
         print(f"\nGenerating report for {user_type} users...")
-        ranked_df = ranker.rank_users_by_type(df, user_type)
-        top_users = ranked_df.nlargest(config.ranking_config['top_n'], 'ranking_score')
-        
         report_path = f"{config.directories['data']}/{user_type}_report_{timestamp}.csv"
+        # Leaderboard records kept from upserts carry every column; report the same ones either way
+        top_users = top_users[[c for c in columns + ['ranking_score'] if c in top_users]]
         top_users.to_csv(report_path, index=False)
-        print(f"Saved top {config.ranking_config['top_n']} {user_type} users to {report_path}") 
\ No newline at end of file
+        print(f"Saved top {top_n} {user_type} users to {report_path}")
@@ -1,24 +1,108 @@
-from typing import Dict, Any, List, Tuple
-from openai import OpenAI
+from typing import Dict, Any, List, Tuple, Optional, Callable
+import asyncio
 import json
+import zlib
+from tmk.llm_engine import LLMEngine
+from tmk.user import parse_list_field, LIST_FIELDS
+
+def _is_null(value: Any) -> bool:
+    return value is None or value == [] or value == ''
+
+def _same_value(field: str, new: Any, old: Any) -> bool:
+    if field in LIST_FIELDS:
+        return {str(v).strip().lower() for v in parse_list_field(new)} <= \
+               {str(v).strip().lower() for v in parse_list_field(old)}
+    return new == old
+
+class ValidationPolicy:
+    """Decides which users and which of their fields get a validation call
+
+    Configured by the `validation` config section:
+    - skip_null: skip users whose extracted fields are all null/empty
+    - fields: 'all', 'non_null' (only fields with a value) or 'changed'
+      (only values that differ from the stored profile)
+    - sample_rate: validate this fraction of the remaining users, chosen
+      deterministically per user
+    - top_n_only: validate only users whose provisional record would enter
+      a ranked top-N leaderboard (needs `candidate_filter`)
+    Without a config section every field of every user is validated.
+    """
+
+    def __init__(self, validation_config: Dict[str, Any] = None):
+        validation_config = validation_config or {}
+        self.skip_null = validation_config.get('skip_null', False)
+        self.fields = validation_config.get('fields', 'all')
+        if self.fields not in ('all', 'non_null', 'changed'):
+            raise ValueError(f"Unknown validation.fields: {self.fields}")
+        self.sample_rate = validation_config.get('sample_rate', 1.0)
+        self.top_n_only = validation_config.get('top_n_only', False)
+        # Set by the processor when top_n_only is on: (username, features) -> may rank in the top N
+        self.candidate_filter: Optional[Callable[[str, Dict[str, Any]], bool]] = None
+        self.stats = {
+            'users': 0, 'validated': 0, 'skipped': 0,
+            'fields_sent': 0, 'fields_invalid': 0, 'users_disagreed': 0,
+        }
+
+    def _sampled(self, username: str) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        return zlib.crc32(username.encode('utf-8')) / 2 ** 32 < self.sample_rate
+
+    def select(
+        self,
+        username: str,
+        features: Dict[str, Any],
+        previous: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The subset of features to validate, or None to accept them unvalidated"""
+        self.stats['users'] += 1
+        selected = features
+        if self.fields == 'non_null' or (self.fields == 'changed' and previous is None):
+            selected = {k: v for k, v in features.items() if not _is_null(v)}
+        elif self.fields == 'changed':
+            selected = {
+                k: v for k, v in features.items()
+                if not _is_null(v) and not _same_value(k, v, previous.get(k))
+            }
+
+        skip = (
+            (self.skip_null and all(_is_null(v) for v in features.values()))
+            or not selected
+            or not self._sampled(username)
+            or (self.top_n_only and self.candidate_filter is not None
+                and not self.candidate_filter(username, features))
+        )
+        if skip:
+            self.stats['skipped'] += 1
+            return None
+        self.stats['validated'] += 1
+        self.stats['fields_sent'] += len(selected)
+        return selected
+
+    def record(self, selected: Dict[str, Any], validated: Dict[str, Any]) -> None:
+        """Count fields the validator rejected or corrected"""
+        invalid = sum(validated.get(k) != v for k, v in selected.items())
+        self.stats['fields_invalid'] += invalid
+        self.stats['users_disagreed'] += invalid > 0
+
+    def report(self) -> str:
+        stats = self.stats
+        users, validated = stats['users'], stats['validated']
+        return (f"validated {validated}/{users} users ({validated / users if users else 0:.0%}), "
+                f"disagreement {stats['users_disagreed'] / validated if validated else 0:.0%} of users, "
+                f"{stats['fields_invalid'] / stats['fields_sent'] if stats['fields_sent'] else 0:.0%} of fields")
 
 class FeatureValidator:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], engine: LLMEngine = None):
         """Initialize with OpenAI configuration"""
         self.openai_config = config['openai']
-        self.gpt_client = OpenAI(api_key=self.openai_config['api_key'])
-        self.model = self.openai_config.get('model', 'gpt-4o-mini')
-        self.temperature = self.openai_config.get('temperature', 0.1)
+        self.engine = engine or LLMEngine(self.openai_config)
+        self.model = self.engine.model
+        self.temperature = self.engine.temperature
+        self.policy = ValidationPolicy(config.get('validation'))
 
-    def validate_features(self, text: str, features: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
-        """
-        Validate extracted features against original text
-        
-        Returns:
-            Tuple[bool, Dict]: (is_valid, validated_features)
-            - is_valid: True if features are mostly valid
-            - validated_features: Features with invalid ones removed/corrected
-        """
+    def _build_messages(self, text: str, features: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Build the chat messages for a single validation request"""
         prompt = f"""
         Analyze if the extracted features are supported by the original text.
         
@@ -57,25 +141,158 @@ class FeatureValidator:
         }}
         """
 
+        return [
+            {"role": "system", "content": "You are a critical validator focused on "
+             "identifying unsupported claims and hallucinations in extracted features."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _build_batch_messages(self, items: Dict[str, Tuple[str, Dict[str, Any]]]) -> List[Dict[str, str]]:
+        """Build the chat messages for a multi-user validation request keyed by user ID"""
+        user_sections = "\n".join(
+            f"""        ### User: {user_id}
+        Original Text: {text}
+        Extracted Features: {json.dumps(features)}
+"""
+            for user_id, (text, features) in items.items()
+        )
+        prompt = f"""
+        For each user below, analyze if the extracted features are supported by that user's original text.
+        Only use a user's own text when validating that user.
+
+        User IDs: {json.dumps(list(items))}
+
+{user_sections}
+        Return a JSON object in this exact format, with one entry for every user ID above:
+        {{
+            "users": {{
+                "<user_id>": {{
+                    "validation_results": {{
+                        "feature_name": {{
+                            "is_valid": boolean,
+                            "corrected_value": any or null,
+                            "reason": "string explanation"
+                        }}
+                    }}
+                }}
+            }}
+        }}
+        """
+
+        return [
+            {"role": "system", "content": "You are a critical validator focused on "
+             "identifying unsupported claims and hallucinations in extracted features."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def validate_features(self, text: str, features: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Validate extracted features against original text
+        
+        Returns:
+            Tuple[bool, Dict]: (is_valid, validated_features)
+            - is_valid: True if features are mostly valid
+            - validated_features: Features with invalid ones removed/corrected
+        """
         try:
-            response = self.gpt_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a critical validator focused on "
-                     "identifying unsupported claims and hallucinations in extracted features."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature,
-                response_format={"type": "json_object"}
-            )
-            
-            validation_results = json.loads(response.choices[0].message.content)
+            content = self.engine.complete(self._build_messages(text, features), operation='validate')
+            validation_results = json.loads(content)
             return self._process_validation(features, validation_results['validation_results'])
-            
         except Exception as e:
             print(f"Error in validation: {e}")
             return False, features
 
+    async def avalidate_features(
+        self,
+        text: str,
+        features: Dict[str, Any]
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Async variant of validate_features, scheduled through the shared engine
+
+        A call that fails after retries returns (False, None) rather than the
+        unvalidated features, so the user can be retried.
+        """
+        try:
+            content = await self.engine.acomplete(self._build_messages(text, features), operation='validate')
+            validation_results = json.loads(content)
+            return self._process_validation(features, validation_results['validation_results'])
+        except Exception as e:
+            print(f"Error in validation: {e}")
+            return False, None
+
+    async def avalidate_features_batch(
+        self,
+        items: Dict[str, Tuple[str, Dict[str, Any]]]
+    ) -> Dict[str, Tuple[bool, Dict[str, Any]]]:
+        """Validate several users' features in one request
+
+        Returns (is_valid, validated_features) keyed by user ID; users missing from
+        the reply are omitted so the caller can fall back to single-user calls.
+        """
+        try:
+            content = await self.engine.acomplete(self._build_batch_messages(items), operation='validate_batch')
+            users = json.loads(content).get('users', {})
+        except Exception as e:
+            print(f"Error in batched validation: {e}")
+            return {}
+
+        results = {}
+        for user_id, (_, features) in items.items():
+            entry = users.get(user_id)
+            if isinstance(entry, dict) and isinstance(entry.get('validation_results'), dict):
+                results[user_id] = self._process_validation(features, entry['validation_results'])
+        return results
+
+    async def avalidate_selected(
+        self,
+        username: str,
+        text: str,
+        features: Dict[str, Any],
+        previous: Optional[Dict[str, Any]] = None
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """Validate only what the policy selects; unselected users/fields pass through unchanged
+
+        Features are None if the validation call failed.
+        """
+        selected = self.policy.select(username, features, previous)
+        if selected is None:
+            return True, features
+        is_valid, validated = await self.avalidate_features(text, selected)
+        if validated is None:
+            return False, None
+        self.policy.record(selected, validated)
+        return is_valid, {**features, **validated}
+
+    async def avalidate_selected_batch(
+        self,
+        items: Dict[str, Tuple[str, Dict[str, Any]]],
+        previous: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Tuple[bool, Optional[Dict[str, Any]]]]:
+        """Batched avalidate_selected; users missing from the batched reply are validated singly
+
+        Users whose validation call failed get (False, None).
+        """
+        previous = previous or {}
+        results, selections = {}, {}
+        for user_id, (text, features) in items.items():
+            selected = self.policy.select(user_id, features, previous.get(user_id))
+            if selected is None:
+                results[user_id] = (True, features)
+            else:
+                selections[user_id] = (text, selected)
+        if selections:
+            validated = await self.avalidate_features_batch(selections)
+            missing = [u for u in selections if u not in validated]
+            fallback = await asyncio.gather(*(self.avalidate_features(*selections[u]) for u in missing))
+            validated.update(zip(missing, fallback))
+            for user_id, (is_valid, fields) in validated.items():
+                if fields is None:
+                    results[user_id] = (False, None)
+                    continue
+                self.policy.record(selections[user_id][1], fields)
+                results[user_id] = (is_valid, {**items[user_id][1], **fields})
+        return results
+
     def _process_validation(
         self, 
         original_features: Dict[str, Any], 
@@ -155,18 +372,12 @@ class FeatureValidator:
         """
 
         try:
-            response = self.gpt_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a detailed feature validation "
-                     "analyst providing comprehensive analysis of extraction quality."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature,
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
+            content = self.engine.complete([
+                {"role": "system", "content": "You are a detailed feature validation "
+                 "analyst providing comprehensive analysis of extraction quality."},
+                {"role": "user", "content": prompt}
+            ], operation='validation_report')
+            return json.loads(content)
             
         except Exception as e:
             print(f"Error generating validation report: {e}")